@@ -0,0 +1,101 @@
+"""
+Benchmark of the row by row cleaner (ETLTask.clean_data) against the columnar cleaner (ETLTask.clean_data_batch).
+It prints rows/s for both, tests/test_columnar_cleaner.py checks their results are the same.
+Run from the project root:
+    python -m benchmarks.clean_data_benchmark --rows 200000 --batch-size 50000
+"""
+import argparse
+import random
+import time
+from itertools import islice
+
+from db_helper import CSV_HEADER_TO_COLUMN
+from pipeline_tasks import ETLTask
+from pipeline_tasks.columnar_cleaner import ColumnarCleaner
+
+
+def generate_rows(number_of_rows, seed=0):
+    """
+    Function to generate rows like csv.DictReader rows of the loan applications file
+    :param number_of_rows: Number of rows to generate
+    :param seed: Seed for the random generator
+    :return: List of rows
+    """
+    rng = random.Random(seed)
+    rows = []
+    for index in range(number_of_rows):
+        row = {header: str(rng.randint(0, 20)) for header in CSV_HEADER_TO_COLUMN}
+        row[""] = str(index + 1)
+        row["RevolvingUtilizationOfUnsecuredLines"] = str(rng.random())
+        row["DebtRatio"] = str(rng.random() * 5)
+        row["MonthlyIncome"] = "NA" if rng.random() < 0.2 else str(rng.randint(0, 30000))
+        row["NumberOfDependents"] = "NA" if rng.random() < 0.03 else str(rng.randint(0, 5))
+        # A few rows with a broken id, these are skipped by both the cleaners
+        if rng.random() < 0.001:
+            row[""] = "id_in_wrong_format"
+        rows.append(row)
+    return rows
+
+
+def clean_row_by_row(etl_task, rows):
+    """
+    Function to clean the rows with ETLTask.clean_data
+    :param etl_task: ETLTask object
+    :param rows: List of rows
+    :return: List of cleaned rows
+    """
+    cleaned_rows = []
+    for row in rows:
+        try:
+            cleaned_rows.append(etl_task.clean_data(row))
+        except TypeError as _:
+            continue
+    return cleaned_rows
+
+
+def clean_in_batches(etl_task, rows, batch_size):
+    """
+    Function to clean the rows with ETLTask.clean_data_batch
+    :param etl_task: ETLTask object
+    :param rows: List of rows
+    :param batch_size: Number of rows cleaned together
+    :return: List of cleaned rows
+    """
+    cleaned_rows = []
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        cleaned_columns, valid_mask = etl_task.clean_data_batch(batch)
+        cleaned_rows.extend(etl_task.columnar_cleaner.to_rows(cleaned_columns, valid_mask))
+    return cleaned_rows
+
+
+def timed(function, *args):
+    """
+    Function to time a function call
+    :return: Result of the function and the seconds taken
+    """
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--batch-size", type=int, default=50000)
+    args = parser.parse_args()
+
+    _rows = generate_rows(args.rows)
+    # Cleaning doesn't need any connection, so the task is created without calling BaseTask.__init__
+    _etl_task = ETLTask.__new__(ETLTask)
+    _etl_task.columnar_cleaner = ColumnarCleaner()
+
+    row_result, row_seconds = timed(clean_row_by_row, _etl_task, _rows)
+    _, batch_seconds = timed(clean_in_batches, _etl_task, _rows, args.batch_size)
+
+    print(f"Rows: {args.rows}, valid rows: {len(row_result)}")
+    print(f"Row by row cleaner: {args.rows / row_seconds:,.0f} rows/s")
+    print(f"Columnar cleaner  : {args.rows / batch_seconds:,.0f} rows/s (batch size {args.batch_size})")
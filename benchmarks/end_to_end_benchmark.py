@@ -0,0 +1,281 @@
+"""
+End to end benchmark of the Scanner and the ETL, without AWS and MySQL.
+1. Synthetic loan applications CSV files are written in a local directory served by local_s3.LocalS3Client.
+2. ScannerTask creates the jobs and ETLTask loads them, with local databases (SQLite files by default).
+3. It reports rows/s, the peak RSS, the per-stage latency of the metrics recorder and the per-job latency,
+   and appends the results to a JSON lines file with the git revision, to compare them between revisions.
+The streaming and pipelined loads use MySQL staging tables, for them pass MySQL urls of empty local databases.
+Run from the project root:
+    python -m benchmarks.end_to_end_benchmark --files 20 --rows-per-file 50000 --etl CLEANING_BATCH_SIZE=50000
+    python -m benchmarks.end_to_end_benchmark --compare
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, fields
+from datetime import datetime as dt
+
+import sqlalchemy as db
+from sqlalchemy.orm import sessionmaker
+
+import constants
+import metrics
+from config_data_classes import ETLConfig
+from db_helper import ETLMetadataDatabaseConnector, ReportingDatabaseConnector, ScannerTable, LoanApplicationsTable
+from local_s3 import LocalS3Client
+from pipeline_tasks import ETLTask, ScannerTask
+from pipeline_tasks.columnar_cleaner import ColumnarCleaner
+from s3_helper import S3Helper
+from benchmarks.synthetic_loan_data import write_csv_files
+
+BUCKET = "credit-risk-data"
+DEFAULT_RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "end_to_end.jsonl")
+
+
+def connector_from_url(connector_class, url):
+    """
+    Function to create a database connector on any SQLAlchemy url, without calling its __init__
+    :param connector_class: ETLMetadataDatabaseConnector or ReportingDatabaseConnector
+    :param url: SQLAlchemy url, e.g. sqlite:////tmp/benchmark/raw_data.db
+    :return: Connector object
+    """
+    connector = connector_class.__new__(connector_class)
+    connector.engine = db.create_engine(url)
+    connector.Session = sessionmaker(connector.engine)
+    if connector_class is ReportingDatabaseConnector:
+        connector.partitioned_until = None
+    return connector
+
+
+def etl_config_from_args(overrides):
+    """
+    Function to create the ETLConfig of the benchmark, with the defaults of the dataclass
+    :param overrides: List of "NAME=VALUE" strings, e.g. ["CLEANING_BATCH_SIZE=50000", "LOAD_STRATEGY=EXECUTEMANY"]
+    :return: ETLConfig
+    """
+    field_types = {field.name: field.type for field in fields(ETLConfig)}
+    values = {"JOB_SIZE_IN_BYTES": 10485760, "LOAD_STRATEGY": "EXECUTEMANY"}
+    for override in overrides:
+        name, value = override.split("=", 1)
+        if name not in field_types:
+            raise Exception(f"Unknown ETL setting: {name}")
+        if field_types[name] is bool:
+            values[name] = value.lower() in ("1", "true", "yes")
+        elif value == "":
+            values[name] = None
+        else:
+            values[name] = field_types[name](value)
+    return ETLConfig(**values)
+
+
+def peak_rss_in_bytes():
+    """
+    Function to get the peak resident set size of the process
+    :return: Bytes
+    """
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def git_revision():
+    """
+    Function to get the git revision of the project, with a -dirty suffix for uncommitted changes
+    :return: Revision string, None outside of a git repository
+    """
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(values, fraction):
+    """
+    Function to get a percentile of a list of values, by the nearest rank
+    :param values: List of numbers
+    :param fraction: Percentile between 0 and 1
+    :return: Value, None for an empty list
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+def run_benchmark(work_dir, args, etl_config: ETLConfig):
+    """
+    Function to generate the files, run the Scanner and the ETL, and measure them
+    :param work_dir: Directory of the files and of the SQLite databases
+    :param args: Arguments of the command line
+    :param etl_config: ETLConfig of the tasks
+    :return: Dictionary of results
+    """
+    root_dir = os.path.join(work_dir, "s3")
+    keys, input_size_in_bytes = write_csv_files(root_dir, BUCKET, args.files, args.rows_per_file,
+                                                hours=args.hours, compress=args.gzip, seed=args.seed)
+    first_hour = dt.strptime(min(key[:13] for key in keys), "%Y/%m/%d/%H").replace(tzinfo=constants.TZ)
+
+    etl_db = connector_from_url(ETLMetadataDatabaseConnector,
+                                args.metadata_db_url or f"sqlite:///{os.path.join(work_dir, 'metadata.db')}")
+    reporting_db = connector_from_url(ReportingDatabaseConnector,
+                                      args.reporting_db_url or f"sqlite:///{os.path.join(work_dir, 'raw_data.db')}")
+    etl_db.setup_database()
+    reporting_db.setup_database()
+    # The Scanner starts from the first generated hour instead of constants.MINIMUM_TIME
+    with etl_db.Session.begin() as session:
+        session.query(ScannerTable).update({ScannerTable.latest_file_modified_time: first_hour})
+
+    # The tasks are created without calling BaseTask.__init__, which connects to MySQL and S3 from the configs
+    s3_client = LocalS3Client(root_dir)
+    scanner_task = ScannerTask.__new__(ScannerTask)
+    scanner_task.etl_db = etl_db
+    scanner_task.s3_helper = S3Helper(BUCKET, None, None, s3_client=s3_client)
+    scanner_task.etl_config = etl_config
+
+    etl_task = ETLTask.__new__(ETLTask)
+    etl_task.etl_db = etl_db
+    etl_task.reporting_db = reporting_db
+    etl_task.s3_helper = S3Helper(BUCKET, None, None, s3_client=s3_client)
+    etl_task.etl_config = etl_config
+    etl_task.columnar_cleaner = ColumnarCleaner()
+    etl_task.recorder = metrics.MetricsRecorder()
+
+    rss_before_run = peak_rss_in_bytes()
+    start_time = time.perf_counter()
+    scanner_task.run()
+    scan_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    etl_task.run()
+    etl_seconds = time.perf_counter() - start_time
+
+    with etl_db.Session.begin() as session:
+        jobs_by_status = dict(
+            session.query(ScannerTable.status, db.func.count(ScannerTable.id))
+            .filter(ScannerTable.files != "DUMMY_FILE")
+            .group_by(ScannerTable.status)
+            .all()
+        )
+    with reporting_db.Session.begin() as session:
+        loaded_rows = session.query(db.func.count(LoanApplicationsTable.id)).scalar()
+    job_seconds = [job_metric.processing_seconds
+                   for job_metric in etl_db.get_recent_job_metrics(number_of_jobs=sum(jobs_by_status.values()))]
+
+    input_rows = args.files * args.rows_per_file
+    return {
+        "input_rows": input_rows,
+        "input_size_in_bytes": input_size_in_bytes,
+        "loaded_rows": loaded_rows,
+        "jobs": {str(getattr(status, "value", status)): count for status, count in jobs_by_status.items()},
+        "scan_seconds": scan_seconds,
+        "etl_seconds": etl_seconds,
+        "rows_per_second": input_rows / (scan_seconds + etl_seconds),
+        "etl_rows_per_second": input_rows / etl_seconds if etl_seconds else None,
+        "rss_before_run_in_bytes": rss_before_run,
+        "peak_rss_in_bytes": peak_rss_in_bytes(),
+        "job_seconds_p50": percentile(job_seconds, 0.5),
+        "job_seconds_p95": percentile(job_seconds, 0.95),
+        "stages": {f"{task_name}.{stage_name}": {"seconds": stage_metrics.seconds,
+                                                  "calls": stage_metrics.calls,
+                                                  "ms_per_call": (1000 * stage_metrics.seconds / stage_metrics.calls
+                                                                  if stage_metrics.calls else None),
+                                                  "bytes": stage_metrics.bytes,
+                                                  "rows": stage_metrics.rows}
+                   for (task_name, stage_name), stage_metrics in sorted(metrics.EXPORTER.stages.items())},
+    }
+
+
+def print_results(result):
+    """
+    Function to print the results of a run
+    :param result: Dictionary stored in the results file
+    :return: None
+    """
+    results = result["results"]
+    parameters = {name: value for name, value in result["parameters"].items() if name != "etl_config"}
+    print(f"Revision: {result['revision']}, parameters: {parameters}, ETL settings: {result['etl_settings']}")
+    print(f"Rows: {results['input_rows']}, loaded: {results['loaded_rows']}, jobs: {results['jobs']}")
+    print(f"Scanner: {results['scan_seconds']:.2f} s, ETL: {results['etl_seconds']:.2f} s, "
+          f"{results['rows_per_second']:,.0f} rows/s end to end, {results['etl_rows_per_second']:,.0f} rows/s ETL")
+    print(f"Peak RSS: {results['peak_rss_in_bytes'] / 2 ** 20:.1f} MB "
+          f"({results['rss_before_run_in_bytes'] / 2 ** 20:.1f} MB before the run)")
+    print(f"Job latency: p50 {results['job_seconds_p50']} s, p95 {results['job_seconds_p95']} s")
+    for stage_name, stage in results["stages"].items():
+        print(f"  {stage_name:<20} {stage['seconds']:>9.3f} s {stage['calls']:>10} calls "
+              f"{stage['ms_per_call'] or 0:>10.4f} ms/call {stage['rows']:>10} rows {stage['bytes']:>12} bytes")
+
+
+def compare_results(results_file, parameters=None, last=10):
+    """
+    Function to print the last results of the same parameters side by side, to compare the revisions
+    :param results_file: JSON lines file of the results
+    :param parameters: Parameters to compare, None for the parameters of the last result
+    :param last: Number of results to print
+    :return: None
+    """
+    with open(results_file) as file:
+        results = [json.loads(line) for line in file if line.strip()]
+    if not results:
+        return
+    parameters = parameters or results[-1]["parameters"]
+    results = [result for result in results if result["parameters"] == parameters][-last:]
+
+    print(f"{'time':<20} {'revision':<20} {'rows/s':>10} {'etl rows/s':>10} {'peak rss MB':>11} {'job p95 s':>9}")
+    for result in results:
+        stats = result["results"]
+        print(f"{result['time']:<20} {str(result['revision']):<20} {stats['rows_per_second']:>10,.0f} "
+              f"{stats['etl_rows_per_second'] or 0:>10,.0f} {stats['peak_rss_in_bytes'] / 2 ** 20:>11.1f} "
+              f"{stats['job_seconds_p95'] or 0:>9.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--rows-per-file", type=int, default=20000)
+    parser.add_argument("--hours", type=int, default=1, help="Hourly prefixes the files are spread over")
+    parser.add_argument("--gzip", action="store_true", help="Gzip the files")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--etl", action="append", default=[], metavar="NAME=VALUE",
+                        help="ETLConfig setting, e.g. --etl CLEANING_BATCH_SIZE=50000, can be repeated")
+    parser.add_argument("--metadata-db-url", help="SQLAlchemy url of an empty metadata database, SQLite if not set")
+    parser.add_argument("--reporting-db-url", help="SQLAlchemy url of an empty reporting database, SQLite if not set")
+    parser.add_argument("--work-dir", help="Directory of the files and databases, a temporary directory if not set")
+    parser.add_argument("--results-file", default=DEFAULT_RESULTS_FILE)
+    parser.add_argument("--compare", action="store_true", help="Only compare the stored results")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_results(args.results_file)
+        sys.exit(0)
+
+    _etl_config = etl_config_from_args(args.etl)
+    _work_dir = args.work_dir or tempfile.mkdtemp(prefix="etl-benchmark-")
+    try:
+        _result = {
+            "time": dt.now(tz=constants.TZ).strftime("%Y-%m-%d %H:%M:%S"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "parameters": {"files": args.files, "rows_per_file": args.rows_per_file, "hours": args.hours,
+                           "gzip": args.gzip, "seed": args.seed,
+                           "database": "mysql" if args.reporting_db_url else "sqlite",
+                           "etl_config": asdict(_etl_config)},
+            "etl_settings": args.etl,
+            "results": run_benchmark(_work_dir, args, _etl_config),
+        }
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(_work_dir, ignore_errors=True)
+
+    print_results(_result)
+    os.makedirs(os.path.dirname(os.path.abspath(args.results_file)), exist_ok=True)
+    with open(args.results_file, "a") as _file:
+        _file.write(json.dumps(_result) + "\n")
+    compare_results(args.results_file, parameters=_result["parameters"])
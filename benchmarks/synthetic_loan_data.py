@@ -0,0 +1,143 @@
+"""
+Generator of synthetic loan applications CSV files, with the schema of LoanApplicationsTable.
+The distributions follow the sample data of the assignment: about 20% NA MonthlyIncome, 2.6% NA NumberOfDependents,
+the 96/98 codes of the past due columns, huge DebtRatio when MonthlyIncome is NA and a few outliers in every column.
+The files are written in hourly prefixes (yyyy/mm/dd/HH/fileNNNNN.csv) of a bucket directory,
+which local_s3.LocalS3Client serves as S3.
+Run from the project root:
+    python -m benchmarks.synthetic_loan_data --root-dir /tmp/s3 --files 20 --rows-per-file 50000
+"""
+import argparse
+import csv
+import gzip
+import io
+import os
+import random
+from datetime import datetime as dt
+from datetime import timedelta as td
+
+import constants
+from db_helper import CSV_HEADER_TO_COLUMN
+
+# Rate of the rows with an id in a wrong format, they are skipped by the ETL
+BROKEN_ID_RATE = 0.001
+# Rate of the outliers of every numeric column
+OUTLIER_RATE = 0.002
+
+
+def _past_due(rng, mean):
+    """
+    Function to generate a past due count, mostly 0, with the 96/98 codes of the source data
+    :param rng: random.Random
+    :param mean: Mean of the count
+    :return: Integer
+    """
+    if rng.random() < OUTLIER_RATE:
+        return rng.choice((96, 98))
+    return 0 if rng.random() > mean else rng.randint(1, 5)
+
+
+def generate_row(rng, row_id):
+    """
+    Function to generate a row like a csv.DictReader row of the loan applications file
+    :param rng: random.Random
+    :param row_id: Id of the row
+    :return: Dictionary of CSV header to string value
+    """
+    monthly_income = None
+    if rng.random() >= 0.198:
+        monthly_income = int(rng.lognormvariate(8.6, 0.7))
+        if rng.random() < OUTLIER_RATE:
+            monthly_income = rng.randint(100000, 3000000)
+
+    debt_ratio = rng.betavariate(1.5, 3.5)
+    if monthly_income is None:
+        # The source data has the debt instead of the ratio when the income is missing
+        debt_ratio = rng.lognormvariate(6.5, 1.5)
+    elif rng.random() < OUTLIER_RATE:
+        debt_ratio = rng.uniform(10, 5000)
+
+    revolving_utilization = rng.betavariate(0.6, 1.4)
+    if rng.random() < OUTLIER_RATE:
+        revolving_utilization = rng.uniform(1, 50000)
+
+    age = min(max(int(rng.gauss(52, 15)), 21), 103)
+    if rng.random() < OUTLIER_RATE / 10:
+        age = rng.randint(0, 17)
+
+    number_of_dependents = None
+    if rng.random() >= 0.026:
+        number_of_dependents = min(int(rng.expovariate(1.3)), 20)
+
+    row = {
+        "": str(row_id),
+        "SeriousDlqin2yrs": "1" if rng.random() < 0.067 else "0",
+        "RevolvingUtilizationOfUnsecuredLines": repr(revolving_utilization),
+        "age": str(age),
+        "NumberOfTime30-59DaysPastDueNotWorse": str(_past_due(rng, 0.16)),
+        "DebtRatio": repr(debt_ratio),
+        "MonthlyIncome": "NA" if monthly_income is None else str(monthly_income),
+        "NumberOfOpenCreditLinesAndLoans": str(min(int(rng.gammavariate(2.5, 3.4)), 58)),
+        "NumberOfTimes90DaysLate": str(_past_due(rng, 0.06)),
+        "NumberRealEstateLoansOrLines": str(min(int(rng.expovariate(1.0)), 54)),
+        "NumberOfTime60-89DaysPastDueNotWorse": str(_past_due(rng, 0.05)),
+        "NumberOfDependents": "NA" if number_of_dependents is None else str(number_of_dependents),
+    }
+    if rng.random() < BROKEN_ID_RATE:
+        row[""] = "id_in_wrong_format"
+    return row
+
+
+def write_csv_files(root_dir, bucket, number_of_files, rows_per_file, hours=1, compress=False, seed=0):
+    """
+    Function to write the CSV files of a benchmark in the hourly prefixes of the last hours, up to the current hour.
+    The files are spread over the hours, the ids are unique over all the files.
+    :param root_dir: Root directory of local_s3.LocalS3Client
+    :param bucket: Bucket name, a sub directory of root_dir
+    :param number_of_files: Number of files
+    :param rows_per_file: Number of rows of a file
+    :param hours: Number of hourly prefixes
+    :param compress: If True, the files are gzip compressed (.csv.gz)
+    :param seed: Seed for the random generator, the same seed generates the same files
+    :return: List of keys of the files and their total size in bytes
+    """
+    rng = random.Random(seed)
+    current_hour = dt.now(tz=constants.TZ).replace(minute=0, second=0, microsecond=0)
+    hours = max(hours, 1)
+
+    keys, total_size_in_bytes = [], 0
+    for file_index in range(number_of_files):
+        hour = current_hour - td(hours=hours - 1 - file_index * hours // max(number_of_files, 1))
+        key = f"{hour:%Y/%m/%d/%H}/file{file_index:05d}.csv" + (".gz" if compress else "")
+        path = os.path.join(root_dir, bucket, *key.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with (gzip.open(path, "wb") if compress else open(path, "wb")) as file:
+            text_file = io.TextIOWrapper(file, encoding="utf-8", newline="")
+            writer = csv.DictWriter(text_file, fieldnames=list(CSV_HEADER_TO_COLUMN))
+            writer.writeheader()
+            first_id = file_index * rows_per_file + 1
+            for row_id in range(first_id, first_id + rows_per_file):
+                writer.writerow(generate_row(rng, row_id))
+            text_file.flush()
+            text_file.detach()
+
+        keys.append(key)
+        total_size_in_bytes += os.path.getsize(path)
+    return keys, total_size_in_bytes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--root-dir", required=True)
+    parser.add_argument("--bucket", default="credit-risk-data")
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--rows-per-file", type=int, default=10000)
+    parser.add_argument("--hours", type=int, default=1)
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    _keys, _size = write_csv_files(args.root_dir, args.bucket, args.files, args.rows_per_file,
+                                   hours=args.hours, compress=args.gzip, seed=args.seed)
+    print(f"Files: {len(_keys)}, rows: {len(_keys) * args.rows_per_file}, size: {_size} bytes")
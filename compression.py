@@ -0,0 +1,110 @@
+"""
+Module to handle compressed CSV files.
+The compression is detected from the extension of the key or from the magic bytes at the start
+of the file, and the file is decompressed while it is streamed.
+Supported: gzip (.gz) and zstd (.zst)
+"""
+import gzip
+import io
+
+import zstandard
+
+GZIP = "gzip"
+ZSTD = "zstd"
+
+# Extensions of the compressed files
+EXTENSIONS = {
+    ".gz": GZIP,
+    ".gzip": GZIP,
+    ".zst": ZSTD,
+    ".zstd": ZSTD,
+}
+
+# Magic bytes at the start of the compressed files
+MAGIC_BYTES = {
+    b"\x1f\x8b": GZIP,
+    b"\x28\xb5\x2f\xfd": ZSTD,
+}
+
+# Number of bytes to read to detect the compression from the magic bytes
+MAGIC_BYTES_LENGTH = max(len(magic_bytes) for magic_bytes in MAGIC_BYTES)
+
+
+def compression_from_key(key):
+    """
+    Function to detect the compression from the extension of a key or a file path
+    :param key: Key or full S3 URL of the file
+    :return: GZIP, ZSTD or None
+    """
+    for extension, compression in EXTENSIONS.items():
+        if key.lower().endswith(extension):
+            return compression
+    return None
+
+
+def compression_from_magic_bytes(head):
+    """
+    Function to detect the compression from the first bytes of a file
+    :param head: First MAGIC_BYTES_LENGTH bytes of the file
+    :return: GZIP, ZSTD or None
+    """
+    for magic_bytes, compression in MAGIC_BYTES.items():
+        if head.startswith(magic_bytes):
+            return compression
+    return None
+
+
+def estimate_uncompressed_size(key, size_in_bytes, compression_ratio):
+    """
+    Function to estimate the size of a file once decompressed, S3 only knows the compressed size
+    :param key: Key or full S3 URL of the file
+    :param size_in_bytes: Size of the file in S3
+    :param compression_ratio: Estimated uncompressed size / compressed size
+    :return: Estimated size in bytes
+    """
+    if compression_from_key(key) is None:
+        return size_in_bytes
+    return int(size_in_bytes * compression_ratio)
+
+
+class _HeadAndRestStream(io.RawIOBase):
+    """
+    Class to read the bytes consumed for the detection first, and then the rest of the stream
+    """
+    def __init__(self, head, stream):
+        self._head = head
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._head:
+            size = min(len(buffer), len(self._head))
+            buffer[:size] = self._head[:size]
+            self._head = self._head[size:]
+            return size
+
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def open_decompressed(stream, key=""):
+    """
+    Function to decompress a stream while it is read. Streams which are not compressed are returned as they are.
+    :param stream: File like object of bytes, e.g. the Body of get_object
+    :param key: Key or full S3 URL of the file, its extension is checked before the magic bytes
+    :return: File like object of the decompressed bytes
+    """
+    compression = compression_from_key(key)
+    if compression is None:
+        head = stream.read(MAGIC_BYTES_LENGTH)
+        compression = compression_from_magic_bytes(head)
+        stream = io.BufferedReader(_HeadAndRestStream(head, stream))
+
+    if compression == GZIP:
+        return gzip.GzipFile(fileobj=stream, mode="rb")
+    if compression == ZSTD:
+        return zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True)
+    return stream
@@ -8,6 +8,13 @@ class DatabaseConfig:
     HOST: str
     PORT: int
     DATABASE_NAME: str
+    # Connection pool of the engine, the connections are reused by the jobs of a process.
+    # With POOL_PRE_PING, a connection closed by the server is replaced before it is used.
+    POOL_SIZE: int = 5
+    POOL_MAX_OVERFLOW: int = 10
+    POOL_PRE_PING: bool = True
+    # Seconds after which a connection is replaced, keep it below the wait_timeout of MySQL, -1 to disable
+    POOL_RECYCLE_IN_SECOND: int = 3600
 
 
 @dataclass
@@ -15,16 +22,96 @@ class S3Config:
     BUCKET: str
     AWS_ACCESS_KEY: str
     AWS_SECRET_KEY: str
+    # If set, the buckets are served from the sub directories of this local directory instead of S3
+    LOCAL_ROOT_DIR: str = None
+    # If set, the downloaded files are cached in this local directory, keyed by their ETag
+    CACHE_DIR: str = None
+    # Maximum size of the cache, the least recently used files are evicted
+    CACHE_MAX_SIZE_IN_BYTES: int = 10737418240
+    # Event driven Scanner, the object created events of the bucket are read from this SQS queue,
+    # or from this local directory queue (s3_events.LocalEventQueue) instead
+    EVENT_QUEUE_URL: str = None
+    EVENT_QUEUE_LOCAL_DIR: str = None
 
 
 @dataclass
 class ETLConfig:
     JOB_SIZE_IN_BYTES: int
-
-
-@dataclass
-class ETLConfig:
-    JOB_SIZE_IN_BYTES: int
+    # Number of hourly prefixes listed at the same time by the Scanner
+    LIST_CONCURRENCY: int = 1
+    # If True, the Scanner keeps the last listed key of every prefix and S3 lists only the keys after it.
+    # It requires the keys of a prefix to be created in increasing order, e.g. file00001, file00002
+    USE_PREFIX_CURSORS: bool = False
+    # Estimated uncompressed size / compressed size of the gzip and zstd files, used to size the jobs
+    COMPRESSION_RATIO_ESTIMATE: float = 5.0
+    # If True, the Scanner sizes the jobs from the throughput of the last loaded jobs, so that a job takes
+    # about TARGET_JOB_DURATION_IN_SECOND, within MIN_JOB_SIZE_IN_BYTES and MAX_JOB_SIZE_IN_BYTES.
+    # JOB_SIZE_IN_BYTES is used until there are metrics.
+    ADAPTIVE_JOB_SIZE: bool = False
+    TARGET_JOB_DURATION_IN_SECOND: float = 60.0
+    MIN_JOB_SIZE_IN_BYTES: int = 1048576
+    MAX_JOB_SIZE_IN_BYTES: int = 268435456
+    # Number of the last loaded jobs from which the throughput is measured
+    ADAPTIVE_JOB_SIZE_WINDOW: int = 20
+    # Maximum number of files of a job, the Scanner also splits the uncompressed files bigger than a job
+    MAX_FILES_PER_JOB: int = 1000
+    # Number of rows cleaned together by the columnar cleaner, 0 cleans the data row by row
+    CLEANING_BATCH_SIZE: int = 0
+    # Strategy to load the rows in the Reporting database: ORM, EXECUTEMANY or LOAD_DATA_INFILE
+    LOAD_STRATEGY: str = "ORM"
+    # Number of rows sent to the Reporting database together
+    LOAD_BATCH_SIZE: int = 10000
+    # Streaming load, the rows of a job are flushed to its staging table every N rows or M bytes.
+    # If both are 0, all the rows of a job are loaded at the end.
+    STREAMING_FLUSH_ROWS: int = 0
+    STREAMING_FLUSH_BYTES: int = 0
+    # Number of files of a job downloaded ahead of the file being processed, 0 to disable
+    PREFETCH_FILES: int = 0
+    # Maximum bytes of the prefetched files held in memory, and of the downloaded files of the pipelined execution
+    PREFETCH_MAX_IN_FLIGHT_BYTES: int = 268435456
+    # Files bigger than this are read in byte ranges of this size, RANGED_READ_WORKERS at a time, 0 to disable
+    RANGED_READ_PART_SIZE_IN_BYTES: int = 0
+    RANGED_READ_WORKERS: int = 4
+    # If False, the rows of a range are processed as soon as it is read, whatever the order in the file
+    RANGED_READ_PRESERVE_ORDER: bool = True
+    # Pipelined execution, download, parse, clean and load run as stages joined by bounded queues
+    PIPELINED_EXECUTION: bool = False
+    PIPELINE_DOWNLOAD_WORKERS: int = 4
+    PIPELINE_PARSE_WORKERS: int = 1
+    PIPELINE_CLEAN_WORKERS: int = 1
+    PIPELINE_LOAD_WORKERS: int = 2
+    # Maximum items waiting for every stage. It bounds the number of items, not their bytes,
+    # the downloaded files are bounded by PREFETCH_MAX_IN_FLIGHT_BYTES
+    PIPELINE_QUEUE_SIZE: int = 4
+    # Number of jobs handled at once by the asyncio ETL (start_async_etl.py)
+    ASYNC_ETL_CONCURRENCY: int = 8
+    # Directory of the Prometheus text files of the stage metrics, e.g. the textfile directory of the node exporter
+    METRICS_TEXTFILE_DIR: str = None
+    # Port of the local HTTP endpoint serving the stage metrics on /metrics, 0 to disable
+    METRICS_HTTP_PORT: int = 0
+    # Number of jobs claimed by the ETL in one round trip, they are processed one after the other.
+    # The other workers can't take the jobs of a batch, so keep it at 1 with several ETL processes,
+    # a batch only pays off for a single claimer, like the supervisor (start_etl_supervisor.py).
+    # The jobs of a batch which aren't started when the process stops are sent back to the ETL.
+    JOB_CLAIM_BATCH_SIZE: int = 1
+    # Automatic retries of the FAILED jobs, a job is retried until it failed MAX_JOB_ATTEMPTS times, 1 to disable.
+    # The n-th retry waits RETRY_BACKOFF_IN_SECOND * RETRY_BACKOFF_MULTIPLIER ** (n - 1) after the failure,
+    # at most MAX_RETRY_BACKOFF_IN_SECOND. A streaming job resumes from its checkpoint.
+    MAX_JOB_ATTEMPTS: int = 1
+    RETRY_BACKOFF_IN_SECOND: float = 60.0
+    RETRY_BACKOFF_MULTIPLIER: float = 2.0
+    MAX_RETRY_BACKOFF_IN_SECOND: float = 3600.0
+    # Event driven Scanner, the files of the events become jobs once they reach JOB_SIZE_IN_BYTES or
+    # MAX_FILES_PER_JOB files, or once the first of them waited EVENT_BATCH_MAX_LATENCY_IN_SECOND
+    EVENT_BATCH_MAX_LATENCY_IN_SECOND: float = 60.0
+    # The prefixes are listed every EVENT_RECONCILIATION_INTERVAL_IN_SECOND, from
+    # EVENT_RECONCILIATION_LOOKBACK_IN_SECOND before the latest scanned file, for the files whose event was lost
+    EVENT_RECONCILIATION_INTERVAL_IN_SECOND: float = 1800.0
+    EVENT_RECONCILIATION_LOOKBACK_IN_SECOND: float = 7200.0
+    # If True, the cleaned rows are imputed in the same pass with the rules of eda_of_loan_applications.ipynb,
+    # into the *_imputed columns of loan_applications. The medians and modes are estimated from sketches
+    # of bounded size, persisted with every job, see pipeline_tasks/streaming_imputer.py
+    STREAMING_IMPUTATION: bool = False
 
 
 @dataclass
@@ -32,3 +119,14 @@ class PipelineSettings:
     SCANNER_CRON: str
     ETL_CRON: str
     CONSECUTIVE_EXECUTIONS_DELAY_IN_SECOND: int = 60
+    # ETL supervisor (start_etl_supervisor.py) settings
+    # Number of ETL worker processes, 0 for the number of available cores
+    ETL_WORKERS: int = 0
+    # Seconds the supervisor waits for new jobs when there are none
+    JOB_POLL_INTERVAL_IN_SECOND: int = 5
+    # Seconds between two throughput reports of the workers
+    THROUGHPUT_REPORT_INTERVAL_IN_SECOND: int = 60
+    # If True, start_etl.py and start_scanner.py build their task once and keep its connections.
+    # The ETL then polls for the jobs every JOB_POLL_INTERVAL_IN_SECOND instead of waiting for ETL_CRON,
+    # and polls again at once while there are jobs.
+    DAEMON_MODE: bool = False
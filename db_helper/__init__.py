@@ -1,3 +1,12 @@
 from .database_connector import DatabaseConnector
-from .etl_metadata_database import ETLMetadataDatabaseConnector, ScannerStatusEnum, ScannerTable
-from .reporting_database import ReportingDatabaseConnector, LoanApplicationsTable
+from .etl_metadata_database import (ETLMetadataDatabaseConnector, ScannerStatusEnum, ScannerTable,
+                                    ScannerJobFileTable, ScannerPrefixCursorTable, JobMetricsTable,
+                                    JobStageMetricsTable, JobCheckpointTable, retry_backoff_in_second)
+from .reporting_database import (ReportingDatabaseConnector, LoanApplicationsTable, LoanApplicationIdsTable,
+                                 CSV_HEADER_TO_COLUMN, BulkLoadStrategyEnum, JobLoanAggregatesTable,
+                                 HourlyLoanAggregatesTable,
+                                 JobIncomeHistogramTable, HourlyIncomeHistogramTable, median_from_histogram,
+                                 IMPUTED_COLUMNS, JobImputationSketchTable, ImputationSketchTable,
+                                 MONTHLY_INCOME_BUCKET_WIDTH, MONTHLY_INCOME_BUCKETS, MINIMUM_AGE, WORKING_AGE_LIMIT,
+                                 PAST_DUE_CODES, PAST_DUE_HEADERS, MAX_SKETCH_VALUE, AGE_SKETCH, WORKING_INCOME_SKETCH,
+                                 SENIOR_INCOME_SKETCH, DEPENDENTS_SKETCH)
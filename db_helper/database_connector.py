@@ -21,16 +21,30 @@ class DatabaseConnector:
     """
     Base Database Connector class.
     """
-    def __init__(self, db_name, host, port, user, password):
+    def __init__(self, db_name, host, port, user, password, connect_args=None,
+                 pool_size=5, max_overflow=10, pool_pre_ping=False, pool_recycle=-1):
         """
         Function to initiate the engine and session object.
+        The engine keeps a pool of connections, so a long running task connects only once.
         :param db_name: Name of the database to connect to
         :param host: Host address on which the database is
         :param port: Port for the database connection
         :param user: Username to access the database
         :param password: Password to access the database
+        :param connect_args: Extra arguments for the pymysql connection
+        :param pool_size: Number of connections kept open in the pool
+        :param max_overflow: Number of connections opened above pool_size when all of them are in use
+        :param pool_pre_ping: If True, a connection is tested before it is taken from the pool,
+                              so a connection closed by the server is replaced instead of failing the query
+        :param pool_recycle: Seconds after which a connection is replaced, -1 to never replace it.
+                             Keep it below the wait_timeout of MySQL.
         """
-        self.engine = db.create_engine(f"mysql+pymysql://{user}:{password}@{host}:{port}/{db_name}")
+        self.engine = db.create_engine(f"mysql+pymysql://{user}:{password}@{host}:{port}/{db_name}",
+                                       connect_args=connect_args or {},
+                                       pool_size=pool_size,
+                                       max_overflow=max_overflow,
+                                       pool_pre_ping=pool_pre_ping,
+                                       pool_recycle=pool_recycle)
         self.Session = sessionmaker(self.engine)
 
     def setup_database(self):
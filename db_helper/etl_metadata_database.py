@@ -3,10 +3,12 @@ This file defines a class to handle database operations of ETL Metadata database
 """
 
 import enum
+from datetime import timedelta as td
 
-from sqlalchemy import Integer, Column, VARCHAR, TIMESTAMP, Enum
+from sqlalchemy import Integer, BigInteger, Float, Column, VARCHAR, TIMESTAMP, Enum, Index, ForeignKey, or_
 from sqlalchemy import func as sqlalchemy_func
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship
 
 from .database_connector import DatabaseConnector, now_with_timezone
 
@@ -39,6 +41,14 @@ class ScannerTable(Base):
     modified_time = Column(TIMESTAMP(), default=now_with_timezone, onupdate=now_with_timezone)
     status = Column(Enum(ScannerStatusEnum), nullable=False, default=ScannerStatusEnum.SENT_FOR_ETL.value)
     failure_msg = Column(VARCHAR(10240), nullable=True, default="")
+    # Files of the job, the jobs created before the ScannerJobFileTable only have the `files` column
+    job_files = relationship("ScannerJobFileTable", order_by="ScannerJobFileTable.file_index")
+
+    # The claiming query filters on the status and orders by the time, the index serves both the filter and the sort,
+    # so the rows are locked in index order without a filesort. The rows themselves are still read.
+    __table_args__ = (
+        Index("ix_scanner_metadata_status_modified_time", "status", "latest_file_modified_time"),
+    )
 
     def __str__(self):
         return f"JobId: {self.id}, Files: {self.files}, SizeInBytes:{self.total_size_in_bytes}, Status:{self.status}"
@@ -47,18 +57,157 @@ class ScannerTable(Base):
         return f"JobId: {self.id}, Files: {self.files}, SizeInBytes:{self.total_size_in_bytes}, Status:{self.status}"
 
 
+class ScannerJobFileTable(Base):
+    """
+    Table definition of the files of every job of the Scanner Table.
+    The primary key is known before the insert, so the files of all the jobs are inserted in bulk.
+    """
+    __tablename__ = "scanner_job_files"
+    job_id = Column(Integer(), ForeignKey("scanner_metadata.id"), primary_key=True)
+    file_index = Column(Integer(), primary_key=True)
+    file_path = Column(VARCHAR(1024), nullable=False)
+    size_in_bytes = Column(BigInteger(), nullable=False)
+    etag = Column(VARCHAR(64), nullable=True)
+    # Byte range [range_start, range_end) of the file for the jobs of a split file, NULL for the whole file
+    range_start = Column(BigInteger(), nullable=True)
+    range_end = Column(BigInteger(), nullable=True)
+    status = Column(Enum(ScannerStatusEnum), nullable=False, default=ScannerStatusEnum.SENT_FOR_ETL.value)
+    modified_time = Column(TIMESTAMP(), default=now_with_timezone, onupdate=now_with_timezone)
+
+    __table_args__ = (
+        # The event driven Scanner looks up the files already in a job, a prefix of the path is selective enough
+        Index("ix_scanner_job_files_file_path", "file_path", mysql_length=255),
+    )
+
+    def __str__(self):
+        return f"JobId: {self.job_id}, File: {self.file_path}, SizeInBytes:{self.size_in_bytes}, Status:{self.status}"
+
+    def __repr__(self):
+        return f"JobId: {self.job_id}, File: {self.file_path}, SizeInBytes:{self.size_in_bytes}, Status:{self.status}"
+
+
+class JobMetricsTable(Base):
+    """
+    Table definition of the metrics of every job loaded by the ETL
+    """
+    __tablename__ = "job_metrics"
+    job_id = Column(Integer(), ForeignKey("scanner_metadata.id"), primary_key=True)
+    total_size_in_bytes = Column(BigInteger(), nullable=False)
+    loaded_rows = Column(Integer(), nullable=False)
+    skipped_rows = Column(Integer(), nullable=False, default=0)
+    processing_seconds = Column(Float(), nullable=False)
+    created_time = Column(TIMESTAMP(), default=now_with_timezone, index=True)
+
+    @property
+    def bytes_per_second(self):
+        return self.total_size_in_bytes / self.processing_seconds if self.processing_seconds else 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.loaded_rows / self.processing_seconds if self.processing_seconds else 0.0
+
+    def __str__(self):
+        return (f"JobId: {self.job_id}, SizeInBytes:{self.total_size_in_bytes}, Rows:{self.loaded_rows}, "
+                f"Seconds:{self.processing_seconds:.1f}, Rows/s:{self.rows_per_second:.1f}")
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class JobStageMetricsTable(Base):
+    """
+    Table definition of the time spent in every stage of a job loaded by the ETL,
+    e.g. get_object, parse, clean_data and insert
+    """
+    __tablename__ = "job_stage_metrics"
+    job_id = Column(Integer(), ForeignKey("scanner_metadata.id"), primary_key=True)
+    stage = Column(VARCHAR(32), primary_key=True)
+    seconds = Column(Float(), nullable=False)
+    calls = Column(Integer(), nullable=False)
+    size_in_bytes = Column(BigInteger(), nullable=False)
+    rows = Column(Integer(), nullable=False)
+
+    def __str__(self):
+        return (f"JobId: {self.job_id}, Stage: {self.stage}, Seconds:{self.seconds:.3f}, Calls:{self.calls}, "
+                f"SizeInBytes:{self.size_in_bytes}, Rows:{self.rows}")
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class JobCheckpointTable(Base):
+    """
+    Table definition of the progress of every job of the ETL, a retried job resumes from it.
+    The rows before the checkpoint are in the staging table of the job, which is kept when the job fails.
+    """
+    __tablename__ = "job_checkpoints"
+    job_id = Column(Integer(), ForeignKey("scanner_metadata.id"), primary_key=True)
+    # Index of the file of the job being loaded, the files before it are all in the staging table
+    file_index = Column(Integer(), nullable=False, default=0)
+    # Number of cleaned rows of that file already in the staging table
+    row_offset = Column(BigInteger(), nullable=False, default=0)
+    # Number of rows of the job in the staging table
+    loaded_rows = Column(BigInteger(), nullable=False, default=0)
+    # Number of failed attempts of the job, for the retries
+    failed_attempts = Column(Integer(), nullable=False, default=0)
+    modified_time = Column(TIMESTAMP(), default=now_with_timezone, onupdate=now_with_timezone)
+
+    def __str__(self):
+        return (f"JobId: {self.job_id}, FileIndex: {self.file_index}, RowOffset: {self.row_offset}, "
+                f"Rows: {self.loaded_rows}, FailedAttempts: {self.failed_attempts}")
+
+    def __repr__(self):
+        return self.__str__()
+
+
+def retry_backoff_in_second(failed_attempts, backoff_in_second, backoff_multiplier, max_backoff_in_second):
+    """
+    Function to get the time to wait after a failure before retrying a job, it grows exponentially
+    :param failed_attempts: Number of failed attempts of the job
+    :param backoff_in_second: Time to wait after the first failure
+    :param backoff_multiplier: Factor applied to the time to wait after every failure
+    :param max_backoff_in_second: Maximum time to wait
+    :return: Seconds
+    """
+    return min(backoff_in_second * backoff_multiplier ** max(failed_attempts - 1, 0), max_backoff_in_second)
+
+
+class ScannerPrefixCursorTable(Base):
+    """
+    Table definition of the key cursor of every prefix listed by the Scanner.
+    The cursor is the last key of the prefix for which a job is created,
+    the next listing of the prefix starts after it.
+    """
+    __tablename__ = "scanner_prefix_cursors"
+    prefix = Column(VARCHAR(255), primary_key=True)
+    last_key = Column(VARCHAR(1024), nullable=False)
+    modified_time = Column(TIMESTAMP(), default=now_with_timezone, onupdate=now_with_timezone)
+
+    def __str__(self):
+        return f"Prefix: {self.prefix}, LastKey: {self.last_key}"
+
+    def __repr__(self):
+        return f"Prefix: {self.prefix}, LastKey: {self.last_key}"
+
+
 class ETLMetadataDatabaseConnector(DatabaseConnector):
     """
     Class to handle ETL Metadata database related operations
     """
-    def __init__(self, db_name, host, port, user, password):
-        super().__init__(db_name, host, port, user, password)
+    def __init__(self, db_name, host, port, user, password, **pool_options):
+        """
+        :param pool_options: Options of the connection pool, see DatabaseConnector
+        """
+        super().__init__(db_name, host, port, user, password, **pool_options)
 
     def setup_database(self):
         # We can safely call this multiple times, it won't affect the schema or the data
         # in the tables.
         # If in case, we want to change the schema, first we need to migrate the data for that
         Base.metadata.create_all(self.engine)
+        # create_all doesn't add the new indexes to the existing tables
+        for index in [*ScannerTable.__table__.indexes, *ScannerJobFileTable.__table__.indexes]:
+            index.create(self.engine, checkfirst=True)
 
         # The first job is required to be added to the Scanner Task table, for the scanner to
         # pick up the latest last_modified_time
@@ -87,6 +236,64 @@ class ETLMetadataDatabaseConnector(DatabaseConnector):
             )
             return latest_last_modified_time.replace(tzinfo=constants.TZ)
 
+    def get_prefix_cursors(self, prefixes):
+        """
+        Function to fetch the key cursors of the prefixes
+        :param prefixes: List of prefixes
+        :return: Dictionary of prefix to its last key, prefixes without a cursor are not in it
+        """
+        with self.Session.begin() as session:
+            cursors = (
+                session
+                .query(ScannerPrefixCursorTable)
+                .filter(ScannerPrefixCursorTable.prefix.in_(prefixes))
+                .all()
+            )
+            return {cursor.prefix: cursor.last_key for cursor in cursors}
+
+    def create_new_jobs_with_cursors(self, new_jobs, prefix_cursors, oldest_prefix=None):
+        """
+        Function to insert the new jobs and move the key cursors of the prefixes in one transaction,
+        so a cursor never moves past files without a job
+        :param new_jobs: List of ScannerTable jobs
+        :param prefix_cursors: Dictionary of prefix to its new last key
+        :param oldest_prefix: If set, the cursors of the prefixes before it are deleted,
+                              those prefixes are never listed again
+        :return: None
+        """
+        with self.Session.begin() as session:
+            session.add_all(new_jobs)
+            for prefix, last_key in prefix_cursors.items():
+                session.merge(ScannerPrefixCursorTable(prefix=prefix, last_key=last_key))
+
+            if oldest_prefix is not None:
+                (
+                    session
+                    .query(ScannerPrefixCursorTable)
+                    .filter(ScannerPrefixCursorTable.prefix < oldest_prefix)
+                    .delete(synchronize_session=False)
+                )
+
+    def get_scanned_files(self, file_paths, chunk_size=1000):
+        """
+        Function to find the files which are already in a job
+        :param file_paths: List of full S3 paths
+        :param chunk_size: Number of paths looked up in one query
+        :return: Set of (file_path, etag) of the files already in a job, an overwritten file has a new ETag
+        """
+        scanned_files = set()
+        with self.Session.begin() as session:
+            for start in range(0, len(file_paths), chunk_size):
+                scanned_files.update(
+                    (file_path, etag or "") for file_path, etag in (
+                        session
+                        .query(ScannerJobFileTable.file_path, ScannerJobFileTable.etag)
+                        .filter(ScannerJobFileTable.file_path.in_(file_paths[start:start + chunk_size]))
+                        .distinct()
+                    )
+                )
+        return scanned_files
+
     def _change_status_of_job(self, session, job_id, new_status: ScannerStatusEnum, **kwargs):
         """
         Function to prepare a query to change the job status.
@@ -106,55 +313,232 @@ class ETLMetadataDatabaseConnector(DatabaseConnector):
             .filter(ScannerTable.id == job_id)
             .update(update_dict)
         )
+        (
+            session
+            .query(ScannerJobFileTable)
+            .filter(ScannerJobFileTable.job_id == job_id)
+            .update({ScannerJobFileTable.status: new_status.value}, synchronize_session=False)
+        )
 
-    def get_latest_etl_job(self):
+    def get_job_files(self, job_id):
         """
-        Returns the latest job with the status SENT_FOR_ETL
-        :return: ScannerTable row
+        Function to fetch the files of a job from the ScannerJobFileTable
+        :param job_id: Job Id
+        :return: List of ScannerJobFileTable rows in processing order,
+                 empty for the jobs which only have the `files` column
         """
         with self.Session.begin() as session:
-            # To prevent multiple transactions to read the same row
-            session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+            job_files = (
+                session
+                .query(ScannerJobFileTable)
+                .filter(ScannerJobFileTable.job_id == job_id)
+                .order_by(ScannerJobFileTable.file_index)
+                .all()
+            )
+            for job_file in job_files:
+                session.expunge(job_file)
+            return job_files
+
+    def claim_etl_jobs(self, number_of_jobs=1):
+        """
+        Returns the latest jobs with the status SENT_FOR_ETL, after changing their status to PROCESSING.
+        The rows locked by other transactions are skipped, so the workers claiming at the same time
+        never wait for each other and never claim the same job.
+        :param number_of_jobs: Maximum number of jobs to claim
+        :return: List of ScannerTable rows, empty if there are no jobs
+        """
+        with self.Session.begin() as session:
+            # SKIP LOCKED makes the claim safe, READ COMMITTED only avoids the gap locks of REPEATABLE READ.
+            # Local databases without it, e.g. the SQLite of the benchmarks, keep their own isolation level
+            if self.engine.dialect.name == "mysql":
+                session.connection(execution_options={'isolation_level': 'READ COMMITTED'})
 
-            # Fetching the latest job where status is SENT_FOR_ETL
-            latest_job = (
+            # Fetching the latest jobs where status is SENT_FOR_ETL
+            latest_jobs = (
                 session
                 .query(ScannerTable)
                 .where(ScannerTable.status == ScannerStatusEnum.SENT_FOR_ETL.value)
                 .order_by(ScannerTable.latest_file_modified_time)
-                .first()
+                .limit(number_of_jobs)
+                .with_for_update(skip_locked=True)
+                .all()
             )
-            if latest_job is not None:
-                # Updating its status to PROCESSING
-                self._change_status_of_job(session=session,
-                                           job_id=latest_job.id,
-                                           new_status=ScannerStatusEnum.PROCESSING)
+            if latest_jobs:
+                # Updating their status to PROCESSING
+                job_ids = [job.id for job in latest_jobs]
+                (
+                    session
+                    .query(ScannerTable)
+                    .filter(ScannerTable.id.in_(job_ids))
+                    .update({ScannerTable.status: ScannerStatusEnum.PROCESSING.value})
+                )
+                (
+                    session
+                    .query(ScannerJobFileTable)
+                    .filter(ScannerJobFileTable.job_id.in_(job_ids))
+                    .update({ScannerJobFileTable.status: ScannerStatusEnum.PROCESSING.value},
+                            synchronize_session=False)
+                )
 
                 # Once the session expires the object can expire
                 # https://stackoverflow.com/questions/15397680/detaching-sqlalchemy-instance-so-no-refresh-happens
-                session.expunge(latest_job)
-            return latest_job
+                for job in latest_jobs:
+                    session.expunge(job)
+            return latest_jobs
+
+    def get_latest_etl_job(self):
+        """
+        Returns the latest job with the status SENT_FOR_ETL
+        :return: ScannerTable row
+        """
+        latest_jobs = self.claim_etl_jobs(number_of_jobs=1)
+        return latest_jobs[0] if latest_jobs else None
+
+    def release_etl_jobs(self, job_ids):
+        """
+        Function to send claimed jobs which weren't processed back to the ETL, e.g. the rest of a batch
+        of claim_etl_jobs when the process stops. Only the jobs still PROCESSING are changed.
+        :param job_ids: Job Ids
+        :return: None
+        """
+        if not job_ids:
+            return
+        with self.Session.begin() as session:
+            (
+                session
+                .query(ScannerTable)
+                .filter(ScannerTable.id.in_(job_ids),
+                        ScannerTable.status == ScannerStatusEnum.PROCESSING.value)
+                .update({ScannerTable.status: ScannerStatusEnum.SENT_FOR_ETL.value}, synchronize_session=False)
+            )
+            (
+                session
+                .query(ScannerJobFileTable)
+                .filter(ScannerJobFileTable.job_id.in_(job_ids),
+                        ScannerJobFileTable.status == ScannerStatusEnum.PROCESSING.value)
+                .update({ScannerJobFileTable.status: ScannerStatusEnum.SENT_FOR_ETL.value},
+                        synchronize_session=False)
+            )
 
     def mark_downloading_from_s3_failed(self, job_id, err_msg):
         """
-        Function to mark an ETL job failed
+        Function to mark an ETL job failed and count its failed attempts
         :param job_id: Job Id to be mark failed
         :param err_msg: error msg to insert in the job
-        :return: None
+        :return: Number of failed attempts of the job
         """
         with self.Session.begin() as session:
             self._change_status_of_job(session=session,
                                        job_id=job_id,
                                        new_status=ScannerStatusEnum.FAILED,
                                        err_msg=err_msg)
+            checkpoint = session.get(JobCheckpointTable, job_id)
+            if checkpoint is None:
+                checkpoint = JobCheckpointTable(job_id=job_id, failed_attempts=0)
+                session.add(checkpoint)
+            checkpoint.failed_attempts += 1
+            return checkpoint.failed_attempts
 
-    def mark_downloading_from_s3_success(self, job_id):
+    def mark_downloading_from_s3_success(self, job_id, job_metrics: JobMetricsTable = None,
+                                         job_stage_metrics: [JobStageMetricsTable] = None):
         """
         Function to mark an ETL job successful
         :param job_id: Job Id to mark successful
+        :param job_metrics: If set, the metrics of the job are saved in the same transaction
+        :param job_stage_metrics: If set, the metrics of the stages of the job are saved in the same transaction
         :return: None
         """
         with self.Session.begin() as session:
             self._change_status_of_job(session=session,
                                        job_id=job_id,
                                        new_status=ScannerStatusEnum.LOADED)
+            if job_metrics is not None:
+                # A retried job replaces the metrics of its previous attempt
+                session.merge(job_metrics)
+            for stage_metrics in job_stage_metrics or []:
+                session.merge(stage_metrics)
+            # A loaded job is never resumed
+            session.query(JobCheckpointTable).filter(JobCheckpointTable.job_id == job_id).delete()
+
+    def get_job_checkpoint(self, job_id):
+        """
+        Function to fetch the checkpoint of a job
+        :param job_id: Job Id
+        :return: JobCheckpointTable row, None if the job has none
+        """
+        with self.Session.begin() as session:
+            checkpoint = session.get(JobCheckpointTable, job_id)
+            if checkpoint is not None:
+                session.expunge(checkpoint)
+            return checkpoint
+
+    def save_job_checkpoint(self, job_id, file_index, row_offset, loaded_rows):
+        """
+        Function to save the progress of a job, its failed attempts are kept
+        :param job_id: Job Id
+        :param file_index: Index of the file being loaded
+        :param row_offset: Number of cleaned rows of that file in the staging table
+        :param loaded_rows: Number of rows of the job in the staging table
+        :return: None
+        """
+        with self.Session.begin() as session:
+            checkpoint = session.get(JobCheckpointTable, job_id)
+            if checkpoint is None:
+                checkpoint = JobCheckpointTable(job_id=job_id, failed_attempts=0)
+                session.add(checkpoint)
+            checkpoint.file_index = file_index
+            checkpoint.row_offset = row_offset
+            checkpoint.loaded_rows = loaded_rows
+
+    def schedule_failed_job_retries(self, max_attempts, backoff_in_second, backoff_multiplier,
+                                    max_backoff_in_second):
+        """
+        Function to send the FAILED jobs back to the ETL, once their backoff after the last failure is over.
+        A job is retried until it failed max_attempts times.
+        :param max_attempts: Maximum number of attempts of a job, 1 to never retry
+        :param backoff_in_second: Time to wait after the first failure
+        :param backoff_multiplier: Factor applied to the time to wait after every failure
+        :param max_backoff_in_second: Maximum time to wait
+        :return: List of the retried job ids
+        """
+        if max_attempts <= 1:
+            return []
+
+        now = now_with_timezone()
+        with self.Session.begin() as session:
+            # The jobs failed before the checkpoints have no row, they count as failed once
+            failed_jobs = (
+                session
+                .query(ScannerTable.id, ScannerTable.modified_time, JobCheckpointTable.failed_attempts)
+                .outerjoin(JobCheckpointTable, JobCheckpointTable.job_id == ScannerTable.id)
+                .filter(ScannerTable.status == ScannerStatusEnum.FAILED.value)
+                .filter(or_(JobCheckpointTable.failed_attempts.is_(None),
+                            JobCheckpointTable.failed_attempts < max_attempts))
+                .with_for_update(skip_locked=True, of=ScannerTable)
+                .all()
+            )
+            job_ids = [job_id for job_id, failed_time, failed_attempts in failed_jobs
+                       if failed_time.replace(tzinfo=constants.TZ)
+                       + td(seconds=retry_backoff_in_second(failed_attempts or 1, backoff_in_second,
+                                                            backoff_multiplier, max_backoff_in_second)) <= now]
+            for job_id in job_ids:
+                self._change_status_of_job(session=session, job_id=job_id, new_status=ScannerStatusEnum.SENT_FOR_ETL)
+            return job_ids
+
+    def get_recent_job_metrics(self, number_of_jobs):
+        """
+        Function to fetch the metrics of the last loaded jobs
+        :param number_of_jobs: Maximum number of jobs
+        :return: List of JobMetricsTable rows, the latest first
+        """
+        with self.Session.begin() as session:
+            job_metrics = (
+                session
+                .query(JobMetricsTable)
+                .order_by(JobMetricsTable.created_time.desc())
+                .limit(number_of_jobs)
+                .all()
+            )
+            for job_metric in job_metrics:
+                session.expunge(job_metric)
+            return job_metrics
@@ -1,10 +1,22 @@
 """
 This file defines a class to handle database operations of Reporting database
 """
-from sqlalchemy import Integer, Column, Float
+import enum
+import tempfile
+from datetime import datetime as dt
+from datetime import timedelta as td
+from itertools import islice
+
+from sqlalchemy import (Integer, BigInteger, Column, Float, VARCHAR, DateTime, MetaData, PrimaryKeyConstraint, Table,
+                        text, table, column, inspect, select, delete, case, literal, func, true, union_all,
+                        and_, tuple_)
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
 
 from .database_connector import DatabaseConnector
+import constants
 
 
 Base = declarative_base()
@@ -15,7 +27,8 @@ class LoanApplicationsTable(Base):
     Table definition of Loan Application class
     """
     __tablename__ = "loan_applications"
-    id = Column(Integer(), primary_key=True, autoincrement=True)
+    # The ids come from the files, the tables created before ingest_hour keep their AUTO_INCREMENT
+    id = Column(Integer(), primary_key=True, autoincrement=False)
     serious_dlqin_2_yrs = Column(Integer())
     revolving_utilization_of_unsecured_lines = Column(Float())
     age = Column(Integer())
@@ -27,17 +40,947 @@ class LoanApplicationsTable(Base):
     number_real_estate_loans_or_lines = Column(Integer())
     number_of_times_60_89_days_past_due_not_worse = Column(Integer())
     number_of_dependents = Column(Integer)
+    # Hour of the latest file of the job which loaded the row, in UTC.
+    # On MySQL, the table is partitioned by this hour, and the primary key of a partitioned table must include it.
+    # The ids are still unique, see LoanApplicationIdsTable and
+    # ReportingDatabaseConnector.merge_staging_table_statements
+    ingest_hour = Column(DateTime(), primary_key=True, default=lambda: ReportingDatabaseConnector.ingest_hour())
+    # Id of the job which loaded the row last
+    source_job = Column(Integer(), nullable=True)
+    # Imputed variants of the raw columns, set by the streaming imputation of the ETL (STREAMING_IMPUTATION)
+    age_imputed = Column(Integer(), nullable=True)
+    number_of_time_30_59_days_past_due_not_worse_imputed = Column(Integer(), nullable=True)
+    monthly_income_imputed = Column(Integer(), nullable=True)
+    number_of_time_90_days_late_imputed = Column(Integer(), nullable=True)
+    number_of_times_60_89_days_past_due_not_worse_imputed = Column(Integer(), nullable=True)
+    number_of_dependents_imputed = Column(Integer(), nullable=True)
+
+
+# Mapping of the CSV headers to the columns of LoanApplicationsTable.
+# The first column of the CSV file has an empty header and holds the id of the row.
+CSV_HEADER_TO_COLUMN = {
+    "": "id",
+    "SeriousDlqin2yrs": "serious_dlqin_2_yrs",
+    "RevolvingUtilizationOfUnsecuredLines": "revolving_utilization_of_unsecured_lines",
+    "age": "age",
+    "NumberOfTime30-59DaysPastDueNotWorse": "number_of_time_30_59_days_past_due_not_worse",
+    "DebtRatio": "debt_ratio",
+    "MonthlyIncome": "monthly_income",
+    "NumberOfOpenCreditLinesAndLoans": "number_of_open_credit_lines_and_loans",
+    "NumberOfTimes90DaysLate": "number_of_time_90_days_late",
+    "NumberRealEstateLoansOrLines": "number_real_estate_loans_or_lines",
+    "NumberOfTime60-89DaysPastDueNotWorse": "number_of_times_60_89_days_past_due_not_worse",
+    "NumberOfDependents": "number_of_dependents",
+}
+# Mapping of the CSV headers of the imputed columns to their imputed variant in LoanApplicationsTable
+IMPUTED_COLUMNS = {
+    header: f"{CSV_HEADER_TO_COLUMN[header]}_imputed"
+    for header in ("age", "NumberOfTime30-59DaysPastDueNotWorse", "MonthlyIncome", "NumberOfTimes90DaysLate",
+                   "NumberOfTime60-89DaysPastDueNotWorse", "NumberOfDependents")
+}
+# Columns of loan_applications loaded by the ETL, the columns of the CSV files and their imputed variants.
+# The staging tables have only these columns.
+LOADED_COLUMNS = list(CSV_HEADER_TO_COLUMN.values()) + list(IMPUTED_COLUMNS.values())
+
+
+# Age bands of the reporting aggregates, lower bound of the age and name of the band.
+# The ages below 18 are data errors of the source, e.g. the age 0.
+AGE_BANDS = ((0, "0-17"), (18, "18-29"), (30, "30-39"), (40, "40-49"), (50, "50-59"), (60, "60-69"), (70, "70+"))
+UNKNOWN_AGE_BAND = "unknown"
+
+# The MonthlyIncome of the aggregates is a histogram of buckets of MONTHLY_INCOME_BUCKET_WIDTH.
+# The bucket MONTHLY_INCOME_BUCKETS holds all the higher incomes.
+MONTHLY_INCOME_BUCKET_WIDTH = 250
+MONTHLY_INCOME_BUCKETS = 200
+
+# The imputation sketches count the rows of every value, with the rules of pipeline_tasks.streaming_imputer.
+# The minimum age to get a loan, the ages below are data errors
+MINIMUM_AGE = 18
+# The ages above are the senior population, see the MonthlyIncome section of the notebook
+WORKING_AGE_LIMIT = 64
+# Codes of the past due columns which can't be a number of times in 2 years
+PAST_DUE_CODES = (96, 98)
+# The integer values above are counted as MAX_SKETCH_VALUE, it bounds the size of the sketches
+MAX_SKETCH_VALUE = 150
+PAST_DUE_HEADERS = ("NumberOfTime30-59DaysPastDueNotWorse", "NumberOfTimes90DaysLate",
+                    "NumberOfTime60-89DaysPastDueNotWorse")
+# Names of the sketches, the sketches of the past due columns are named after their column
+AGE_SKETCH = "age"
+WORKING_INCOME_SKETCH = "monthly_income_working"
+SENIOR_INCOME_SKETCH = "monthly_income_senior"
+DEPENDENTS_SKETCH = "number_of_dependents"
+
+
+class LoanApplicationIdsTable(Base):
+    """
+    Table definition of the ingest hour of every id of loan_applications. It isn't partitioned, the merge looks up
+    the ingest hours of its ids in it and finds the rows it replaces by id and ingest hour,
+    so MySQL reads only their partitions instead of probing every hourly partition.
+    """
+    __tablename__ = "loan_application_ids"
+    id = Column(Integer(), primary_key=True, autoincrement=False)
+    # Ingest hour of the row of the id in loan_applications
+    ingest_hour = Column(DateTime(), nullable=False, index=True)
+
+
+class LoanAggregatesMixin:
+    """
+    Partial aggregates of the loan applications of an age band.
+    The partials are mergeable, the aggregates of several jobs or hours are the sums of their columns.
+    """
+    age_band = Column(VARCHAR(16), nullable=False)
+    row_count = Column(BigInteger(), nullable=False, default=0)
+    # Rows with SeriousDlqin2yrs = 1, the delinquency rate is
+    # delinquent_count / (row_count - serious_dlqin_2_yrs_na_count)
+    delinquent_count = Column(BigInteger(), nullable=False, default=0)
+    # NULL values of every column, the NA rate of a column is its count / row_count
+    serious_dlqin_2_yrs_na_count = Column(BigInteger(), nullable=False, default=0)
+    revolving_utilization_of_unsecured_lines_na_count = Column(BigInteger(), nullable=False, default=0)
+    age_na_count = Column(BigInteger(), nullable=False, default=0)
+    number_of_time_30_59_days_past_due_not_worse_na_count = Column(BigInteger(), nullable=False, default=0)
+    debt_ratio_na_count = Column(BigInteger(), nullable=False, default=0)
+    monthly_income_na_count = Column(BigInteger(), nullable=False, default=0)
+    number_of_open_credit_lines_and_loans_na_count = Column(BigInteger(), nullable=False, default=0)
+    number_of_time_90_days_late_na_count = Column(BigInteger(), nullable=False, default=0)
+    number_real_estate_loans_or_lines_na_count = Column(BigInteger(), nullable=False, default=0)
+    number_of_times_60_89_days_past_due_not_worse_na_count = Column(BigInteger(), nullable=False, default=0)
+    number_of_dependents_na_count = Column(BigInteger(), nullable=False, default=0)
+
+
+class JobLoanAggregatesTable(LoanAggregatesMixin, Base):
+    """
+    Table definition of the aggregates of the rows loaded last by every job
+    """
+    __tablename__ = "loan_applications_job_aggregates"
+    job_id = Column(Integer(), nullable=False)
+    # Hour of the latest file of the job, the job is counted in this hour of the hourly aggregates
+    ingest_hour = Column(DateTime(), nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("job_id", "age_band"),
+    )
+
+
+class HourlyLoanAggregatesTable(LoanAggregatesMixin, Base):
+    """
+    Table definition of the aggregates of the rows of every ingest hour, the sums of the job aggregates of the hour
+    """
+    __tablename__ = "loan_applications_hourly_aggregates"
+    ingest_hour = Column(DateTime(), nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("ingest_hour", "age_band"),
+    )
+
+
+class IncomeHistogramMixin:
+    """
+    Partial histogram of the MonthlyIncome of an age band, mergeable like LoanAggregatesMixin
+    """
+    age_band = Column(VARCHAR(16), nullable=False)
+    # Income bucket, the incomes from income_bucket * MONTHLY_INCOME_BUCKET_WIDTH
+    income_bucket = Column(Integer(), nullable=False)
+    row_count = Column(BigInteger(), nullable=False, default=0)
+
+
+class JobIncomeHistogramTable(IncomeHistogramMixin, Base):
+    """
+    Table definition of the MonthlyIncome histogram of the rows loaded by every job
+    """
+    __tablename__ = "loan_applications_job_income_histograms"
+    job_id = Column(Integer(), nullable=False)
+    ingest_hour = Column(DateTime(), nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("job_id", "age_band", "income_bucket"),
+    )
+
+
+class HourlyIncomeHistogramTable(IncomeHistogramMixin, Base):
+    """
+    Table definition of the MonthlyIncome histogram of the rows of every ingest hour
+    """
+    __tablename__ = "loan_applications_hourly_income_histograms"
+    ingest_hour = Column(DateTime(), nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("ingest_hour", "age_band", "income_bucket"),
+    )
+
+
+class ImputationSketchMixin:
+    """
+    Partial sketch of the streaming imputation, the number of rows of every value of a column.
+    The partials are mergeable like LoanAggregatesMixin.
+    """
+    # Name of the sketch, see pipeline_tasks.streaming_imputer
+    sketch = Column(VARCHAR(64), nullable=False)
+    # Value of the column, or income bucket for the MonthlyIncome sketches
+    sketch_value = Column(Integer(), nullable=False)
+    row_count = Column(BigInteger(), nullable=False, default=0)
+
+
+class JobImputationSketchTable(ImputationSketchMixin, Base):
+    """
+    Table definition of the imputation sketches of the rows loaded last by every job
+    """
+    __tablename__ = "loan_applications_job_imputation_sketches"
+    job_id = Column(Integer(), nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("job_id", "sketch", "sketch_value"),
+    )
+
+
+class ImputationSketchTable(ImputationSketchMixin, Base):
+    """
+    Table definition of the imputation sketches of all the loaded rows, the sums of the job sketches.
+    The ETL reads them at the start of every job.
+    """
+    __tablename__ = "loan_applications_imputation_sketches"
+
+    __table_args__ = (
+        PrimaryKeyConstraint("sketch", "sketch_value"),
+    )
+
+
+def median_from_histogram(bucket_counts):
+    """
+    Function to estimate the median MonthlyIncome from a histogram, interpolated inside the median bucket
+    :param bucket_counts: Dictionary of income bucket to number of rows
+    :return: Median income, None for an empty histogram
+    """
+    total_count = sum(bucket_counts.values())
+    if total_count <= 0:
+        return None
+
+    cumulative_count = 0
+    for income_bucket in sorted(bucket_counts):
+        bucket_count = bucket_counts[income_bucket]
+        if bucket_count > 0 and cumulative_count + bucket_count >= total_count / 2:
+            lower_bound = income_bucket * MONTHLY_INCOME_BUCKET_WIDTH
+            if income_bucket >= MONTHLY_INCOME_BUCKETS:
+                # The last bucket has no upper bound
+                return lower_bound
+            return lower_bound + MONTHLY_INCOME_BUCKET_WIDTH * (total_count / 2 - cumulative_count) / bucket_count
+        cumulative_count += bucket_count
+    return None
+
+
+class BulkLoadStrategyEnum(enum.Enum):
+    """
+    Class to set the valid strategies to load the rows in the Reporting database
+    """
+    ORM = "ORM"
+    EXECUTEMANY = "EXECUTEMANY"
+    LOAD_DATA_INFILE = "LOAD_DATA_INFILE"
+
+
+# Representation of NULL in the files loaded with LOAD DATA INFILE
+LOAD_DATA_NULL = "\\N"
+
+# Prefix of the per job staging tables, the job id is appended to it
+STAGING_TABLE_PREFIX = f"{LoanApplicationsTable.__tablename__}_staging_"
+
+# loan_applications has one partition per ingest hour on MySQL, named like p2021100912.
+# The rows of the hours before the partitioning are in PARTITION_HISTORY, PARTITION_FUTURE is split
+# into new hourly partitions PARTITIONS_AHEAD_IN_HOURS ahead of the jobs.
+PARTITION_HISTORY = "p_history"
+PARTITION_FUTURE = "p_future"
+PARTITION_NAME_FORMAT = "p%Y%m%d%H"
+PARTITIONS_AHEAD_IN_HOURS = 24
 
 
 class ReportingDatabaseConnector(DatabaseConnector):
     """
     Class to handle Reporting database related operations
     """
-    def __init__(self, db_name, host, port, user, password):
-        super().__init__(db_name, host, port, user, password)
+    def __init__(self, db_name, host, port, user, password, local_infile=False, **pool_options):
+        """
+        :param local_infile: If True, the connection allows LOAD DATA LOCAL INFILE,
+                             required by BulkLoadStrategyEnum.LOAD_DATA_INFILE
+        :param pool_options: Options of the connection pool, see DatabaseConnector
+        """
+        super().__init__(db_name, host, port, user, password,
+                         connect_args={"local_infile": True} if local_infile else None,
+                         **pool_options)
+        # Hour up to which the hourly partitions of loan_applications exist
+        self.partitioned_until = None
 
     def setup_database(self):
         # We can safely call this multiple times, it won't affect the schema or the data
         # in the tables.
         # If in case, we want to change the schema, first we need to migrate the data for that
+        has_ids_table = inspect(self.engine).has_table(LoanApplicationIdsTable.__tablename__)
         Base.metadata.create_all(self.engine)
+        if not has_ids_table:
+            self._fill_loan_application_ids()
+        if self.engine.dialect.name == "mysql":
+            self._add_ingest_columns()
+            self._add_imputed_columns()
+            self._partition_loan_applications()
+            self.create_partitions(until_hour=self.ingest_hour() + td(hours=PARTITIONS_AHEAD_IN_HOURS))
+
+    def _fill_loan_application_ids(self):
+        """
+        Function to fill the LoanApplicationIdsTable created after the rows of loan_applications
+        :return: None
+        """
+        loan_table = LoanApplicationsTable.__table__
+        with self.engine.begin() as connection:
+            connection.execute(LoanApplicationIdsTable.__table__.insert().from_select(
+                ["id", "ingest_hour"],
+                select(loan_table.c.id, func.max(loan_table.c.ingest_hour)).group_by(loan_table.c.id)
+            ))
+
+    def _add_ingest_columns(self):
+        """
+        Function to add the ingest_hour and source_job columns to a loan_applications table created before them.
+        The existing rows get the ingest hour 1970-01-01 00:00, they all go to the history partition.
+        :return: None
+        """
+        if "ingest_hour" in [table_column["name"]
+                             for table_column in inspect(self.engine).get_columns(LoanApplicationsTable.__tablename__)]:
+            return
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                f"ALTER TABLE {LoanApplicationsTable.__tablename__} "
+                f"ADD COLUMN ingest_hour DATETIME NOT NULL DEFAULT '1970-01-01 00:00:00', "
+                f"ADD COLUMN source_job INTEGER NULL, "
+                f"DROP PRIMARY KEY, ADD PRIMARY KEY (id, ingest_hour)"
+            ))
+
+    def _add_imputed_columns(self):
+        """
+        Function to add the IMPUTED_COLUMNS to a loan_applications table created before them.
+        The existing rows have no imputed values.
+        :return: None
+        """
+        existing_columns = [table_column["name"] for table_column
+                            in inspect(self.engine).get_columns(LoanApplicationsTable.__tablename__)]
+        missing_columns = [column_name for column_name in IMPUTED_COLUMNS.values()
+                           if column_name not in existing_columns]
+        if not missing_columns:
+            return
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                f"ALTER TABLE {LoanApplicationsTable.__tablename__} "
+                f"{', '.join(f'ADD COLUMN {column_name} INTEGER NULL' for column_name in missing_columns)}"
+            ))
+
+    def _partition_bounds(self):
+        """
+        Function to get the upper bounds of the partitions of loan_applications
+        :return: List of datetimes of the bounds, without PARTITION_FUTURE. Empty if the table isn't partitioned.
+        """
+        with self.engine.begin() as connection:
+            descriptions = connection.execute(text(
+                "SELECT PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table_name AND PARTITION_NAME IS NOT NULL"
+            ), {"table_name": LoanApplicationsTable.__tablename__}).scalars().all()
+        return [dt.strptime(description.strip("'"), "%Y-%m-%d %H:%M:%S")
+                for description in descriptions if description != "MAXVALUE"]
+
+    def _partition_loan_applications(self):
+        """
+        Function to partition loan_applications by ingest_hour, if it isn't yet.
+        The rows before the current hour are in the history partition.
+        :return: None
+        """
+        if self._partition_bounds():
+            return
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                f"ALTER TABLE {LoanApplicationsTable.__tablename__} PARTITION BY RANGE COLUMNS(ingest_hour) ("
+                f"PARTITION {PARTITION_HISTORY} VALUES LESS THAN ('{self.ingest_hour():%Y-%m-%d %H:%M:%S}'), "
+                f"PARTITION {PARTITION_FUTURE} VALUES LESS THAN (MAXVALUE))"
+            ))
+
+    def create_partitions(self, until_hour):
+        """
+        Function to create the hourly partitions of loan_applications up to until_hour, after the last one.
+        PARTITION_FUTURE is split, it is empty unless rows were loaded for an hour without partition.
+        :param until_hour: Last ingest hour to create a partition for
+        :return: None
+        """
+        partition_bounds = self._partition_bounds()
+        if not partition_bounds:
+            # Not partitioned, e.g. the setup of the database isn't run yet
+            return
+
+        partition_hour = max(partition_bounds)
+        partitions = []
+        while partition_hour <= until_hour:
+            partitions.append(f"PARTITION {partition_hour.strftime(PARTITION_NAME_FORMAT)} "
+                              f"VALUES LESS THAN ('{partition_hour + td(hours=1):%Y-%m-%d %H:%M:%S}')")
+            partition_hour += td(hours=1)
+        if partitions:
+            with self.engine.begin() as connection:
+                connection.execute(text(
+                    f"ALTER TABLE {LoanApplicationsTable.__tablename__} REORGANIZE PARTITION {PARTITION_FUTURE} INTO "
+                    f"({', '.join(partitions)}, PARTITION {PARTITION_FUTURE} VALUES LESS THAN (MAXVALUE))"
+                ))
+        # Last hour with its own partition
+        self.partitioned_until = partition_hour - td(hours=1)
+
+    def ensure_partition(self, ingest_hour):
+        """
+        Function to create the partitions up to PARTITIONS_AHEAD_IN_HOURS after an ingest hour,
+        if the partition of the hour doesn't exist yet. The partitions roll forward with the loaded jobs.
+        :param ingest_hour: Ingest hour of a job
+        :return: None
+        """
+        if self.engine.dialect.name != "mysql":
+            return
+        if self.partitioned_until is not None and ingest_hour <= self.partitioned_until:
+            return
+
+        try:
+            self.create_partitions(until_hour=ingest_hour + td(hours=PARTITIONS_AHEAD_IN_HOURS))
+        except DBAPIError:
+            # Another ETL process created the same partitions in the meantime
+            self.create_partitions(until_hour=ingest_hour + td(hours=PARTITIONS_AHEAD_IN_HOURS))
+
+    def truncate_ingest_hour(self, ingest_hour):
+        """
+        Function to delete the rows, their ids and the aggregates of an ingest hour, e.g. before its jobs
+        are loaded again, and to remove its rows from the imputation sketches.
+        On MySQL, the rows are deleted by truncating the partition of the hour.
+        :param ingest_hour: Ingest hour
+        :return: None
+        """
+        hour_has_partition = self.engine.dialect.name == "mysql" and ingest_hour in self._partition_bounds_hours()
+        with self.engine.begin() as connection:
+            # The sketches aren't per hour, the rows of the hour are removed from them before they are deleted
+            for statement in self._update_imputation_sketches_statements(
+                    self._ingest_hour_rows(ingest_hour, JobImputationSketchTable.__table__),
+                    sign=-1, dialect_name=self.engine.dialect.name):
+                connection.execute(statement)
+            if hour_has_partition:
+                connection.execute(text(f"ALTER TABLE {LoanApplicationsTable.__tablename__} "
+                                        f"TRUNCATE PARTITION {ingest_hour.strftime(PARTITION_NAME_FORMAT)}"))
+            else:
+                connection.execute(delete(LoanApplicationsTable.__table__)
+                                   .where(LoanApplicationsTable.__table__.c.ingest_hour == ingest_hour))
+            for aggregates_table in (LoanApplicationIdsTable, JobLoanAggregatesTable, HourlyLoanAggregatesTable,
+                                     JobIncomeHistogramTable, HourlyIncomeHistogramTable):
+                connection.execute(delete(aggregates_table.__table__)
+                                   .where(aggregates_table.__table__.c.ingest_hour == ingest_hour))
+
+    def _partition_bounds_hours(self):
+        """
+        Function to get the ingest hours which have their own partition
+        :return: Set of datetimes
+        """
+        # The lowest bound is the one of the history partition
+        return {partition_bound - td(hours=1) for partition_bound in sorted(self._partition_bounds())[1:]}
+
+    def drop_partitions_before(self, ingest_hour):
+        """
+        Function to drop the hourly partitions of loan_applications before an ingest hour, to keep the
+        number of partitions under the limit of MySQL (8192). The ids of their rows are deleted,
+        the aggregates of the hours are kept.
+        :param ingest_hour: First ingest hour to keep
+        :return: Names of the dropped partitions
+        """
+        partitions = [partition_hour.strftime(PARTITION_NAME_FORMAT)
+                      for partition_hour in sorted(self._partition_bounds_hours()) if partition_hour < ingest_hour]
+        if partitions:
+            first_hour = dt.strptime(partitions[0], PARTITION_NAME_FORMAT)
+            with self.engine.begin() as connection:
+                connection.execute(text(f"ALTER TABLE {LoanApplicationsTable.__tablename__} "
+                                        f"DROP PARTITION {', '.join(partitions)}"))
+                ids_table = LoanApplicationIdsTable.__table__
+                connection.execute(delete(ids_table).where(ids_table.c.ingest_hour >= first_hour,
+                                                           ids_table.c.ingest_hour < ingest_hour))
+        return partitions
+
+    @staticmethod
+    def staging_table_name(job_id):
+        """
+        Function to get the name of the staging table of a job
+        :param job_id: ETL job id
+        :return: Name of the staging table
+        """
+        return f"{STAGING_TABLE_PREFIX}{job_id}"
+
+    @staticmethod
+    def staging_table(job_id):
+        """
+        Function to get the staging table of a job, with the LOADED_COLUMNS of loan_applications.
+        It isn't partitioned, the ingest hour of its rows is set by the merge.
+        :param job_id: ETL job id
+        :return: Sqlalchemy Table
+        """
+        return Table(ReportingDatabaseConnector.staging_table_name(job_id), MetaData(),
+                     *[Column(name, LoanApplicationsTable.__table__.c[name].type, primary_key=(name == "id"))
+                       for name in LOADED_COLUMNS])
+
+    def create_staging_table(self, job_id):
+        """
+        Function to create an empty staging table for a job.
+        If the table is left over from a previous attempt of the job, it is recreated.
+        :param job_id: ETL job id
+        :return: Name of the staging table
+        """
+        staging_table = self.staging_table(job_id)
+        with self.engine.begin() as connection:
+            connection.execute(text(f"DROP TABLE IF EXISTS {staging_table.name}"))
+            staging_table.create(connection)
+        return staging_table.name
+
+    @staticmethod
+    def ingest_hour(latest_file_modified_time=None):
+        """
+        Function to get the ingest hour of the rows of a job, the hour of its latest file
+        :param latest_file_modified_time: latest_file_modified_time of the job, now if None
+        :return: Datetime of the hour in UTC, without timezone like the other times of the databases
+        """
+        ingest_time = latest_file_modified_time or dt.now(tz=constants.TZ)
+        if ingest_time.tzinfo is not None:
+            ingest_time = ingest_time.astimezone(constants.TZ).replace(tzinfo=None)
+        return ingest_time.replace(minute=0, second=0, microsecond=0)
+
+    @staticmethod
+    def _age_band(age):
+        """
+        Function to get the SQL expression of the age band of an age
+        :param age: Age column
+        :return: Sqlalchemy expression
+        """
+        whens = [(age.is_(None), UNKNOWN_AGE_BAND)]
+        whens += [(age < next_lower_bound, band) for (_, band), (next_lower_bound, _) in zip(AGE_BANDS, AGE_BANDS[1:])]
+        return case(*whens, else_=AGE_BANDS[-1][1])
+
+    @staticmethod
+    def _income_bucket(monthly_income):
+        """
+        Function to get the SQL expression of the histogram bucket of a MonthlyIncome
+        :param monthly_income: MonthlyIncome column
+        :return: Sqlalchemy expression
+        """
+        # The integer division is spelled the same in MySQL and SQLite
+        return case((monthly_income >= MONTHLY_INCOME_BUCKETS * MONTHLY_INCOME_BUCKET_WIDTH, MONTHLY_INCOME_BUCKETS),
+                    (monthly_income < 0, 0),
+                    else_=(monthly_income - monthly_income % MONTHLY_INCOME_BUCKET_WIDTH) / MONTHLY_INCOME_BUCKET_WIDTH)
+
+    @staticmethod
+    def _staged_rows(job_id, ingest_hour):
+        """
+        Function to get the rows of the staging table of a job, with the job and the ingest hour they are loaded by
+        :param job_id: ETL job id
+        :param ingest_hour: Ingest hour of the job, see ingest_hour
+        :return: Sqlalchemy subquery of the LOADED_COLUMNS, job_id and ingest_hour
+        """
+        staging_table = ReportingDatabaseConnector.staging_table(job_id)
+        return select(staging_table,
+                      literal(job_id, Integer()).label("job_id"),
+                      literal(ingest_hour, DateTime()).label("ingest_hour")).subquery()
+
+    @staticmethod
+    def _replaced_rows(job_id, job_table):
+        """
+        Function to get the rows of loan_applications which the merge of the staging table of a job replaces,
+        the rows of its ids in the ingest hours of LoanApplicationIdsTable, with the job and the ingest hour
+        which loaded them. It is run before the merge. The rows of the jobs without partials in job_table,
+        e.g. the jobs loaded before the table, aren't counted in it.
+        :param job_id: ETL job id
+        :param job_table: Table of the partials of the jobs, e.g. JobLoanAggregatesTable table
+        :return: Sqlalchemy subquery of the LOADED_COLUMNS, job_id and ingest_hour
+        """
+        staging_table = ReportingDatabaseConnector.staging_table(job_id)
+        ids_table = LoanApplicationIdsTable.__table__
+        loan_table = LoanApplicationsTable.__table__
+        return (
+            select(*[loan_table.c[name] for name in LOADED_COLUMNS],
+                   loan_table.c.source_job.label("job_id"), loan_table.c.ingest_hour)
+            .select_from(staging_table
+                         .join(ids_table, ids_table.c.id == staging_table.c.id)
+                         .join(loan_table, and_(loan_table.c.id == ids_table.c.id,
+                                                loan_table.c.ingest_hour == ids_table.c.ingest_hour)))
+            .where(loan_table.c.source_job.in_(select(job_table.c.job_id)))
+            .subquery()
+        )
+
+    @staticmethod
+    def _ingest_hour_rows(ingest_hour, job_table):
+        """
+        Function to get the rows of loan_applications of an ingest hour, with the job which loaded them,
+        like _replaced_rows
+        :param ingest_hour: Ingest hour
+        :param job_table: Table of the partials of the jobs, e.g. JobImputationSketchTable table
+        :return: Sqlalchemy subquery of the LOADED_COLUMNS, job_id and ingest_hour
+        """
+        loan_table = LoanApplicationsTable.__table__
+        return (
+            select(*[loan_table.c[name] for name in LOADED_COLUMNS],
+                   loan_table.c.source_job.label("job_id"), loan_table.c.ingest_hour)
+            .where(loan_table.c.ingest_hour == literal(ingest_hour, DateTime()),
+                   loan_table.c.source_job.in_(select(job_table.c.job_id)))
+            .subquery()
+        )
+
+    @staticmethod
+    def _add_partials_statement(dialect_name, partials_table, partials):
+        """
+        Function to get the statement adding partials to a table of partials, in one atomic upsert,
+        so the ETL workers loading jobs of the same hour don't lose an update
+        :param dialect_name: Name of the dialect of the engine, mysql or sqlite
+        :param partials_table: Table of partials, e.g. HourlyLoanAggregatesTable table
+        :param partials: Select of its key columns and its *_count columns, with their names
+        :return: Sqlalchemy statement
+        """
+        key_columns = [primary_key.name for primary_key in partials_table.primary_key.columns]
+        columns = list(partials.selected_columns.keys())
+        count_columns = [name for name in columns if name.endswith("_count")]
+        if dialect_name == "mysql":
+            statement = mysql_insert(partials_table).from_select(columns, partials)
+            return statement.on_duplicate_key_update(
+                {name: partials_table.c[name] + statement.inserted[name] for name in count_columns}
+            )
+        # The WHERE keeps the ON CONFLICT of SQLite from being parsed as the ON of a join
+        statement = sqlite_insert(partials_table).from_select(columns, partials.where(true()))
+        return statement.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={name: partials_table.c[name] + statement.excluded[name] for name in count_columns}
+        )
+
+    @staticmethod
+    def _update_aggregates_statements(rows, sign, dialect_name):
+        """
+        Function to get the statements adding the partial aggregates of rows to the aggregates of their jobs
+        and of their ingest hours
+        :param rows: Subquery of the LOADED_COLUMNS, job_id and ingest_hour of the rows, see _staged_rows
+        :param sign: 1 to add the partials of the rows, -1 to remove them
+        :param dialect_name: Name of the dialect of the engine, mysql or sqlite
+        :return: List of Sqlalchemy statements
+        """
+        banded_rows = select(rows, ReportingDatabaseConnector._age_band(rows.c.age).label("age_band")).subquery()
+        columns = [column_name for column_name in CSV_HEADER_TO_COLUMN.values() if column_name != "id"]
+        bucketed_incomes = (
+            select(banded_rows.c.job_id, banded_rows.c.ingest_hour, banded_rows.c.age_band,
+                   ReportingDatabaseConnector._income_bucket(banded_rows.c.monthly_income).label("income_bucket"))
+            .where(banded_rows.c.monthly_income.isnot(None))
+            .subquery()
+        )
+
+        statements = []
+        for key_columns in (["job_id", "ingest_hour"], ["ingest_hour"]):
+            aggregates_table = (JobLoanAggregatesTable if "job_id" in key_columns else HourlyLoanAggregatesTable)
+            histogram_table = (JobIncomeHistogramTable if "job_id" in key_columns else HourlyIncomeHistogramTable)
+            group_columns = [banded_rows.c[name] for name in key_columns] + [banded_rows.c.age_band]
+            statements.append(ReportingDatabaseConnector._add_partials_statement(
+                dialect_name, aggregates_table.__table__,
+                select(*group_columns,
+                       (func.count() * sign).label("row_count"),
+                       (func.sum(case((banded_rows.c.serious_dlqin_2_yrs == 1, 1), else_=0)) * sign)
+                       .label("delinquent_count"),
+                       *[(func.sum(case((banded_rows.c[column_name].is_(None), 1), else_=0)) * sign)
+                         .label(f"{column_name}_na_count") for column_name in columns])
+                .group_by(*group_columns)
+                .order_by(*group_columns)
+            ))
+            group_columns = ([bucketed_incomes.c[name] for name in key_columns]
+                             + [bucketed_incomes.c.age_band, bucketed_incomes.c.income_bucket])
+            statements.append(ReportingDatabaseConnector._add_partials_statement(
+                dialect_name, histogram_table.__table__,
+                select(*group_columns, (func.count() * sign).label("row_count"))
+                .group_by(*group_columns)
+                .order_by(*group_columns)
+            ))
+        return statements
+
+    @staticmethod
+    def _sketch_value(value):
+        """
+        Function to get the SQL expression of the value of an integer column counted in a sketch
+        :param value: Column
+        :return: Sqlalchemy expression
+        """
+        return case((value > MAX_SKETCH_VALUE, MAX_SKETCH_VALUE), (value < 0, 0), else_=value)
+
+    @staticmethod
+    def _update_imputation_sketches_statements(rows, sign, dialect_name):
+        """
+        Function to get the statements adding the imputation sketches of rows to the sketches of their jobs
+        and of all the rows. The raw values are counted like StreamingImputer.impute counts them.
+        :param rows: Subquery of the LOADED_COLUMNS and job_id of the rows, see _staged_rows
+        :param sign: 1 to add the sketches of the rows, -1 to remove them
+        :param dialect_name: Name of the dialect of the engine, mysql or sqlite
+        :return: List of Sqlalchemy statements
+        """
+        sketch_value = ReportingDatabaseConnector._sketch_value
+        # The MonthlyIncome is counted in the sketch of the imputed age, the raw age for the jobs not imputed
+        income_sketch = case((func.coalesce(rows.c.age_imputed, rows.c.age) > WORKING_AGE_LIMIT, SENIOR_INCOME_SKETCH),
+                             else_=WORKING_INCOME_SKETCH)
+        sketch_values = union_all(
+            select(rows.c.job_id, literal(AGE_SKETCH).label("sketch"), sketch_value(rows.c.age).label("sketch_value"))
+            .where(rows.c.age >= MINIMUM_AGE),
+            select(rows.c.job_id, income_sketch,
+                   ReportingDatabaseConnector._income_bucket(rows.c.monthly_income))
+            .where(rows.c.monthly_income.isnot(None)),
+            select(rows.c.job_id, literal(DEPENDENTS_SKETCH), sketch_value(rows.c.number_of_dependents))
+            .where(rows.c.number_of_dependents.isnot(None)),
+            *[select(rows.c.job_id, literal(column_name), sketch_value(rows.c[column_name]))
+              .where(rows.c[column_name].isnot(None), rows.c[column_name].notin_(PAST_DUE_CODES))
+              for column_name in (CSV_HEADER_TO_COLUMN[header] for header in PAST_DUE_HEADERS)]
+        ).subquery()
+
+        statements = []
+        for sketch_table, key_columns in ((JobImputationSketchTable, ["job_id", "sketch", "sketch_value"]),
+                                          (ImputationSketchTable, ["sketch", "sketch_value"])):
+            group_columns = [sketch_values.c[name] for name in key_columns]
+            statements.append(ReportingDatabaseConnector._add_partials_statement(
+                dialect_name, sketch_table.__table__,
+                select(*group_columns, (func.count() * sign).label("row_count"))
+                .group_by(*group_columns)
+                .order_by(*group_columns)
+            ))
+        return statements
+
+    @staticmethod
+    def merge_staging_table_statements(job_id, ingest_hour, dialect_name="mysql"):
+        """
+        Function to get the statements merging the staging table of a job into loan_applications and updating
+        the job and hourly aggregates, to run in one transaction.
+        The primary key of the partitioned table includes the ingest hour, so it doesn't keep the ids unique:
+        the rows of the ids of the job are deleted, whatever their ingest hour, before the staged rows are
+        inserted with the ingest hour of the job. A row loaded again, by a retry of the job or by another job,
+        is replaced, never duplicated. The rows are found by id and by their ingest hour in LoanApplicationIdsTable,
+        so MySQL reads only the partitions of the replaced rows, and the ids table is updated in the same
+        transaction. On MySQL, the delete locks the ids until the commit, so the merges of the same ids
+        wait for each other.
+        The partials of the replaced rows are removed from the aggregates of the job and of the hour which
+        loaded them, then the partials of the staged rows are added to the job and its hour,
+        so every row is counted once. The imputation sketches are updated the same way, from the staged rows,
+        so they count the rows loaded before a checkpoint of the job too.
+        :param job_id: ETL job id
+        :param ingest_hour: Ingest hour of the job, see ingest_hour
+        :param dialect_name: Name of the dialect of the engine, mysql or sqlite
+        :return: List of Sqlalchemy statements
+        """
+        staging_table = ReportingDatabaseConnector.staging_table(job_id)
+        ids_table = LoanApplicationIdsTable.__table__
+        loan_table = LoanApplicationsTable.__table__
+        staged_rows = ReportingDatabaseConnector._staged_rows(job_id, ingest_hour)
+        if dialect_name == "mysql":
+            # Multiple table DELETE, the rows are read by their primary key in the partition of their hour
+            delete_replaced_rows = delete(loan_table).where(loan_table.c.id == ids_table.c.id,
+                                                            loan_table.c.ingest_hour == ids_table.c.ingest_hour,
+                                                            ids_table.c.id == staging_table.c.id)
+        else:
+            delete_replaced_rows = delete(loan_table).where(tuple_(loan_table.c.id, loan_table.c.ingest_hour).in_(
+                select(ids_table.c.id, ids_table.c.ingest_hour)
+                .select_from(staging_table.join(ids_table, ids_table.c.id == staging_table.c.id))
+            ))
+        return [
+            *ReportingDatabaseConnector._update_aggregates_statements(
+                ReportingDatabaseConnector._replaced_rows(job_id, JobLoanAggregatesTable.__table__),
+                sign=-1, dialect_name=dialect_name),
+            *ReportingDatabaseConnector._update_imputation_sketches_statements(
+                ReportingDatabaseConnector._replaced_rows(job_id, JobImputationSketchTable.__table__),
+                sign=-1, dialect_name=dialect_name),
+            delete_replaced_rows,
+            delete(ids_table).where(ids_table.c.id.in_(select(staging_table.c.id))),
+            loan_table.insert().from_select(
+                [*LOADED_COLUMNS, "ingest_hour", "source_job"],
+                select(*[staging_table.c[name] for name in LOADED_COLUMNS],
+                       literal(ingest_hour, DateTime()), literal(job_id, Integer()))
+            ),
+            ids_table.insert().from_select(["id", "ingest_hour"],
+                                           select(staging_table.c.id, literal(ingest_hour, DateTime()))),
+            *ReportingDatabaseConnector._update_aggregates_statements(staged_rows, sign=1, dialect_name=dialect_name),
+            *ReportingDatabaseConnector._update_imputation_sketches_statements(staged_rows, sign=1,
+                                                                               dialect_name=dialect_name),
+        ]
+
+    def get_imputation_sketches(self):
+        """
+        Function to get the imputation sketches of all the loaded rows
+        :return: Dictionary of sketch name to dictionary of value to number of rows
+        """
+        sketch_table = ImputationSketchTable.__table__
+        sketches = {}
+        with self.engine.begin() as connection:
+            for sketch, sketch_value, row_count in connection.execute(
+                    select(sketch_table.c.sketch, sketch_table.c.sketch_value, sketch_table.c.row_count)
+                    .where(sketch_table.c.row_count > 0)):
+                sketches.setdefault(sketch, {})[sketch_value] = row_count
+        return sketches
+
+    def merge_staging_table(self, job_id, ingest_hour=None):
+        """
+        Function to merge all the rows of the staging table of a job into loan_applications in one transaction.
+        loan_applications is only written by the merge, never row by row, and a retried job
+        replaces the rows of its previous attempts, see merge_staging_table_statements.
+        The job and hourly aggregates, and the imputation sketches, are updated in the same transaction.
+        :param job_id: ETL job id
+        :param ingest_hour: Ingest hour of the job, see ingest_hour, the current hour if None
+        :return: Number of rows merged
+        """
+        staging_table = self.staging_table_name(job_id)
+        ingest_hour = ingest_hour or self.ingest_hour()
+        # DDL commits, the partition is created before the transaction of the merge
+        self.ensure_partition(ingest_hour)
+        with self.engine.begin() as connection:
+            for statement in self.merge_staging_table_statements(job_id, ingest_hour,
+                                                                 dialect_name=self.engine.dialect.name):
+                connection.execute(statement)
+            return connection.execute(text(f"SELECT COUNT(*) FROM {staging_table}")).scalar()
+
+    def get_aggregates(self, from_hour, to_hour):
+        """
+        Function to get the summaries of the loan applications of the ingest hours [from_hour, to_hour)
+        from the hourly aggregates, without reading loan_applications
+        :param from_hour: First ingest hour
+        :param to_hour: Ingest hour after the last one
+        :return: Dictionary of age band, and "all" for all the bands, to a dictionary of
+                 rows, delinquency_rate, median_monthly_income and na_rates, the NA rate of every column
+        """
+        hourly_table = HourlyLoanAggregatesTable.__table__
+        histogram_table = HourlyIncomeHistogramTable.__table__
+        count_columns = [column_name for column_name in hourly_table.columns.keys() if column_name.endswith("_count")]
+        with self.engine.begin() as connection:
+            band_counts = {
+                row.age_band: {column_name: row[column_name] or 0 for column_name in count_columns}
+                for row in connection.execute(
+                    select(hourly_table.c.age_band,
+                           *[func.sum(hourly_table.c[column_name]).label(column_name) for column_name in count_columns])
+                    .where(hourly_table.c.ingest_hour >= from_hour, hourly_table.c.ingest_hour < to_hour)
+                    .group_by(hourly_table.c.age_band)
+                    # The bands whose rows were all replaced, e.g. by rows of another band, have 0 rows
+                    .having(func.sum(hourly_table.c.row_count) > 0)
+                )
+            }
+            band_histograms = {}
+            for age_band, income_bucket, row_count in connection.execute(
+                    select(histogram_table.c.age_band, histogram_table.c.income_bucket,
+                           func.sum(histogram_table.c.row_count))
+                    .where(histogram_table.c.ingest_hour >= from_hour, histogram_table.c.ingest_hour < to_hour)
+                    .group_by(histogram_table.c.age_band, histogram_table.c.income_bucket)
+                    .having(func.sum(histogram_table.c.row_count) > 0)):
+                band_histograms.setdefault(age_band, {})[income_bucket] = row_count
+
+        # The partials of the bands are merged like the partials of the hours
+        band_counts["all"] = {column_name: sum(counts[column_name] for counts in band_counts.values())
+                              for column_name in count_columns}
+        all_histogram = {}
+        for histogram in band_histograms.values():
+            for income_bucket, row_count in histogram.items():
+                all_histogram[income_bucket] = all_histogram.get(income_bucket, 0) + row_count
+        band_histograms["all"] = all_histogram
+
+        summaries = {}
+        for age_band, counts in band_counts.items():
+            row_count = counts["row_count"]
+            known_delinquency_count = row_count - counts["serious_dlqin_2_yrs_na_count"]
+            summaries[age_band] = {
+                "rows": row_count,
+                "delinquency_rate": counts["delinquent_count"] / known_delinquency_count
+                if known_delinquency_count else None,
+                "median_monthly_income": median_from_histogram(band_histograms.get(age_band, {})),
+                "na_rates": {column_name[:-len("_na_count")]: counts[column_name] / row_count if row_count else None
+                             for column_name in count_columns if column_name.endswith("_na_count")},
+            }
+        return summaries
+
+    def count_staging_rows(self, job_id):
+        """
+        Function to count the rows of the staging table of a job
+        :param job_id: ETL job id
+        :return: Number of rows, None if the job has no staging table
+        """
+        staging_table = self.staging_table_name(job_id)
+        if not inspect(self.engine).has_table(staging_table):
+            return None
+        with self.engine.begin() as connection:
+            return connection.execute(text(f"SELECT COUNT(*) FROM {staging_table}")).scalar()
+
+    def drop_staging_table(self, job_id):
+        """
+        Function to drop the staging table of a job
+        :param job_id: ETL job id
+        :return: None
+        """
+        with self.engine.begin() as connection:
+            connection.execute(text(f"DROP TABLE IF EXISTS {self.staging_table_name(job_id)}"))
+
+    @staticmethod
+    def _table(table_name):
+        """
+        Function to get the table object to insert in
+        :param table_name: loan_applications or one of its staging tables
+        :return: Sqlalchemy table
+        """
+        if table_name == LoanApplicationsTable.__tablename__:
+            return LoanApplicationsTable.__table__
+        return table(table_name, *[column(name) for name in LOADED_COLUMNS])
+
+    def bulk_load(self, rows, strategy=BulkLoadStrategyEnum.ORM, batch_size=10000,
+                  table_name=LoanApplicationsTable.__tablename__):
+        """
+        Function to load rows in the loan_applications table in a single transaction.
+        :param rows: Iterable of dictionaries of LoanApplicationsTable column name to value
+        :param strategy: BulkLoadStrategyEnum
+            ORM: Creates one LoanApplicationsTable object per row and adds them with the session
+            EXECUTEMANY: Core insert executed with executemany, pymysql sends every batch as multi-row VALUES
+            LOAD_DATA_INFILE: Every batch is written to a temporary file and loaded with LOAD DATA LOCAL INFILE
+        :param batch_size: Number of rows sent to the database together
+        :param table_name: Table to load the rows in, loan_applications or one of its staging tables.
+                           ORM objects are mapped to loan_applications only, so staging tables
+                           are loaded with EXECUTEMANY instead of ORM.
+        :return: Number of rows loaded. With EXECUTEMANY and LOAD_DATA_INFILE, a row whose key is already
+                 in the table is skipped, whatever the strategy, and isn't counted.
+        """
+        strategy = BulkLoadStrategyEnum(strategy)
+
+        if strategy == BulkLoadStrategyEnum.ORM:
+            if table_name == LoanApplicationsTable.__tablename__:
+                reporting_rows = [LoanApplicationsTable(**row) for row in rows]
+                self.create_new_jobs(reporting_rows)
+                return len(reporting_rows)
+            strategy = BulkLoadStrategyEnum.EXECUTEMANY
+
+        # LOAD DATA LOCAL INFILE always skips the duplicate keys, the inserts are made to skip them too
+        insert_statement = self._table(table_name).insert().prefix_with(
+            "IGNORE" if self.engine.dialect.name == "mysql" else "OR IGNORE")
+        total_rows = 0
+        rows = iter(rows)
+        with self.engine.begin() as connection:
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+
+                if strategy == BulkLoadStrategyEnum.EXECUTEMANY:
+                    loaded_rows = connection.execute(insert_statement, batch).rowcount
+                else:
+                    loaded_rows = self._load_data_infile(connection, batch, table_name=table_name)
+                total_rows += loaded_rows
+
+        return total_rows
+
+    @staticmethod
+    def _load_data_infile(connection, batch, table_name=LoanApplicationsTable.__tablename__):
+        """
+        Function to load a batch of rows with LOAD DATA LOCAL INFILE
+        :param connection: Connection in which the statement will be executed
+        :param batch: List of dictionaries of LoanApplicationsTable column name to value
+        :param table_name: Table to load the rows in, it must have the LOADED_COLUMNS
+        :return: Number of rows loaded, the rows with a duplicate key are skipped
+        """
+        columns = LOADED_COLUMNS
+
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".tsv") as spool_file:
+            for row in batch:
+                spool_file.write("\t".join(
+                    LOAD_DATA_NULL if row.get(column) is None else str(row[column]) for column in columns
+                ))
+                spool_file.write("\n")
+            spool_file.flush()
+
+            # IGNORE is the default of LOCAL, it is explicit so the duplicates are skipped like EXECUTEMANY
+            return connection.execute(text(
+                f"LOAD DATA LOCAL INFILE '{spool_file.name}' IGNORE INTO TABLE {table_name} "
+                f"FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' ({', '.join(columns)})"
+            )).rowcount
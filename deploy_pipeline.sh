@@ -30,6 +30,18 @@ else
   nohup python3 "$PROJECT_DIR"/start_scanner.py 2>&1 | tee -a scanner.log &
 fi
 
+# To run the ETL supervisor, it starts and restarts the ETL worker processes by itself
+if [ "${USE_ETL_SUPERVISOR:-0}" -eq 1 ]; then
+  RUNNING_SUPERVISORS=$(ps -ef | grep start_etl_supervisor.py | grep -v grep | wc -l);
+  if [ "$RUNNING_SUPERVISORS" -ge 1 ]; then
+    echo "One ETL Supervisor already running";
+  else
+    echo "Running 1 ETL Supervisor";
+    nohup python3 "$PROJECT_DIR"/start_etl_supervisor.py 2>&1 | tee -a etl.log &
+  fi
+  exit 0;
+fi
+
 # To run N ETL
 echo "Number of ETLs to run: $NUMBER_OF_ETLS";
 RUNNING_ETLS=$(ps -ef | grep start_etl.py | grep -v grep | wc -l);
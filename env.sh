@@ -1,2 +1,4 @@
 # This file contains all the required variables for the startup script
 export NUMBER_OF_ETLS=1
+# Set to 1 to run one ETL supervisor with a pool of worker processes instead of NUMBER_OF_ETLS ETLs
+export USE_ETL_SUPERVISOR=0
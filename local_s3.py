@@ -0,0 +1,185 @@
+"""
+Module with a local stand-in for the S3 client.
+It serves the files of a local directory with the subset of the boto3 S3 client API used by the project,
+so the Scanner and the ETL can run without AWS. Every sub directory of the root directory is a bucket.
+Example:
+    root_dir/credit-risk-data/2021/10/08/06/xaa is the key 2021/10/08/06/xaa of the bucket credit-risk-data
+"""
+import hashlib
+import os
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+import constants
+
+
+class LocalStreamingBody:
+    """
+    Class to mimic the botocore StreamingBody, it streams a byte range of a local file
+    """
+    def __init__(self, path, start=0, length=None):
+        self._file = open(path, "rb")
+        self._file.seek(start)
+        self._remaining = length if length is not None else os.path.getsize(path) - start
+
+    def read(self, amt=None):
+        if not self._remaining:
+            return b""
+        if amt is None or amt < 0 or amt > self._remaining:
+            amt = self._remaining
+        data = self._file.read(amt)
+        self._remaining -= len(data)
+        if not self._remaining:
+            self.close()
+        return data
+
+    def iter_chunks(self, chunk_size=1024 * 1024):
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        self._file.close()
+
+
+class LocalS3Client:
+    """
+    Class to mimic the boto3 S3 client on a local directory
+    """
+    def __init__(self, root_dir, page_size=1000):
+        """
+        :param root_dir: Directory containing one sub directory per bucket
+        :param page_size: Maximum number of keys returned by one list_objects_v2 call, same as S3
+        """
+        self.root_dir = root_dir
+        self.page_size = page_size
+        # ETags by path, modified time and size of the file, to not hash the same file again
+        self._etags = {}
+
+    @staticmethod
+    def _error(code, operation_name):
+        """
+        Function to create the same error as boto3
+        :param code: Error code
+        :param operation_name: Name of the called operation
+        :return: ClientError
+        """
+        return ClientError({"Error": {"Code": code, "Message": code}}, operation_name)
+
+    def _bucket_dir(self, bucket, operation_name):
+        """
+        Function to get the directory of a bucket
+        :param bucket: Bucket name
+        :param operation_name: Name of the called operation, for the error
+        :return: Path of the directory
+        """
+        bucket_dir = os.path.join(self.root_dir, bucket)
+        if not os.path.isdir(bucket_dir):
+            raise self._error("NoSuchBucket", operation_name)
+        return bucket_dir
+
+    def _object_path(self, bucket, key, operation_name):
+        """
+        Function to get the path of an object
+        :param bucket: Bucket name
+        :param key: Key of the object
+        :param operation_name: Name of the called operation, for the error
+        :return: Path of the file
+        """
+        path = os.path.join(self._bucket_dir(bucket, operation_name), *key.split("/"))
+        if not os.path.isfile(path):
+            raise self._error("NoSuchKey", operation_name)
+        return path
+
+    def _etag(self, path):
+        """
+        Function to calculate the ETag of a file, S3 uses the MD5 for non multipart uploads
+        :param path: Path of the file
+        :return: ETag
+        """
+        stat = os.stat(path)
+        cache_key = (path, stat.st_mtime_ns, stat.st_size)
+        if cache_key not in self._etags:
+            md5 = hashlib.md5()
+            with open(path, "rb") as file:
+                for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                    md5.update(chunk)
+            self._etags[cache_key] = f'"{md5.hexdigest()}"'
+        return self._etags[cache_key]
+
+    @staticmethod
+    def _last_modified(path):
+        """
+        Function to get the last modified time of a file
+        :param path: Path of the file
+        :return: Timezone aware datetime
+        """
+        return datetime.fromtimestamp(os.path.getmtime(path), tz=constants.TZ)
+
+    def list_buckets(self):
+        return {"Buckets": [{"Name": name} for name in sorted(os.listdir(self.root_dir))
+                            if os.path.isdir(os.path.join(self.root_dir, name))]}
+
+    def head_bucket(self, Bucket):
+        self._bucket_dir(Bucket, "HeadBucket")
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix="", ContinuationToken=None, StartAfter=None, MaxKeys=None):
+        bucket_dir = self._bucket_dir(Bucket, "ListObjectsV2")
+
+        # Only the directory of the prefix is walked
+        prefix_dir = os.path.join(bucket_dir, *Prefix.split("/")[:-1])
+
+        keys = []
+        for directory, _, file_names in os.walk(prefix_dir):
+            for file_name in file_names:
+                key = os.path.relpath(os.path.join(directory, file_name), bucket_dir).replace(os.sep, "/")
+                if key.startswith(Prefix):
+                    keys.append(key)
+        keys.sort()
+
+        # Same as S3, the continuation token is the last key of the previous page
+        start_after = ContinuationToken or StartAfter
+        if start_after:
+            keys = [key for key in keys if key > start_after]
+
+        page_size = min(MaxKeys or self.page_size, self.page_size)
+        page = keys[:page_size]
+        resp = {"KeyCount": len(page), "IsTruncated": len(keys) > page_size}
+        if page:
+            resp["Contents"] = []
+            for key in page:
+                path = os.path.join(bucket_dir, *key.split("/"))
+                resp["Contents"].append({"Key": key,
+                                         "LastModified": self._last_modified(path),
+                                         "Size": os.path.getsize(path),
+                                         "ETag": self._etag(path)})
+        if resp["IsTruncated"]:
+            resp["NextContinuationToken"] = page[-1]
+        return resp
+
+    def head_object(self, Bucket, Key):
+        path = self._object_path(Bucket, Key, "HeadObject")
+        return {"ContentLength": os.path.getsize(path),
+                "LastModified": self._last_modified(path),
+                "ETag": self._etag(path)}
+
+    def get_object(self, Bucket, Key, Range=None):
+        path = self._object_path(Bucket, Key, "GetObject")
+        size = os.path.getsize(path)
+        start, length = 0, size
+
+        if Range:
+            # Only the "bytes=start-end" and "bytes=start-" forms are used by the project
+            range_start, range_end = Range[len("bytes="):].split("-")
+            start = int(range_start)
+            end = min(int(range_end), size - 1) if range_end else size - 1
+            length = max(end - start + 1, 0)
+
+        return {"Body": LocalStreamingBody(path, start=start, length=length),
+                "ContentLength": length,
+                "LastModified": self._last_modified(path),
+                "ETag": self._etag(path)}
@@ -0,0 +1,347 @@
+"""
+Module to measure where the time of the Scanner and the ETL goes, and to export the measures for Prometheus.
+1. MetricsRecorder measures the seconds, calls, bytes and rows of every stage of a job:
+   list_bucket, get_object, parse, clean_data, impute and insert.
+   The time of a stage excludes the stages nested in it, e.g. the reads from S3 while parsing are get_object,
+   so the stages of a thread add up to its busy time.
+2. MetricsExporter sums the recorders of a process and exports them as a Prometheus text file,
+   for the textfile collector of the node exporter, and/or on a local HTTP endpoint.
+   The counters of the S3 disk caches of the process are exported with them.
+"""
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from logging_setup import get_logger
+
+logging = get_logger()
+
+LIST_BUCKET = "list_bucket"
+GET_OBJECT = "get_object"
+PARSE = "parse"
+CLEAN_DATA = "clean_data"
+IMPUTE = "impute"
+INSERT = "insert"
+
+# Prefix of the exported metrics
+METRIC_PREFIX = "etl_pipeline"
+
+
+@dataclass
+class StageMetrics:
+    """
+    Dataclass for the measures of a stage
+    """
+    seconds: float = 0.0
+    calls: int = 0
+    bytes: int = 0
+    rows: int = 0
+
+    def merge(self, other):
+        """
+        Function to add the measures of another StageMetrics
+        :param other: StageMetrics
+        :return: None
+        """
+        self.seconds += other.seconds
+        self.calls += other.calls
+        self.bytes += other.bytes
+        self.rows += other.rows
+
+    def __str__(self):
+        return f"Seconds: {self.seconds:.3f}, Calls: {self.calls}, Bytes: {self.bytes}, Rows: {self.rows}"
+
+
+class TimedStream:
+    """
+    Class to measure the reads of a file like object as a stage
+    """
+    def __init__(self, recorder, stage_name, stream):
+        self._recorder = recorder
+        self._stage_name = stage_name
+        self._stream = stream
+
+    def read(self, *args):
+        self._recorder.start(self._stage_name)
+        data = b""
+        try:
+            data = self._stream.read(*args)
+            return data
+        finally:
+            self._recorder.stop(byte_count=len(data))
+
+    def close(self):
+        self._stream.close()
+
+
+class MetricsRecorder:
+    """
+    Class to measure the stages of a job. It is shared by the threads of the job,
+    every thread keeps its own measures and they are added up by snapshot.
+    """
+    def __init__(self):
+        self.skipped_rows = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._thread_stages = []
+
+    def _stages(self):
+        """
+        Function to get the measures of the current thread
+        :return: Dictionary of stage name to StageMetrics
+        """
+        stages = getattr(self._local, "stages", None)
+        if stages is None:
+            stages = self._local.stages = defaultdict(StageMetrics)
+            self._local.stack = []
+            with self._lock:
+                self._thread_stages.append(stages)
+        return stages
+
+    def start(self, stage_name):
+        """
+        Function to start measuring a stage in the current thread, the running stage is paused
+        :param stage_name: Name of the stage
+        :return: None
+        """
+        stages = self._stages()
+        stack = self._local.stack
+        now = time.perf_counter()
+        if stack:
+            stages[stack[-1][0]].seconds += now - stack[-1][1]
+        stack.append([stage_name, now])
+
+    def stop(self, byte_count=0, row_count=0):
+        """
+        Function to stop measuring the last started stage of the current thread, the paused stage resumes
+        :param byte_count: Bytes handled by the stage
+        :param row_count: Rows handled by the stage
+        :return: None
+        """
+        stages = self._stages()
+        stack = self._local.stack
+        now = time.perf_counter()
+        stage_name, start_time = stack.pop()
+        stage_metrics = stages[stage_name]
+        stage_metrics.seconds += now - start_time
+        stage_metrics.calls += 1
+        stage_metrics.bytes += byte_count
+        stage_metrics.rows += row_count
+        if stack:
+            stack[-1][1] = now
+
+    @contextmanager
+    def stage(self, stage_name):
+        """
+        Function to measure a block of code as a stage
+        :param stage_name: Name of the stage
+        :return: Context manager
+        """
+        self.start(stage_name)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def add(self, stage_name, byte_count=0, row_count=0):
+        """
+        Function to add bytes and rows to a stage, e.g. once they are known after the stage
+        :param stage_name: Name of the stage
+        :param byte_count: Bytes handled by the stage
+        :param row_count: Rows handled by the stage
+        :return: None
+        """
+        stage_metrics = self._stages()[stage_name]
+        stage_metrics.bytes += byte_count
+        stage_metrics.rows += row_count
+
+    def add_skipped_rows(self, skipped_rows):
+        """
+        Function to count the rows skipped by the cleaning
+        :param skipped_rows: Number of rows
+        :return: None
+        """
+        with self._lock:
+            self.skipped_rows += skipped_rows
+
+    def timed_iter(self, stage_name, iterable):
+        """
+        Function to measure the time taken to produce every item of an iterable as a stage, one row per item
+        :param stage_name: Name of the stage
+        :param iterable: Iterable, e.g. a CSV reader
+        :return: Generator of the items
+        """
+        iterator = iter(iterable)
+        while True:
+            self.start(stage_name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.stop()
+                return
+            except BaseException:
+                self.stop()
+                raise
+            self.stop(row_count=1)
+            yield item
+
+    def timed_stream(self, stage_name, stream):
+        """
+        Function to measure the reads of a file like object as a stage
+        :param stage_name: Name of the stage
+        :param stream: File like object
+        :return: TimedStream
+        """
+        return TimedStream(self, stage_name, stream)
+
+    def snapshot(self):
+        """
+        Function to add up the measures of all the threads
+        :return: Dictionary of stage name to StageMetrics
+        """
+        total = defaultdict(StageMetrics)
+        with self._lock:
+            thread_stages = list(self._thread_stages)
+        for stages in thread_stages:
+            for stage_name, stage_metrics in list(stages.items()):
+                total[stage_name].merge(stage_metrics)
+        return dict(total)
+
+    def __str__(self):
+        return "; ".join(f"{stage_name}: {stage_metrics}" for stage_name, stage_metrics in self.snapshot().items())
+
+
+class MetricsExporter:
+    """
+    Class to add up the recorders of the jobs of a process and export the totals for Prometheus
+    """
+    def __init__(self):
+        self.stages = defaultdict(StageMetrics)
+        self.jobs = defaultdict(int)
+        self.skipped_rows = defaultdict(int)
+        # S3DiskCache objects of the process by directory, their counters are read when the metrics are exported
+        self.caches = {}
+        self.textfile_dir = None
+        self._http_server = None
+        self._lock = threading.Lock()
+
+    def configure(self, textfile_dir=None, http_port=0):
+        """
+        Function to set where the metrics are exported, the HTTP server is started only once per process
+        :param textfile_dir: Directory of the Prometheus text files, None to not write them
+        :param http_port: Port of the HTTP endpoint serving /metrics, 0 to not serve them
+        :return: None
+        """
+        self.textfile_dir = textfile_dir
+        if http_port and self._http_server is None:
+            exporter = self
+
+            class MetricsHandler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    body = exporter.to_prometheus_text().encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            try:
+                self._http_server = ThreadingHTTPServer(("", http_port), MetricsHandler)
+            except OSError as err:
+                # e.g. the port is taken by another worker of the host
+                logging.log(logging.WARNING, f"Metrics are not served on port {http_port}: {err}")
+                return
+            threading.Thread(target=self._http_server.serve_forever, name="metrics-http", daemon=True).start()
+            logging.log(logging.INFO, f"Metrics served on http://0.0.0.0:{http_port}/metrics")
+
+    def register_cache(self, cache):
+        """
+        Function to export the counters of an S3 disk cache, it replaces the cache registered for the same directory
+        :param cache: s3_cache.S3DiskCache
+        :return: None
+        """
+        with self._lock:
+            self.caches[cache.cache_dir] = cache
+
+    def record(self, task_name, recorder: MetricsRecorder, status):
+        """
+        Function to add the measures of a job to the totals of the process and export them
+        :param task_name: Name of the task, e.g. etl or scanner
+        :param recorder: MetricsRecorder of the job
+        :param status: Status of the job, e.g. LOADED or FAILED
+        :return: None
+        """
+        with self._lock:
+            for stage_name, stage_metrics in recorder.snapshot().items():
+                self.stages[(task_name, stage_name)].merge(stage_metrics)
+            self.jobs[(task_name, status)] += 1
+            self.skipped_rows[task_name] += recorder.skipped_rows
+
+        if self.textfile_dir:
+            self.write_textfile(os.path.join(self.textfile_dir, f"{task_name}_{os.getpid()}.prom"))
+
+    def to_prometheus_text(self):
+        """
+        Function to format the totals in the Prometheus text format
+        :return: String
+        """
+        lines = []
+        with self._lock:
+            for field, help_text in (("seconds", "Seconds spent in the stage"),
+                                     ("calls", "Number of times the stage ran"),
+                                     ("bytes", "Bytes handled by the stage"),
+                                     ("rows", "Rows handled by the stage")):
+                name = f"{METRIC_PREFIX}_stage_{field}_total"
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                for (task_name, stage_name), stage_metrics in sorted(self.stages.items()):
+                    lines.append(f'{name}{{task="{task_name}",stage="{stage_name}"}} {getattr(stage_metrics, field)}')
+
+            name = f"{METRIC_PREFIX}_jobs_total"
+            lines += [f"# HELP {name} Number of jobs by status", f"# TYPE {name} counter"]
+            for (task_name, status), jobs in sorted(self.jobs.items()):
+                lines.append(f'{name}{{task="{task_name}",status="{status}"}} {jobs}')
+
+            name = f"{METRIC_PREFIX}_skipped_rows_total"
+            lines += [f"# HELP {name} Rows skipped by the cleaning", f"# TYPE {name} counter"]
+            for task_name, skipped_rows in sorted(self.skipped_rows.items()):
+                lines.append(f'{name}{{task="{task_name}"}} {skipped_rows}')
+
+            # The tasks of a process share one cache per directory, see s3_cache.shared_disk_cache
+            cache_stats = {cache_dir: cache.stats() for cache_dir, cache in self.caches.items()}
+
+        if cache_stats:
+            name = f"{METRIC_PREFIX}_s3_cache_operations_total"
+            lines += [f"# HELP {name} Hits, misses and evictions of the S3 disk cache", f"# TYPE {name} counter"]
+            for cache_dir, stats in sorted(cache_stats.items()):
+                for operation in ("hits", "misses", "evictions"):
+                    lines.append(f'{name}{{cache_dir="{cache_dir}",operation="{operation}"}} {stats[operation]}')
+            name = f"{METRIC_PREFIX}_s3_cache_size_bytes"
+            lines += [f"# HELP {name} Size of the S3 disk cache as seen by the process", f"# TYPE {name} gauge"]
+            for cache_dir, stats in sorted(cache_stats.items()):
+                lines.append(f'{name}{{cache_dir="{cache_dir}"}} {stats["size_in_bytes"]}')
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """
+        Function to write the totals to a Prometheus text file. The file is replaced atomically,
+        so the collector never reads a partial file.
+        :param path: Path of the file
+        :return: None
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp-")
+        with os.fdopen(file_descriptor, "w") as temp_file:
+            temp_file.write(self.to_prometheus_text())
+        os.replace(temp_path, path)
+
+
+# Totals of the process, shared by all its tasks
+EXPORTER = MetricsExporter()
@@ -1,3 +1,6 @@
 from .base_task import BaseTask
 from .scanner_task import ScannerTask
+from .event_scanner_task import EventScannerTask
 from .etl_task import ETLTask
+from .async_etl_task import AsyncETLTask
+from .etl_supervisor import ETLSupervisor
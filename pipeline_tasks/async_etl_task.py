@@ -0,0 +1,324 @@
+"""
+Module to handle the ETL with asyncio.
+One process handles many jobs at once: the jobs are claimed and the rows are written to MySQL
+with the `databases` package, and the S3 objects are streamed in worker threads, so the event loop
+is never blocked on the network. The number of jobs handled at once is ASYNC_ETL_CONCURRENCY.
+"""
+import time
+import traceback
+from datetime import timedelta as td
+from itertools import islice
+
+import anyio
+from databases import Database
+from sqlalchemy import select, update, delete, text, or_
+from sqlalchemy.schema import CreateTable
+
+from db_helper import (ScannerTable, ScannerJobFileTable, JobMetricsTable, JobCheckpointTable, ScannerStatusEnum,
+                       ReportingDatabaseConnector, retry_backoff_in_second)
+from db_helper.database_connector import now_with_timezone
+from config_data_classes import DatabaseConfig, S3Config, ETLConfig
+from . import BaseTask, ETLTask
+from .columnar_cleaner import ColumnarCleaner
+from .streaming_imputer import StreamingImputer
+import constants
+import metrics
+from logging_setup import get_logger
+
+logging = get_logger()
+
+
+def database_url(database_config: DatabaseConfig):
+    """
+    Function to prepare the `databases` URL of a database, MySQL is served by aiomysql
+    :param database_config: Database config object
+    :return: URL string
+    """
+    return (f"mysql://{database_config.USERNAME}:{database_config.PASSWORD}@"
+            f"{database_config.HOST}:{database_config.PORT}/{database_config.DATABASE_NAME}")
+
+
+class AsyncETLTask(ETLTask):
+    """
+    Class to run the ETL jobs concurrently on asyncio.
+    The cleaning is the same as ETLTask, only the claiming, reading and loading are asynchronous.
+    """
+    def __init__(self,
+                 etl_db_config: DatabaseConfig,
+                 reporting_db_config: DatabaseConfig,
+                 s3_config: S3Config,
+                 etl_config: ETLConfig):
+        """
+        Initialising connection pools to ETL Database and Reporting Database, and the S3 client
+        :param etl_db_config: ETL database config object
+        :param reporting_db_config: Reporting database config object
+        :param s3_config: S3 config Object
+        :param etl_config: ETL tasks related object
+        """
+        # Only S3 is initialised by the BaseTask, the databases are connected asynchronously
+        BaseTask.__init__(self, s3_config=s3_config, etl_config=etl_config)
+        self.columnar_cleaner = ColumnarCleaner()
+        # The jobs run concurrently, so the stages are measured for the whole process instead of every job
+        self.recorder = self.s3_helper.recorder = metrics.MetricsRecorder()
+        # The imputers are per job too, they are passed to _clean_rows
+        self.imputer = None
+
+        concurrency = max(etl_config.ASYNC_ETL_CONCURRENCY, 1)
+        self.etl_database = Database(database_url(etl_db_config), min_size=1, max_size=concurrency)
+        self.reporting_database = Database(database_url(reporting_db_config), min_size=1, max_size=concurrency)
+        # DDL of the hourly partitions of loan_applications and reads of the imputation sketches,
+        # once per job at most, so one synchronous connection
+        self.partition_manager = ReportingDatabaseConnector(db_name=reporting_db_config.DATABASE_NAME,
+                                                            host=reporting_db_config.HOST,
+                                                            port=reporting_db_config.PORT,
+                                                            user=reporting_db_config.USERNAME,
+                                                            password=reporting_db_config.PASSWORD,
+                                                            pool_size=1,
+                                                            max_overflow=0,
+                                                            pool_pre_ping=True)
+        # Threads reading from S3, one per concurrent job
+        self.s3_limiter = anyio.CapacityLimiter(concurrency)
+
+    async def get_latest_etl_job(self):
+        """
+        Returns the latest job with the status SENT_FOR_ETL, after changing its status to PROCESSING.
+        The jobs locked by the other workers are skipped.
+        :return: Row of the ScannerTable or None
+        """
+        scanner_table = ScannerTable.__table__
+        async with self.etl_database.transaction():
+            latest_job = await self.etl_database.fetch_one(
+                select(scanner_table)
+                .where(scanner_table.c.status == ScannerStatusEnum.SENT_FOR_ETL.value)
+                .order_by(scanner_table.c.latest_file_modified_time)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            )
+            if latest_job is not None:
+                await self._change_status_of_job(job_id=latest_job["id"], new_status=ScannerStatusEnum.PROCESSING)
+            return latest_job
+
+    async def _change_status_of_job(self, job_id, new_status: ScannerStatusEnum, err_msg=None):
+        """
+        Function to change the status of a job
+        :param job_id: Job Id for which the status is required to be changed
+        :param new_status: The new status to which the status has to be updated
+        :param err_msg: If new_status is FAILED, the error msg to insert in the job
+        :return: None
+        """
+        scanner_table = ScannerTable.__table__
+        values = {"status": new_status.value, "modified_time": now_with_timezone()}
+        if new_status == ScannerStatusEnum.FAILED:
+            values["failure_msg"] = err_msg
+
+        await self.etl_database.execute(update(scanner_table).where(scanner_table.c.id == job_id).values(**values))
+
+        job_files_table = ScannerJobFileTable.__table__
+        await self.etl_database.execute(update(job_files_table)
+                                        .where(job_files_table.c.job_id == job_id)
+                                        .values(status=new_status.value, modified_time=now_with_timezone()))
+
+    async def _count_failed_attempt(self, job_id):
+        """
+        Function to count a failed attempt of a job in its checkpoint, for the retries
+        :param job_id: Job Id
+        :return: None
+        """
+        checkpoint_table = JobCheckpointTable.__table__
+        failed_attempts = await self.etl_database.fetch_val(select(checkpoint_table.c.failed_attempts)
+                                                            .where(checkpoint_table.c.job_id == job_id))
+        if failed_attempts is None:
+            await self.etl_database.execute(checkpoint_table.insert().values(job_id=job_id, failed_attempts=1))
+        else:
+            await self.etl_database.execute(update(checkpoint_table)
+                                            .where(checkpoint_table.c.job_id == job_id)
+                                            .values(failed_attempts=checkpoint_table.c.failed_attempts + 1,
+                                                    modified_time=now_with_timezone()))
+
+    async def schedule_retries(self):
+        """
+        Function to send the FAILED jobs back to the ETL once their backoff is over, up to MAX_JOB_ATTEMPTS attempts.
+        Same as ETLMetadataDatabaseConnector.schedule_failed_job_retries.
+        :return: List of the retried job ids
+        """
+        if self.etl_config.MAX_JOB_ATTEMPTS <= 1:
+            return []
+
+        scanner_table = ScannerTable.__table__
+        checkpoint_table = JobCheckpointTable.__table__
+        now = now_with_timezone()
+        async with self.etl_database.transaction():
+            failed_jobs = await self.etl_database.fetch_all(
+                select(scanner_table.c.id, scanner_table.c.modified_time, checkpoint_table.c.failed_attempts)
+                .select_from(scanner_table.outerjoin(checkpoint_table,
+                                                     checkpoint_table.c.job_id == scanner_table.c.id))
+                .where(scanner_table.c.status == ScannerStatusEnum.FAILED.value)
+                .where(or_(checkpoint_table.c.failed_attempts.is_(None),
+                           checkpoint_table.c.failed_attempts < self.etl_config.MAX_JOB_ATTEMPTS))
+                .with_for_update(skip_locked=True, of=scanner_table)
+            )
+            job_ids = [failed_job["id"] for failed_job in failed_jobs
+                       if failed_job["modified_time"].replace(tzinfo=constants.TZ)
+                       + td(seconds=retry_backoff_in_second(failed_job["failed_attempts"] or 1,
+                                                            self.etl_config.RETRY_BACKOFF_IN_SECOND,
+                                                            self.etl_config.RETRY_BACKOFF_MULTIPLIER,
+                                                            self.etl_config.MAX_RETRY_BACKOFF_IN_SECOND)) <= now]
+            for job_id in job_ids:
+                await self._change_status_of_job(job_id=job_id, new_status=ScannerStatusEnum.SENT_FOR_ETL)
+
+        if job_ids:
+            logging.log(logging.INFO, f"Retrying the failed ETL jobs: {job_ids}")
+        return job_ids
+
+    async def _save_job_metrics(self, job_id, total_size_in_bytes, loaded_rows, processing_seconds):
+        """
+        Function to save the metrics of a loaded job, a retried job replaces the metrics of its previous attempt
+        :param job_id: Job Id
+        :param total_size_in_bytes: Size of the job
+        :param loaded_rows: Number of rows loaded
+        :param processing_seconds: Seconds taken to process the job
+        :return: None
+        """
+        job_metrics_table = JobMetricsTable.__table__
+        await self.etl_database.execute(delete(job_metrics_table).where(job_metrics_table.c.job_id == job_id))
+        await self.etl_database.execute(job_metrics_table.insert().values(job_id=job_id,
+                                                                          total_size_in_bytes=total_size_in_bytes,
+                                                                          loaded_rows=loaded_rows,
+                                                                          processing_seconds=processing_seconds,
+                                                                          created_time=now_with_timezone()))
+
+    async def _job_files(self, etl_job_row):
+        """
+        Function to get the files of a job from the ScannerJobFileTable,
+        the jobs created before that table have their files in the `files` column
+        :param etl_job_row: Row of the ScannerTable
+        :return: List of (full S3 URL, range start, range end) in processing order
+        """
+        job_files_table = ScannerJobFileTable.__table__
+        job_files = await self.etl_database.fetch_all(
+            select(job_files_table.c.file_path, job_files_table.c.range_start, job_files_table.c.range_end)
+            .where(job_files_table.c.job_id == etl_job_row["id"])
+            .order_by(job_files_table.c.file_index)
+        )
+        if not job_files:
+            return [(s3_url, None, None)
+                    for s3_url in etl_job_row["files"].split(constants.MULTI_FILE_PATH_SEPARATOR)]
+        return [(job_file["file_path"], job_file["range_start"], job_file["range_end"]) for job_file in job_files]
+
+    async def _read_batches(self, s3_url, range_start=None, range_end=None, imputer=None):
+        """
+        Function to stream the cleaned rows of a file in batches of LOAD_BATCH_SIZE.
+        Every batch is downloaded, parsed and cleaned in a worker thread.
+        :param s3_url: full S3 URl of the file
+        :param range_start: First byte of the range for the jobs of a split file, None for the whole file
+        :param range_end: End of the range, exclusive
+        :param imputer: StreamingImputer of the job, None if STREAMING_IMPUTATION is off
+        :return: Async generator of lists of LoanApplicationsTable column dictionaries
+        """
+        if range_start is None:
+            rows = self.s3_helper.read_csv(s3_url)
+        else:
+            rows = await anyio.to_thread.run_sync(self.s3_helper.read_csv_part, s3_url, range_start, range_end,
+                                                  limiter=self.s3_limiter)
+        cleaned_rows = self._clean_rows(s3_url, rows, imputer=imputer)
+        reporting_rows = map(self.to_reporting_row, cleaned_rows)
+
+        def next_batch():
+            return list(islice(reporting_rows, self.etl_config.LOAD_BATCH_SIZE))
+
+        while True:
+            batch = await anyio.to_thread.run_sync(next_batch, limiter=self.s3_limiter)
+            if not batch:
+                break
+            yield batch
+
+    async def process_job(self, etl_job_row):
+        """
+        Function to download, clean and load all the files of a job and mark it LOADED or FAILED.
+        The rows of the job are inserted in its staging table, which is merged into loan_applications
+        in one statement, so a retried job never duplicates the rows of a previous attempt.
+        The job and hourly aggregates, and the imputation sketches, are updated in the same transaction.
+        :param etl_job_row: Row of the ScannerTable
+        :return: Number of rows loaded, None if the job failed
+        """
+        job_id = etl_job_row["id"]
+        start_time = time.monotonic()
+
+        try:
+            job_files = await self._job_files(etl_job_row)
+            loaded_rows = 0
+            ingest_hour = ReportingDatabaseConnector.ingest_hour(etl_job_row["latest_file_modified_time"])
+            staging_table = ReportingDatabaseConnector.staging_table(job_id)
+            await self.reporting_database.execute(text(f"DROP TABLE IF EXISTS {staging_table.name}"))
+            await self.reporting_database.execute(CreateTable(staging_table))
+            imputer = None
+            if self.etl_config.STREAMING_IMPUTATION:
+                imputer = StreamingImputer(
+                    await anyio.to_thread.run_sync(self.partition_manager.get_imputation_sketches))
+            try:
+                for s3_url, range_start, range_end in job_files:
+                    logging.log(logging.INFO, f"Streaming data from the {s3_url}")
+                    async for batch in self._read_batches(s3_url, range_start, range_end, imputer=imputer):
+                        # Multi-row VALUES, execute_many of `databases` sends one statement per row
+                        await self.reporting_database.execute(staging_table.insert().values(batch))
+                        loaded_rows += len(batch)
+                # The aggregates are updated in the transaction of the merge
+                await anyio.to_thread.run_sync(self.partition_manager.ensure_partition, ingest_hour)
+                async with self.reporting_database.transaction():
+                    for statement in ReportingDatabaseConnector.merge_staging_table_statements(job_id, ingest_hour):
+                        await self.reporting_database.execute(statement)
+            finally:
+                await self.reporting_database.execute(text(f"DROP TABLE IF EXISTS {staging_table.name}"))
+
+            async with self.etl_database.transaction():
+                await self._change_status_of_job(job_id=job_id, new_status=ScannerStatusEnum.LOADED)
+                await self._save_job_metrics(job_id=job_id,
+                                             total_size_in_bytes=etl_job_row["total_size_in_bytes"] or 0,
+                                             loaded_rows=loaded_rows,
+                                             processing_seconds=time.monotonic() - start_time)
+                # A loaded job is never resumed
+                await self.etl_database.execute(delete(JobCheckpointTable.__table__)
+                                                .where(JobCheckpointTable.__table__.c.job_id == job_id))
+            logging.log(logging.INFO, f"Successfully loaded {loaded_rows} rows from {len(job_files)} files "
+                                      f"to database.")
+            logging.log(logging.INFO, f"Successfully processed ETL Job with ID: {job_id}")
+            return loaded_rows
+        except Exception:
+            async with self.etl_database.transaction():
+                await self._change_status_of_job(job_id=job_id,
+                                                 new_status=ScannerStatusEnum.FAILED,
+                                                 err_msg=traceback.format_exc()[:4096])
+                await self._count_failed_attempt(job_id=job_id)
+            logging.exception(traceback.format_exc())
+            return None
+
+    async def _worker(self, worker_id):
+        """
+        Function to claim and process jobs until there are no jobs with the status SENT_FOR_ETL
+        :param worker_id: Id of the worker, for the logs
+        :return: None
+        """
+        while True:
+            await self.schedule_retries()
+            etl_job_row = await self.get_latest_etl_job()
+            if etl_job_row is None:
+                logging.log(logging.INFO, f"Worker {worker_id}: No more ETL Jobs to process.")
+                break
+
+            logging.log(logging.INFO, f"Worker {worker_id}: Started the following ETL job: {dict(etl_job_row)}")
+            await self.process_job(etl_job_row)
+
+    async def run(self):
+        """
+        Function to run ASYNC_ETL_CONCURRENCY workers until there are no jobs left
+        :return: None
+        """
+        await self.etl_database.connect()
+        await self.reporting_database.connect()
+        try:
+            async with anyio.create_task_group() as task_group:
+                for worker_id in range(max(self.etl_config.ASYNC_ETL_CONCURRENCY, 1)):
+                    task_group.start_soon(self._worker, worker_id)
+        finally:
+            await self.reporting_database.disconnect()
+            await self.etl_database.disconnect()
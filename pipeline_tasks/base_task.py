@@ -2,8 +2,11 @@
 Module defining the base task class
 """
 from config_data_classes import DatabaseConfig, S3Config, ETLConfig
-from db_helper import ETLMetadataDatabaseConnector, ReportingDatabaseConnector
+from db_helper import ETLMetadataDatabaseConnector, ReportingDatabaseConnector, BulkLoadStrategyEnum
 from s3_helper import S3Helper
+from local_s3 import LocalS3Client
+from s3_cache import shared_disk_cache
+import metrics
 
 
 class BaseTask:
@@ -27,7 +30,8 @@ class BaseTask:
                                                        host=etl_db_config.HOST,
                                                        port=etl_db_config.PORT,
                                                        user=etl_db_config.USERNAME,
-                                                       password=etl_db_config.PASSWORD)
+                                                       password=etl_db_config.PASSWORD,
+                                                       **self._pool_options(etl_db_config))
         else:
             self.etl_db = None
 
@@ -36,18 +40,43 @@ class BaseTask:
                                                            host=reporting_db_config.HOST,
                                                            port=reporting_db_config.PORT,
                                                            user=reporting_db_config.USERNAME,
-                                                           password=reporting_db_config.PASSWORD)
+                                                           password=reporting_db_config.PASSWORD,
+                                                           local_infile=(
+                                                               etl_config is not None
+                                                               and BulkLoadStrategyEnum(etl_config.LOAD_STRATEGY)
+                                                               == BulkLoadStrategyEnum.LOAD_DATA_INFILE
+                                                           ),
+                                                           **self._pool_options(reporting_db_config))
         else:
             self.reporting_db = None
 
         if s3_config is not None:
             self.s3_helper = S3Helper(bucket_name=s3_config.BUCKET,
                                       access_key=s3_config.AWS_ACCESS_KEY,
-                                      secret_key=s3_config.AWS_SECRET_KEY)
+                                      secret_key=s3_config.AWS_SECRET_KEY,
+                                      s3_client=(LocalS3Client(s3_config.LOCAL_ROOT_DIR)
+                                                 if s3_config.LOCAL_ROOT_DIR else None),
+                                      cache=(shared_disk_cache(s3_config.CACHE_DIR, s3_config.CACHE_MAX_SIZE_IN_BYTES)
+                                             if s3_config.CACHE_DIR else None))
         else:
             self.s3_helper = None
 
         self.etl_config = etl_config
+        if etl_config is not None:
+            metrics.EXPORTER.configure(textfile_dir=etl_config.METRICS_TEXTFILE_DIR,
+                                       http_port=etl_config.METRICS_HTTP_PORT)
+
+    @staticmethod
+    def _pool_options(db_config: DatabaseConfig):
+        """
+        Function to get the options of the connection pool of a database
+        :param db_config: Database config object
+        :return: Dictionary of the DatabaseConnector pool arguments
+        """
+        return {"pool_size": db_config.POOL_SIZE,
+                "max_overflow": db_config.POOL_MAX_OVERFLOW,
+                "pool_pre_ping": db_config.POOL_PRE_PING,
+                "pool_recycle": db_config.POOL_RECYCLE_IN_SECOND}
 
     def run(self):
         """
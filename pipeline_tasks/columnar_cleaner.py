@@ -0,0 +1,120 @@
+"""
+Module to clean the data in batches.
+A batch of CSV rows is converted into columns and every column is casted at once with NumPy,
+instead of casting every field of every row with its own try/except.
+The casting rules are taken from the column types of LoanApplicationsTable.
+"""
+import numpy as np
+
+from db_helper import LoanApplicationsTable, CSV_HEADER_TO_COLUMN
+
+# Header of the id column in the CSV file
+ID_HEADER = ""
+
+# Values which are known to fail the cast, these are set to NULL without trying to cast them
+NULL_VALUES = ("NA", "")
+
+# NumPy types for the Python types of the Sqlalchemy columns, other types are casted value by value
+NUMPY_TYPES = {
+    int: np.int64,
+    float: np.float64,
+}
+
+
+class ColumnarCleaner:
+    """
+    Class to clean a batch of rows column by column.
+    For every valid row the result is exactly the same as ETLTask.clean_data.
+    """
+    def __init__(self, header_to_column=None):
+        """
+        Function to prepare the casting rules for every column
+        :param header_to_column: Mapping of CSV headers to LoanApplicationsTable columns,
+                                 by default CSV_HEADER_TO_COLUMN
+        """
+        self.header_to_column = header_to_column or CSV_HEADER_TO_COLUMN
+        self.python_types = {
+            header: getattr(LoanApplicationsTable, column).type.python_type
+            for header, column in self.header_to_column.items()
+        }
+
+    def to_columns(self, rows):
+        """
+        Function to convert a batch of rows to columns
+        :param rows: List of rows as read by csv.DictReader
+        :return: Dictionary of CSV header to the NumPy array of the raw values
+        """
+        return {
+            header: np.asarray([row[header] for row in rows], dtype=object)
+            for header in self.header_to_column
+        }
+
+    @staticmethod
+    def _cast_column(python_type, values):
+        """
+        Function to cast a whole column.
+        Values which can't be casted are set to None, same as the ValueError handling of ETLTask.clean_data.
+        :param python_type: Python type to cast the values in
+        :param values: NumPy object array of raw values
+        :return: Casted values, mask of the values which failed to cast, mask of the missing values
+        """
+        # Short rows are filled with None by csv.DictReader, these can't be casted at all
+        missing = np.equal(values, None)
+        failed = np.zeros(len(values), dtype=bool)
+        for null_value in NULL_VALUES:
+            failed |= values == null_value
+
+        casted = np.full(len(values), None, dtype=object)
+        castable = ~(missing | failed)
+        candidates = values[castable]
+
+        try:
+            # Casting an object array calls the Python type on every value, so the result is the same
+            # as casting them one by one, but the loop runs in NumPy
+            casted[castable] = candidates.astype(NUMPY_TYPES[python_type]).tolist()
+        except (KeyError, ValueError, OverflowError):
+            # At least one value is not castable, falling back to casting value by value for this column
+            casted_candidates = np.full(len(candidates), None, dtype=object)
+            failed_candidates = np.zeros(len(candidates), dtype=bool)
+            for index, value in enumerate(candidates):
+                try:
+                    casted_candidates[index] = python_type(value)
+                except ValueError as _:
+                    failed_candidates[index] = True
+            casted[castable] = casted_candidates
+            failed[castable] = failed_candidates
+
+        return casted, failed, missing
+
+    def clean_batch(self, rows):
+        """
+        Function to clean a batch of rows
+        :param rows: List of rows as read by csv.DictReader
+        :return: Dictionary of CSV header to the casted values and the mask of the valid rows.
+                 A row is invalid if its id is in wrong format or any of its fields is missing.
+        """
+        columns = self.to_columns(rows)
+        valid_mask = np.ones(len(rows), dtype=bool)
+
+        cleaned_columns = {}
+        for header, values in columns.items():
+            casted, failed, missing = self._cast_column(self.python_types[header], values)
+            valid_mask &= ~missing
+            if header == ID_HEADER:
+                valid_mask &= ~failed
+            cleaned_columns[header] = casted
+
+        return cleaned_columns, valid_mask
+
+    @staticmethod
+    def to_rows(cleaned_columns, valid_mask):
+        """
+        Function to convert cleaned columns back to rows, skipping the invalid rows
+        :param cleaned_columns: Dictionary of CSV header to the casted values
+        :param valid_mask: Mask of the valid rows
+        :return: Generator of cleaned rows, same as the output of ETLTask.clean_data
+        """
+        headers = list(cleaned_columns)
+        valid_columns = [cleaned_columns[header][valid_mask].tolist() for header in headers]
+        for values in zip(*valid_columns):
+            yield dict(zip(headers, values))
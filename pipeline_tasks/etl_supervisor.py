@@ -0,0 +1,240 @@
+"""
+Module to supervise a pool of ETL worker processes.
+The supervisor is the only process claiming jobs from the Scanner Table. Every claimed job is sent
+to an idle worker, so the workers never poll the database themselves. Every worker builds its ETLTask,
+and so its connections, once when it starts. Crashed workers are restarted and their job is marked FAILED.
+"""
+import multiprocessing
+import os
+import queue
+import time
+from dataclasses import dataclass
+
+from config_data_classes import DatabaseConfig, S3Config, ETLConfig
+from db_helper import ScannerTable
+from . import BaseTask, ETLTask
+from logging_setup import get_logger
+
+logging = get_logger()
+
+# Seconds to wait for the results of the workers in one iteration of the claiming loop
+RESULT_POLL_TIMEOUT_IN_SECOND = 1
+
+
+def etl_worker_main(worker_id, etl_db_config, reporting_db_config, s3_config, etl_config, job_queue, result_queue):
+    """
+    Function running in every worker process. It processes the jobs sent by the supervisor
+    until it receives None.
+    :param worker_id: Id of the worker
+    :param etl_db_config: ETL database config object
+    :param reporting_db_config: Reporting database config object
+    :param s3_config: S3 config Object
+    :param etl_config: ETL tasks related object
+    :param job_queue: Queue of (job id, files, size in bytes, latest file modified time) sent by the supervisor
+    :param result_queue: Queue of (worker id, job id, rows loaded or None, seconds) sent to the supervisor
+    :return: None
+    """
+    etl_task = ETLTask(etl_db_config=etl_db_config,
+                       reporting_db_config=reporting_db_config,
+                       s3_config=s3_config,
+                       etl_config=etl_config)
+    while True:
+        job = job_queue.get()
+        if job is None:
+            break
+
+        job_id, files, total_size_in_bytes, latest_file_modified_time = job
+        start_time = time.monotonic()
+        loaded_rows = etl_task.process_job(ScannerTable(id=job_id,
+                                                        files=files,
+                                                        total_size_in_bytes=total_size_in_bytes,
+                                                        latest_file_modified_time=latest_file_modified_time))
+        result_queue.put((worker_id, job_id, loaded_rows, time.monotonic() - start_time))
+
+
+@dataclass
+class WorkerStats:
+    """
+    Dataclass for the throughput of a worker
+    """
+    loaded_jobs: int = 0
+    failed_jobs: int = 0
+    restarts: int = 0
+    loaded_rows: int = 0
+    busy_seconds: float = 0.0
+
+    def __str__(self):
+        rows_per_second = self.loaded_rows / self.busy_seconds if self.busy_seconds else 0.0
+        return (f"LoadedJobs: {self.loaded_jobs}, FailedJobs: {self.failed_jobs}, Restarts: {self.restarts}, "
+                f"Rows: {self.loaded_rows}, Rows/s: {rows_per_second:.1f}")
+
+
+class ETLSupervisor(BaseTask):
+    """
+    Class to run a pool of ETL worker processes fed by a single claiming loop
+    """
+    def __init__(self,
+                 etl_db_config: DatabaseConfig,
+                 reporting_db_config: DatabaseConfig,
+                 s3_config: S3Config,
+                 etl_config: ETLConfig,
+                 number_of_workers=0,
+                 poll_interval_in_second=5,
+                 report_interval_in_second=60):
+        """
+        Initialising connection to the ETL Database, the workers connect by themselves
+        :param etl_db_config: ETL database config object
+        :param reporting_db_config: Reporting database config object
+        :param s3_config: S3 config Object
+        :param etl_config: ETL tasks related object
+        :param number_of_workers: Number of worker processes, 0 for the number of available cores
+        :param poll_interval_in_second: Seconds to wait for new jobs when there are none
+        :param report_interval_in_second: Seconds between two throughput reports
+        """
+        super().__init__(etl_db_config=etl_db_config, etl_config=etl_config)
+        self.worker_args = (etl_db_config, reporting_db_config, s3_config, etl_config)
+        if number_of_workers <= 0:
+            number_of_workers = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+        self.number_of_workers = number_of_workers
+        self.poll_interval_in_second = poll_interval_in_second
+        self.report_interval_in_second = report_interval_in_second
+
+        # Spawned, so no connection of the supervisor is shared with the workers
+        self.context = multiprocessing.get_context("spawn")
+        self.result_queue = self.context.Queue()
+        self.workers = {}
+        self.job_queues = {}
+        self.jobs_in_flight = {}
+        self.stats = {worker_id: WorkerStats() for worker_id in range(self.number_of_workers)}
+
+    def _start_worker(self, worker_id):
+        """
+        Function to start a worker process
+        :param worker_id: Id of the worker
+        :return: None
+        """
+        self.job_queues[worker_id] = self.context.Queue()
+        process = self.context.Process(target=etl_worker_main,
+                                       args=(worker_id, *self.worker_args,
+                                             self.job_queues[worker_id], self.result_queue),
+                                       name=f"etl-worker-{worker_id}",
+                                       daemon=True)
+        process.start()
+        self.workers[worker_id] = process
+        logging.log(logging.INFO, f"Started ETL worker {worker_id} with pid {process.pid}")
+
+    def _restart_crashed_workers(self):
+        """
+        Function to restart the crashed workers. The job a crashed worker was processing is marked FAILED.
+        :return: None
+        """
+        for worker_id, process in list(self.workers.items()):
+            if process.is_alive():
+                continue
+
+            logging.log(logging.ERROR, f"ETL worker {worker_id} died with exit code {process.exitcode}")
+            job_id = self.jobs_in_flight.pop(worker_id, None)
+            if job_id is not None:
+                self.etl_db.mark_downloading_from_s3_failed(
+                    job_id=job_id,
+                    err_msg=f"ETL worker {worker_id} died with exit code {process.exitcode}")
+                self.stats[worker_id].failed_jobs += 1
+            self.stats[worker_id].restarts += 1
+            self._start_worker(worker_id)
+
+    def _collect_results(self, timeout):
+        """
+        Function to collect the results sent by the workers
+        :param timeout: Seconds to wait for the first result
+        :return: None
+        """
+        try:
+            while True:
+                worker_id, job_id, loaded_rows, seconds = self.result_queue.get(timeout=timeout)
+                timeout = 0
+                self.jobs_in_flight.pop(worker_id, None)
+
+                stats = self.stats[worker_id]
+                stats.busy_seconds += seconds
+                if loaded_rows is None:
+                    stats.failed_jobs += 1
+                else:
+                    stats.loaded_jobs += 1
+                    stats.loaded_rows += loaded_rows
+                    logging.log(logging.INFO, f"Worker {worker_id} loaded job {job_id}: {loaded_rows} rows "
+                                              f"in {seconds:.1f}s")
+        except queue.Empty:
+            pass
+
+    def _dispatch_jobs(self):
+        """
+        Function to claim one job for every idle worker, all in one round trip.
+        The FAILED jobs whose backoff is over are sent back to the ETL first.
+        :return: Number of jobs dispatched
+        """
+        idle_workers = [worker_id for worker_id in self.workers if worker_id not in self.jobs_in_flight]
+        if not idle_workers:
+            return 0
+
+        retried_job_ids = self.etl_db.schedule_failed_job_retries(
+            max_attempts=self.etl_config.MAX_JOB_ATTEMPTS,
+            backoff_in_second=self.etl_config.RETRY_BACKOFF_IN_SECOND,
+            backoff_multiplier=self.etl_config.RETRY_BACKOFF_MULTIPLIER,
+            max_backoff_in_second=self.etl_config.MAX_RETRY_BACKOFF_IN_SECOND)
+        if retried_job_ids:
+            logging.log(logging.INFO, f"Retrying the failed ETL jobs: {retried_job_ids}")
+
+        etl_job_rows = self.etl_db.claim_etl_jobs(number_of_jobs=len(idle_workers))
+        for worker_id, etl_job_row in zip(idle_workers, etl_job_rows):
+            logging.log(logging.INFO, f"Dispatching the following ETL job to worker {worker_id}: {etl_job_row}")
+            self.jobs_in_flight[worker_id] = etl_job_row.id
+            self.job_queues[worker_id].put((etl_job_row.id, etl_job_row.files, etl_job_row.total_size_in_bytes,
+                                            etl_job_row.latest_file_modified_time))
+        return len(etl_job_rows)
+
+    def report(self):
+        """
+        Function to log the throughput of every worker
+        :return: None
+        """
+        for worker_id, stats in self.stats.items():
+            logging.log(logging.INFO, f"ETL worker {worker_id}: {stats}")
+
+    def stop(self):
+        """
+        Function to stop all the workers once they finish their current job
+        :return: None
+        """
+        for job_queue in self.job_queues.values():
+            job_queue.put(None)
+        for process in self.workers.values():
+            process.join()
+        self.report()
+
+    def run(self):
+        """
+        Function to run the claiming loop until the process is killed
+        :return: None
+        """
+        logging.log(logging.INFO, f"ETL supervisor started with {self.number_of_workers} workers")
+        for worker_id in range(self.number_of_workers):
+            self._start_worker(worker_id)
+
+        last_report_time = time.monotonic()
+        try:
+            while True:
+                # Results first, a worker which exited after finishing its job didn't crash on it
+                self._collect_results(timeout=0)
+                self._restart_crashed_workers()
+                dispatched_jobs = self._dispatch_jobs()
+
+                # Wait less if there is work, more if all the workers are idle
+                all_idle = not self.jobs_in_flight and not dispatched_jobs
+                self._collect_results(timeout=self.poll_interval_in_second if all_idle
+                                      else RESULT_POLL_TIMEOUT_IN_SECOND)
+
+                if time.monotonic() - last_report_time >= self.report_interval_in_second:
+                    self.report()
+                    last_report_time = time.monotonic()
+        finally:
+            self.stop()
@@ -1,10 +1,21 @@
 """
 Module to handle the ETL
 """
-from db_helper import LoanApplicationsTable, DatabaseConnector
+from db_helper import (LoanApplicationsTable, ScannerJobFileTable, ScannerStatusEnum, JobMetricsTable,
+                       JobStageMetricsTable, DatabaseConnector, ReportingDatabaseConnector, CSV_HEADER_TO_COLUMN)
 from config_data_classes import DatabaseConfig, S3Config, ETLConfig
 from . import BaseTask
+from .columnar_cleaner import ColumnarCleaner
+from .streaming_imputer import StreamingImputer
+from .staged_executor import StagedExecutor, Stage
+from s3_prefetcher import S3Prefetcher, InFlightBytesBudget
 import constants
+import metrics
+from functools import partial
+from itertools import islice
+import io
+import sys
+import time
 import traceback
 from logging_setup import get_logger
 
@@ -31,6 +42,13 @@ class ETLTask(BaseTask):
                          reporting_db_config=reporting_db_config,
                          s3_config=s3_config,
                          etl_config=etl_config)
+        self.columnar_cleaner = ColumnarCleaner()
+        # Recorder of the stages of the job being processed
+        self.recorder = metrics.MetricsRecorder()
+        # Ingest hour of the job being processed, the hour of its aggregates
+        self.ingest_hour = None
+        # Imputer of the job being processed, None if STREAMING_IMPUTATION is off
+        self.imputer = None
 
     def clean_data(self, row):
         """
@@ -116,68 +134,501 @@ class ETLTask(BaseTask):
 
         return cleaned_row
 
+    def clean_data_batch(self, rows):
+        """
+        Function to clean a batch of rows column by column. The cleaned rows are exactly the same as clean_data.
+        :param rows: List of rows of data
+        :return: Dictionary of CSV header to cleaned values and the mask of valid rows
+        """
+        return self.columnar_cleaner.clean_batch(rows)
+
+    @staticmethod
+    def to_reporting_row(cleaned_row):
+        """
+        Function to convert a cleaned row to the columns of LoanApplicationsTable
+        :param cleaned_row: cleaned row of data
+        :return: Dictionary of LoanApplicationsTable column name to value
+        """
+        # The imputed columns are added to the cleaned row with their column name
+        return {CSV_HEADER_TO_COLUMN.get(header, header): value for header, value in cleaned_row.items()}
+
+    def _read_job_files(self, s3_urls):
+        """
+        Function to stream the files of a job. If PREFETCH_FILES is set, the next files are
+        downloaded in the background while a file is processed. Else if RANGED_READ_PART_SIZE_IN_BYTES is set,
+        the big files are read in byte ranges in parallel.
+        :param s3_urls: S3 URLs of the files of the job
+        :return: Generator of S3 URL and its rows
+        """
+        if self.etl_config.PREFETCH_FILES > 0:
+            with S3Prefetcher(self.s3_helper, s3_urls,
+                              max_prefetch_files=self.etl_config.PREFETCH_FILES,
+                              max_in_flight_bytes=self.etl_config.PREFETCH_MAX_IN_FLIGHT_BYTES) as prefetcher:
+                yield from prefetcher
+        elif self.etl_config.RANGED_READ_PART_SIZE_IN_BYTES > 0:
+            for s3_url in s3_urls:
+                yield s3_url, self.s3_helper.read_csv_ranged(
+                    s3_url,
+                    part_size_in_bytes=self.etl_config.RANGED_READ_PART_SIZE_IN_BYTES,
+                    max_workers=self.etl_config.RANGED_READ_WORKERS,
+                    preserve_order=self.etl_config.RANGED_READ_PRESERVE_ORDER)
+        else:
+            for s3_url in s3_urls:
+                yield s3_url, self.s3_helper.read_csv(s3_url)
+
+    def _impute_rows(self, cleaned_rows, imputer):
+        """
+        Function to add the imputed columns to the cleaned rows, measured as the impute stage
+        :param cleaned_rows: Iterable of cleaned rows
+        :param imputer: StreamingImputer of the job
+        :return: Generator of cleaned rows with the imputed columns
+        """
+        for cleaned_row in cleaned_rows:
+            with self.recorder.stage(metrics.IMPUTE):
+                cleaned_row = imputer.impute(cleaned_row)
+            self.recorder.add(metrics.IMPUTE, row_count=1)
+            yield cleaned_row
+
+    def _clean_rows(self, s3_url, rows, imputer=None):
+        """
+        Function to stream the cleaned rows of a file. If CLEANING_BATCH_SIZE is set,
+        the rows are cleaned in batches, else one row at a time.
+        If the job has an imputer, the cleaned rows are imputed in the same pass.
+        :param s3_url: full S3 URl of the file
+        :param rows: Rows of the file
+        :param imputer: StreamingImputer of the job, self.imputer if None
+        :return: Generator of cleaned rows
+        """
+        imputer = imputer or self.imputer
+        cleaned_rows = self._clean_rows_without_imputation(s3_url, rows)
+        if imputer is None:
+            return cleaned_rows
+        return self._impute_rows(cleaned_rows, imputer)
+
+    def _clean_rows_without_imputation(self, s3_url, rows):
+        """
+        Function to stream the cleaned rows of a file, see _clean_rows
+        :param s3_url: full S3 URl of the file
+        :param rows: Rows of the file
+        :return: Generator of cleaned rows
+        """
+        rows = iter(rows)
+        batch_size = self.etl_config.CLEANING_BATCH_SIZE
+
+        if batch_size > 0:
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+
+                with self.recorder.stage(metrics.CLEAN_DATA):
+                    cleaned_columns, valid_mask = self.clean_data_batch(batch)
+                    cleaned_rows = list(self.columnar_cleaner.to_rows(cleaned_columns, valid_mask))
+                self.recorder.add(metrics.CLEAN_DATA, row_count=len(cleaned_rows))
+
+                skipped_rows = len(batch) - len(cleaned_rows)
+                if skipped_rows:
+                    self.recorder.add_skipped_rows(skipped_rows)
+                    logging.log(logging.WARNING,
+                                f"Skipping {skipped_rows} rows of {s3_url} due to wrong id format or missing fields")
+                yield from cleaned_rows
+        else:
+            for row in rows:
+                self.recorder.start(metrics.CLEAN_DATA)
+                try:
+                    # 3. Clean data
+                    cleaned_row = self.clean_data(row)
+                    self.recorder.stop(row_count=1)
+                except TypeError as err:
+                    self.recorder.stop()
+                    self.recorder.add_skipped_rows(1)
+                    logging.log(logging.WARNING, err)
+                    logging.log(logging.WARNING,
+                                f"Skipping following row due to the above mentioned error: {row}")
+                    continue
+
+                if "NA" in row.values():
+                    logging.log(logging.DEBUG, f"Original Row: {row}")
+                    logging.log(logging.DEBUG, f"Cleaned Row: {cleaned_row}")
+
+                yield cleaned_row
+
+    def _bulk_load(self, rows, table_name=LoanApplicationsTable.__tablename__):
+        """
+        Function to load rows in the Reporting database with LOAD_STRATEGY, measured as the insert stage
+        :param rows: List of LoanApplicationsTable column dictionaries
+        :param table_name: Table to load into
+        :return: Number of rows loaded
+        """
+        with self.recorder.stage(metrics.INSERT):
+            loaded_rows = self.reporting_db.bulk_load(rows,
+                                                      strategy=self.etl_config.LOAD_STRATEGY,
+                                                      batch_size=self.etl_config.LOAD_BATCH_SIZE,
+                                                      table_name=table_name)
+        self.recorder.add(metrics.INSERT, row_count=loaded_rows)
+        if loaded_rows < len(rows):
+            logging.log(logging.WARNING, f"Skipped {len(rows) - loaded_rows} rows already in {table_name}, "
+                                         f"e.g. duplicate ids")
+        return loaded_rows
+
+    def _merge_staging_table(self, job_id):
+        """
+        Function to merge the staging table of a job into loan_applications and update the aggregates,
+        measured as the insert stage
+        :param job_id: ETL job id
+        :return: Number of rows merged
+        """
+        with self.recorder.stage(metrics.INSERT):
+            return self.reporting_db.merge_staging_table(job_id, ingest_hour=self.ingest_hour)
+
+    def _load_staged(self, job_id, rows):
+        """
+        Function to load the rows of a job in its staging table and merge it into loan_applications,
+        so a retried job never duplicates the rows of a previous attempt
+        :param job_id: ETL job id
+        :param rows: List of LoanApplicationsTable column dictionaries
+        :return: Number of rows loaded
+        """
+        staging_table = self.reporting_db.create_staging_table(job_id)
+        try:
+            self._bulk_load(rows, table_name=staging_table)
+            return self._merge_staging_table(job_id)
+        finally:
+            self.reporting_db.drop_staging_table(job_id)
+
+    @staticmethod
+    def _estimate_row_size(row):
+        """
+        Function to estimate the memory held by a row
+        :param row: Dictionary of column name to value
+        :return: Size in bytes
+        """
+        return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row.values())
+
+    def _load_job_in_memory(self, job_id, s3_urls):
+        """
+        Function to read all the files of a job in memory and load them through its staging table
+        :param job_id: ETL job id
+        :param s3_urls: S3 URLs of the files of the job
+        :return: Number of rows loaded
+        """
+        new_rows: [dict] = []
+        for s3_url, rows in self._read_job_files(s3_urls):
+            logging.log(logging.INFO, f"Streaming data from the {s3_url}")
+            for cleaned_row in self._clean_rows(s3_url, rows):
+                new_rows.append(self.to_reporting_row(cleaned_row))
+
+        # 4. Write to MySql
+        return self._load_staged(job_id, new_rows)
+
+    def _resumable_checkpoint(self, job_id):
+        """
+        Function to get the checkpoint from which a job resumes. The checkpoint is used only if the staging table
+        of the job holds exactly the rows of the checkpoint, e.g. not if the job failed between a flush
+        and the save of its checkpoint.
+        :param job_id: ETL job id
+        :return: JobCheckpointTable row, None to load the job from the start
+        """
+        checkpoint = self.etl_db.get_job_checkpoint(job_id)
+        if checkpoint is None or not checkpoint.loaded_rows:
+            return None
+
+        staged_rows = self.reporting_db.count_staging_rows(job_id)
+        if staged_rows != checkpoint.loaded_rows:
+            logging.log(logging.WARNING, f"Job {job_id} is loaded from the start, its staging table has "
+                                         f"{staged_rows} rows instead of the {checkpoint.loaded_rows} of {checkpoint}")
+            return None
+        return checkpoint
+
+    def _load_job_streaming(self, job_id, s3_urls):
+        """
+        Function to stream the files of a job to its staging table, flushing every STREAMING_FLUSH_ROWS rows
+        or STREAMING_FLUSH_BYTES bytes. Once all the files are loaded, the staging table is merged into
+        loan_applications in one statement, so the job is still loaded as one unit.
+        The progress is checkpointed after every flush and the staging table is kept if the job fails,
+        so a retried job skips the files and the rows which are already in the staging table.
+        :param job_id: ETL job id
+        :param s3_urls: S3 URLs of the files of the job
+        :return: Number of rows loaded
+        """
+        flush_rows = self.etl_config.STREAMING_FLUSH_ROWS
+        flush_bytes = self.etl_config.STREAMING_FLUSH_BYTES
+
+        checkpoint = self._resumable_checkpoint(job_id)
+        if checkpoint is None:
+            staging_table = self.reporting_db.create_staging_table(job_id)
+            first_file_index, row_offset, loaded_rows = 0, 0, 0
+            self.etl_db.save_job_checkpoint(job_id, file_index=0, row_offset=0, loaded_rows=0)
+        else:
+            staging_table = self.reporting_db.staging_table_name(job_id)
+            first_file_index, row_offset, loaded_rows = (checkpoint.file_index, checkpoint.row_offset,
+                                                         checkpoint.loaded_rows)
+            logging.log(logging.INFO, f"Resuming job {job_id} from file {first_file_index}, row {row_offset}, "
+                                      f"{loaded_rows} rows are already in {staging_table}")
+
+        buffered_rows: [dict] = []
+        buffered_bytes = 0
+        for file_index, (s3_url, rows) in enumerate(self._read_job_files(s3_urls[first_file_index:]),
+                                                    start=first_file_index):
+            logging.log(logging.INFO, f"Streaming data from the {s3_url} to {staging_table}")
+            cleaned_rows = self._clean_rows(s3_url, rows)
+            file_rows = 0
+            if file_index == first_file_index and row_offset:
+                # The cleaning is deterministic, so the first cleaned rows are the ones already loaded
+                file_rows = sum(1 for _ in islice(cleaned_rows, row_offset))
+
+            for cleaned_row in cleaned_rows:
+                reporting_row = self.to_reporting_row(cleaned_row)
+                buffered_rows.append(reporting_row)
+                buffered_bytes += self._estimate_row_size(reporting_row)
+                file_rows += 1
+
+                if ((flush_rows and len(buffered_rows) >= flush_rows)
+                        or (flush_bytes and buffered_bytes >= flush_bytes)):
+                    loaded_rows += self._bulk_load(buffered_rows, table_name=staging_table)
+                    self.etl_db.save_job_checkpoint(job_id, file_index=file_index, row_offset=file_rows,
+                                                    loaded_rows=loaded_rows)
+                    buffered_rows = []
+                    buffered_bytes = 0
+
+        self._bulk_load(buffered_rows, table_name=staging_table)
+
+        # 4. Write to MySql
+        merged_rows = self._merge_staging_table(job_id)
+        self.reporting_db.drop_staging_table(job_id)
+        return merged_rows
+
+    def _download_file(self, budget, indexed_s3_url):
+        """
+        Download stage of the pipelined execution. The content of a file is held in memory until it is parsed,
+        the download waits until the file fits in the budget of in flight bytes.
+        :param budget: InFlightBytesBudget of the job
+        :param indexed_s3_url: Index of the file in the job and its full S3 URl
+        :return: Generator of the S3 URL, the content of the file and the budget it holds
+        """
+        index, s3_url = indexed_s3_url
+        try:
+            stream, size = self.s3_helper.open_object(s3_url)
+        except Exception:
+            # The turn of this file must still pass, else the next files wait forever
+            budget.acquire(index, 0)
+            raise
+
+        try:
+            budget.acquire(index, size)
+            try:
+                data = stream.read()
+            except Exception:
+                budget.release(size)
+                raise
+        finally:
+            stream.close()
+        yield s3_url, data, size
+
+    def _parse_file(self, budget, downloaded_file):
+        """
+        Parse stage of the pipelined execution, the budget of the file is released once it is parsed
+        :param budget: InFlightBytesBudget of the job
+        :param downloaded_file: S3 URL, the content of the file and the budget it holds
+        :return: Generator of the S3 URL and a batch of rows
+        """
+        s3_url, data, size = downloaded_file
+        try:
+            logging.log(logging.INFO, f"Parsing data of the {s3_url}")
+            rows = self.s3_helper.parse_csv(io.BytesIO(data), s3_url=s3_url)
+            batch_size = self.etl_config.CLEANING_BATCH_SIZE or self.etl_config.LOAD_BATCH_SIZE
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                yield s3_url, batch
+        finally:
+            del data
+            budget.release(size)
+
+    def _clean_batch(self, parsed_batch):
+        """
+        Clean stage of the pipelined execution
+        :param parsed_batch: S3 URL and a batch of rows
+        :return: Generator of the batch of cleaned rows as LoanApplicationsTable columns
+        """
+        s3_url, batch = parsed_batch
+        yield [self.to_reporting_row(cleaned_row) for cleaned_row in self._clean_rows(s3_url, batch)]
+
+    def _load_batch(self, staging_table, reporting_rows):
+        """
+        Load stage of the pipelined execution
+        :param staging_table: Staging table of the job
+        :param reporting_rows: Batch of cleaned rows as LoanApplicationsTable columns
+        :return: Nothing, it is the last stage
+        """
+        self._bulk_load(reporting_rows, table_name=staging_table)
+        return []
+
+    def _load_job_pipelined(self, job_id, s3_urls):
+        """
+        Function to run the download, parse, clean and load of a job as stages on bounded queues,
+        so the network, the CPU and the database are busy at the same time. The batches are loaded
+        to the staging table of the job, which is merged into loan_applications once all the stages are done.
+        The downloaded files waiting to be parsed are bounded by PREFETCH_MAX_IN_FLIGHT_BYTES,
+        the queues only bound the number of items.
+        :param job_id: ETL job id
+        :param s3_urls: S3 URLs of the files of the job
+        :return: Number of rows loaded
+        """
+        staging_table = self.reporting_db.create_staging_table(job_id)
+        queue_size = self.etl_config.PIPELINE_QUEUE_SIZE
+        budget = InFlightBytesBudget(self.etl_config.PREFETCH_MAX_IN_FLIGHT_BYTES)
+
+        try:
+            executor = StagedExecutor([
+                Stage(name="download", function=partial(self._download_file, budget),
+                      workers=self.etl_config.PIPELINE_DOWNLOAD_WORKERS, queue_size=queue_size),
+                Stage(name="parse", function=partial(self._parse_file, budget),
+                      workers=self.etl_config.PIPELINE_PARSE_WORKERS, queue_size=queue_size),
+                Stage(name="clean", function=self._clean_batch,
+                      workers=self.etl_config.PIPELINE_CLEAN_WORKERS, queue_size=queue_size),
+                Stage(name="load", function=partial(self._load_batch, staging_table),
+                      workers=self.etl_config.PIPELINE_LOAD_WORKERS, queue_size=queue_size),
+            ], on_stop=budget.close)
+            processed_items = executor.run(enumerate(s3_urls))
+            logging.log(logging.INFO, f"Pipelined execution of job {job_id} processed: {processed_items}")
+
+            # 4. Write to MySql
+            return self._merge_staging_table(job_id)
+        finally:
+            self.reporting_db.drop_staging_table(job_id)
+
+    def _load_job_ranges(self, job_id, job_files):
+        """
+        Function to read the byte ranges of a job in memory and load them through its staging table,
+        for the jobs of a file split by the Scanner
+        :param job_id: ETL job id
+        :param job_files: ScannerJobFileTable rows of the job
+        :return: Number of rows loaded
+        """
+        new_rows: [dict] = []
+        for job_file in job_files:
+            logging.log(logging.INFO, f"Reading bytes {job_file.range_start}-{job_file.range_end} "
+                                      f"of the {job_file.file_path}")
+            rows = self.s3_helper.read_csv_part(job_file.file_path, job_file.range_start, job_file.range_end)
+            for cleaned_row in self._clean_rows(job_file.file_path, rows):
+                new_rows.append(self.to_reporting_row(cleaned_row))
+
+        # 4. Write to MySql
+        return self._load_staged(job_id, new_rows)
+
+    def _job_files(self, etl_job_row):
+        """
+        Function to get the files of a job from the ScannerJobFileTable,
+        the jobs created before that table have their files in the `files` column
+        :param etl_job_row: ScannerTable row of the job
+        :return: List of ScannerJobFileTable rows in processing order
+        """
+        return (self.etl_db.get_job_files(job_id=etl_job_row.id)
+                or [ScannerJobFileTable(file_path=s3_url)
+                    for s3_url in etl_job_row.files.split(constants.MULTI_FILE_PATH_SEPARATOR)])
+
+    def schedule_retries(self):
+        """
+        Function to send the FAILED jobs back to the ETL once their backoff is over, up to MAX_JOB_ATTEMPTS attempts
+        :return: List of the retried job ids
+        """
+        job_ids = self.etl_db.schedule_failed_job_retries(
+            max_attempts=self.etl_config.MAX_JOB_ATTEMPTS,
+            backoff_in_second=self.etl_config.RETRY_BACKOFF_IN_SECOND,
+            backoff_multiplier=self.etl_config.RETRY_BACKOFF_MULTIPLIER,
+            max_backoff_in_second=self.etl_config.MAX_RETRY_BACKOFF_IN_SECOND)
+        if job_ids:
+            logging.log(logging.INFO, f"Retrying the failed ETL jobs: {job_ids}")
+        return job_ids
+
+    def process_job(self, etl_job_row):
+        """
+        Function to download, clean and load all the files of a job and mark it LOADED or FAILED
+        :param etl_job_row: ScannerTable row of the job
+        :return: Number of rows loaded, None if the job failed
+        """
+        start_time = time.monotonic()
+        self.recorder = self.s3_helper.recorder = metrics.MetricsRecorder()
+        self.ingest_hour = ReportingDatabaseConnector.ingest_hour(etl_job_row.latest_file_modified_time)
+        self.imputer = None
+        try:
+            if self.etl_config.STREAMING_IMPUTATION:
+                # The imputation of the job starts from the sketches of all the previous jobs
+                self.imputer = StreamingImputer(self.reporting_db.get_imputation_sketches())
+
+            # 2. Fetch the files of the job and download all the files from S3
+            job_files = self._job_files(etl_job_row)
+            s3_urls = [job_file.file_path for job_file in job_files]
+
+            if any(job_file.range_start is not None for job_file in job_files):
+                loaded_rows = self._load_job_ranges(job_id=etl_job_row.id, job_files=job_files)
+            elif self.etl_config.PIPELINED_EXECUTION:
+                loaded_rows = self._load_job_pipelined(job_id=etl_job_row.id, s3_urls=s3_urls)
+            elif self.etl_config.STREAMING_FLUSH_ROWS or self.etl_config.STREAMING_FLUSH_BYTES:
+                loaded_rows = self._load_job_streaming(job_id=etl_job_row.id, s3_urls=s3_urls)
+            else:
+                loaded_rows = self._load_job_in_memory(job_id=etl_job_row.id, s3_urls=s3_urls)
+
+            job_metrics = JobMetricsTable(job_id=etl_job_row.id,
+                                          total_size_in_bytes=etl_job_row.total_size_in_bytes or 0,
+                                          loaded_rows=loaded_rows,
+                                          skipped_rows=self.recorder.skipped_rows,
+                                          processing_seconds=time.monotonic() - start_time)
+            job_stage_metrics = [JobStageMetricsTable(job_id=etl_job_row.id,
+                                                      stage=stage_name,
+                                                      seconds=stage_metrics.seconds,
+                                                      calls=stage_metrics.calls,
+                                                      size_in_bytes=stage_metrics.bytes,
+                                                      rows=stage_metrics.rows)
+                                 for stage_name, stage_metrics in self.recorder.snapshot().items()]
+            self.etl_db.mark_downloading_from_s3_success(job_id=etl_job_row.id,
+                                                         job_metrics=job_metrics,
+                                                         job_stage_metrics=job_stage_metrics)
+            metrics.EXPORTER.record("etl", self.recorder, ScannerStatusEnum.LOADED.value)
+            logging.log(logging.INFO, f"Job metrics: {job_metrics}")
+            logging.log(logging.INFO, f"Stage metrics: {self.recorder}")
+            logging.log(logging.INFO, f"Successfully loaded {loaded_rows} rows from {len(s3_urls)} files to database.")
+            logging.log(logging.INFO, f"Successfully processed ETL Job with ID: {etl_job_row.id}")
+            if self.s3_helper.cache is not None:
+                logging.log(logging.INFO, f"S3 cache: {self.s3_helper.cache.stats()}")
+            return loaded_rows
+        except:
+            # If for some reason the download or upload fails, we should mark the job as failed too
+            failed_attempts = self.etl_db.mark_downloading_from_s3_failed(job_id=etl_job_row.id,
+                                                                          err_msg=traceback.format_exc()[:4096])
+            # The staging table is kept for the retries of the job only
+            if failed_attempts >= self.etl_config.MAX_JOB_ATTEMPTS:
+                self.reporting_db.drop_staging_table(etl_job_row.id)
+            metrics.EXPORTER.record("etl", self.recorder, ScannerStatusEnum.FAILED.value)
+            logging.exception(traceback.format_exc())
+            return None
+
     def run(self):
         """
         Function to run the whole ETL pipeline. Since ETL processes, ONE JOB at a time,
         it runs until there are no jobs in the Scanner Table with the status SENT_FOR_ETL.
-        :return: None
+        :return: Number of processed jobs
         """
+        number_of_jobs = 0
         while True:
-            # 1. Fetch one job at a time
-            etl_job_row = self.etl_db.get_latest_etl_job()
-            logging.log(logging.INFO, f"Started the following ETL job: {etl_job_row}")
-
-            if etl_job_row is not None:
-                # 2. Split files and download all the files from S3
-                s3_urls = etl_job_row.files.split(constants.MULTI_FILE_PATH_SEPARATOR)
-
-                new_rows: [LoanApplicationsTable] = []
-                for s3_url in s3_urls:
-                    logging.log(logging.INFO, f"Streaming data from the {s3_url}")
-                    for row in self.s3_helper.read_csv(s3_url):
-                        try:
-                            # 3. Clean data
-                            cleaned_row = self.clean_data(row)
-                        except TypeError as err:
-                            logging.log(logging.WARNING, err)
-                            logging.log(logging.WARNING,
-                                        f"Skipping following row due to the above mentioned error: {row}")
-                            continue
-
-                        if "NA" in row.values():
-                            logging.log(logging.DEBUG, f"Original Row: {row}")
-                            logging.log(logging.DEBUG, f"Cleaned Row: {cleaned_row}")
-
-                        # 4. Write to MySql
-                        reporting_row = LoanApplicationsTable(
-                            id=cleaned_row[""],
-                            serious_dlqin_2_yrs=cleaned_row["SeriousDlqin2yrs"],
-                            revolving_utilization_of_unsecured_lines=
-                            cleaned_row["RevolvingUtilizationOfUnsecuredLines"],
-                            age=cleaned_row["age"],
-                            number_of_time_30_59_days_past_due_not_worse=
-                            cleaned_row["NumberOfTime30-59DaysPastDueNotWorse"],
-                            debt_ratio=cleaned_row["DebtRatio"],
-                            monthly_income=cleaned_row["MonthlyIncome"],
-                            number_of_open_credit_lines_and_loans=cleaned_row["NumberOfOpenCreditLinesAndLoans"],
-                            number_of_time_90_days_late=cleaned_row["NumberOfTimes90DaysLate"],
-                            number_real_estate_loans_or_lines=cleaned_row["NumberRealEstateLoansOrLines"],
-                            number_of_times_60_89_days_past_due_not_worse=
-                            cleaned_row["NumberOfTime60-89DaysPastDueNotWorse"],
-                            number_of_dependents=cleaned_row["NumberOfDependents"]
-                        )
-                        new_rows.append(reporting_row)
-                try:
-                    self.reporting_db.create_new_jobs(new_rows)
-                    self.etl_db.mark_downloading_from_s3_success(job_id=etl_job_row.id)
-                    logging.log(logging.INFO, f"Successfully loaded rows from {s3_urls} to database.")
-                    logging.log(logging.INFO, f"Successfully processed ETL Job with ID: {etl_job_row.id}")
-                except:
-                    # If for some reason the upload fails, we should mark the job as failed too
-                    self.etl_db.mark_downloading_from_s3_failed(job_id=etl_job_row.id,
-                                                                err_msg=traceback.format_exc()[:4096])
-                    logging.exception(traceback.format_exc())
-                    continue
-            else:
+            # 1. Send the FAILED jobs whose backoff is over back to the ETL, then
+            #    claim JOB_CLAIM_BATCH_SIZE jobs at a time and process them one by one.
+            #    The jobs of a batch wait for this worker, see JOB_CLAIM_BATCH_SIZE
+            self.schedule_retries()
+            etl_job_rows = self.etl_db.claim_etl_jobs(number_of_jobs=max(self.etl_config.JOB_CLAIM_BATCH_SIZE, 1))
+            if not etl_job_rows:
                 logging.log(logging.INFO, "No more ETL Jobs to process.")
-                break
+                return number_of_jobs
+
+            unprocessed_job_ids = [etl_job_row.id for etl_job_row in etl_job_rows]
+            try:
+                for etl_job_row in etl_job_rows:
+                    logging.log(logging.INFO, f"Started the following ETL job: {etl_job_row}")
+                    unprocessed_job_ids.remove(etl_job_row.id)
+                    self.process_job(etl_job_row)
+                    number_of_jobs += 1
+            finally:
+                # Nothing reclaims a PROCESSING job, the rest of the batch goes back to the other workers
+                self.etl_db.release_etl_jobs(unprocessed_job_ids)
@@ -0,0 +1,206 @@
+"""
+Module to handle the event driven Scanner.
+The new files come from the object created events of the bucket instead of the listing of the prefixes,
+so a file is in a job within EVENT_BATCH_MAX_LATENCY_IN_SECOND of its upload.
+The listing of the ScannerTask still runs every EVENT_RECONCILIATION_INTERVAL_IN_SECOND, it only creates
+jobs for the files whose event was lost.
+"""
+import time
+from datetime import timedelta as td
+
+from s3_helper import S3FileObject
+from s3_events import SQSEventQueue, LocalEventQueue, parse_object_created_events
+from .scanner_task import ScannerTask
+import metrics
+import constants
+from config_data_classes import DatabaseConfig, S3Config, ETLConfig
+from logging_setup import get_logger
+
+logging = get_logger()
+
+
+class EventScannerTask(ScannerTask):
+    """
+    Class to create the jobs from the object created events of the bucket
+    """
+    def __init__(self, etl_db_config: DatabaseConfig, s3_config: S3Config, etl_config: ETLConfig,
+                 event_queue=None):
+        """
+        Initialising connection to S3, ETL Database and the event queue
+        :param etl_db_config: ETL database config object
+        :param s3_config: S3 config Object
+        :param etl_config: ETL tasks related object
+        :param event_queue: Queue to use instead of the one of s3_config, e.g. s3_events.LocalEventQueue
+        """
+        super().__init__(etl_db_config=etl_db_config,
+                         s3_config=s3_config,
+                         etl_config=etl_config)
+        if event_queue is not None:
+            self.event_queue = event_queue
+        elif s3_config.EVENT_QUEUE_LOCAL_DIR:
+            # A message not deleted is received again after the visibility timeout,
+            # it must be longer than a batch waits
+            self.event_queue = LocalEventQueue(
+                s3_config.EVENT_QUEUE_LOCAL_DIR,
+                visibility_timeout_in_second=max(300, 2 * etl_config.EVENT_BATCH_MAX_LATENCY_IN_SECOND)
+            )
+        else:
+            self.event_queue = SQSEventQueue(s3_config.EVENT_QUEUE_URL,
+                                             access_key=s3_config.AWS_ACCESS_KEY,
+                                             secret_key=s3_config.AWS_SECRET_KEY)
+
+        self._init_batch()
+        # None until the first reconciliation, which runs at the start
+        self.last_reconciliation_time = None
+
+    def _init_batch(self):
+        """
+        Function to start a new empty batch
+        :return: None
+        """
+        # Files of the batch by path, an event delivered twice is in the batch once
+        self.batch_files = {}
+        self.batch_size_in_bytes = 0
+        # Receipt handles of the messages, deleted once the jobs of the batch are inserted
+        self.batch_receipt_handles = []
+        self.batch_start_time = None
+        self.batch_job_size_in_bytes = None
+
+    def _add_to_batch(self, new_files: [S3FileObject]):
+        """
+        Function to add the files of an event to the batch
+        :param new_files: List of S3FileObject
+        :return: None
+        """
+        for new_file in new_files:
+            if new_file.file_path in self.batch_files:
+                continue
+            if self.batch_start_time is None:
+                self.batch_start_time = time.monotonic()
+                # The size of the jobs is computed once per batch, it may query the job metrics
+                self.batch_job_size_in_bytes = self._job_size_in_bytes()
+            self.batch_files[new_file.file_path] = new_file
+            self.batch_size_in_bytes += self._estimated_file_size(new_file)
+
+    def _batch_is_ready(self):
+        """
+        Function to check if the batch is big enough or waited long enough to become jobs
+        :return: Boolean
+        """
+        if self.batch_start_time is None:
+            return False
+        return (self.batch_size_in_bytes >= self.batch_job_size_in_bytes
+                or len(self.batch_files) >= self.etl_config.MAX_FILES_PER_JOB
+                or time.monotonic() - self.batch_start_time >= self.etl_config.EVENT_BATCH_MAX_LATENCY_IN_SECOND)
+
+    def _remaining_batch_latency(self):
+        """
+        Function to get the seconds until the batch must become jobs
+        :return: Seconds, None if the batch is empty
+        """
+        if self.batch_start_time is None:
+            return None
+        return max(self.etl_config.EVENT_BATCH_MAX_LATENCY_IN_SECOND - (time.monotonic() - self.batch_start_time), 0)
+
+    def _create_jobs_of_new_files(self, new_files: [S3FileObject], job_size_in_bytes=None):
+        """
+        Function to create the jobs of the files which are not already in a job.
+        An event can be delivered more than once, and the reconciliation lists the files of the events.
+        :param new_files: List of S3FileObject
+        :param job_size_in_bytes: Size of a job, computed from the job metrics if None
+        :return: Number of new jobs
+        """
+        scanned_files = self.etl_db.get_scanned_files([new_file.file_path for new_file in new_files])
+        new_files = sorted(new_file for new_file in new_files
+                           if (new_file.file_path, new_file.etag) not in scanned_files)
+        if not new_files:
+            return 0
+
+        new_jobs = self._create_new_jobs(new_files, job_size_in_bytes=job_size_in_bytes or self._job_size_in_bytes())
+        self.etl_db.create_new_jobs(rows=new_jobs)
+        return len(new_jobs)
+
+    def flush_batch(self):
+        """
+        Function to create the jobs of the batch and delete its messages
+        :return: Number of new jobs
+        """
+        number_of_jobs = 0
+        if self.batch_files:
+            number_of_jobs = self._create_jobs_of_new_files(list(self.batch_files.values()),
+                                                            job_size_in_bytes=self.batch_job_size_in_bytes)
+            logging.log(logging.INFO, f"Created {number_of_jobs} new ETL jobs from the events of "
+                                      f"{len(self.batch_files)} files.")
+        # The messages are deleted only once the jobs are inserted
+        if self.batch_receipt_handles:
+            self.event_queue.delete(self.batch_receipt_handles)
+        self._init_batch()
+        return number_of_jobs
+
+    def reconcile(self):
+        """
+        Function to list the prefixes of the last EVENT_RECONCILIATION_LOOKBACK_IN_SECOND before the latest
+        scanned file and create the jobs of the files whose event was lost
+        :return: Number of new jobs
+        """
+        logging.log(logging.INFO, "Scanner reconciliation started!")
+        recorder = self.s3_helper.recorder = metrics.MetricsRecorder()
+        # The batch first, its files aren't in a job yet
+        self.flush_batch()
+
+        from_time = max(self.etl_db.get_scanner_latest_modified_time()
+                        - td(seconds=self.etl_config.EVENT_RECONCILIATION_LOOKBACK_IN_SECOND),
+                        constants.MINIMUM_TIME)
+        list_of_new_file_obj, _ = self._list_prefixes(self._generate_prefixes(from_time=from_time), from_time)
+
+        number_of_jobs = 0
+        if list_of_new_file_obj:
+            number_of_jobs = self._create_jobs_of_new_files(list_of_new_file_obj)
+        if number_of_jobs:
+            logging.log(logging.WARNING, f"Created {number_of_jobs} new ETL jobs from the files without an event.")
+        else:
+            logging.log(logging.INFO, "No file without an event!")
+
+        self.last_reconciliation_time = time.monotonic()
+        metrics.EXPORTER.record("scanner", recorder, "RECONCILED")
+        logging.log(logging.INFO, f"Scanner reconciliation stage metrics: {recorder}")
+        return number_of_jobs
+
+    def run_once(self):
+        """
+        Function to receive the next events and create the jobs of the batch once it is ready.
+        It waits for the events at most until the batch must become jobs.
+        :return: None
+        """
+        if (self.last_reconciliation_time is None
+                or time.monotonic() - self.last_reconciliation_time
+                >= self.etl_config.EVENT_RECONCILIATION_INTERVAL_IN_SECOND):
+            self.reconcile()
+
+        wait_time_in_second = self._remaining_batch_latency()
+        if wait_time_in_second is None:
+            wait_time_in_second = self.etl_config.EVENT_BATCH_MAX_LATENCY_IN_SECOND
+        messages = self.event_queue.receive(wait_time_in_second=wait_time_in_second)
+        for receipt_handle, body in messages:
+            try:
+                self._add_to_batch(parse_object_created_events(body, bucket=self.s3_helper.bucket_name))
+            except (ValueError, KeyError) as err:
+                # A malformed message is dropped, the reconciliation finds its files
+                logging.log(logging.WARNING, f"Skipping the malformed event message {body!r}: {err}")
+            self.batch_receipt_handles.append(receipt_handle)
+
+        if self._batch_is_ready():
+            self.flush_batch()
+        elif self.batch_start_time is None and self.batch_receipt_handles:
+            # Messages without any new file of the bucket, e.g. s3:TestEvent
+            self.event_queue.delete(self.batch_receipt_handles)
+            self.batch_receipt_handles = []
+
+    def run(self):
+        """
+        Function to run the event driven Scanner until the process is killed
+        :return: None
+        """
+        logging.log(logging.INFO, "Event driven Scanner started!")
+        while True:
+            self.run_once()
@@ -0,0 +1,124 @@
+"""
+Module to plan the ETL jobs of the scanned files.
+The files are packed into jobs of at most job_size_in_bytes bytes and max_files_per_job files,
+and the jobs are balanced, so the ETL workers get similar amounts of work.
+An uncompressed file bigger than a job is split in byte ranges, one job per range.
+"""
+import bisect
+import heapq
+import math
+from dataclasses import dataclass
+
+import compression
+from s3_helper import S3FileObject
+
+
+@dataclass
+class PlannedFile:
+    """
+    Dataclass for a file, or a byte range of a file, planned in a job
+    size_in_bytes: Estimated uncompressed size of the file or of the range
+    range_start, range_end: Byte range [range_start, range_end) of the file, None for the whole file
+    """
+    scanned_file: S3FileObject
+    size_in_bytes: int
+    range_start: int = None
+    range_end: int = None
+
+    def __lt__(self, other):
+        return ((self.scanned_file.last_modified_time, self.scanned_file.file_path, self.range_start or 0)
+                < (other.scanned_file.last_modified_time, other.scanned_file.file_path, other.range_start or 0))
+
+
+def split_file(scanned_file: S3FileObject, size_in_bytes, job_size_in_bytes):
+    """
+    Function to split a file bigger than a job in byte ranges of equal size.
+    Compressed files can't be read in byte ranges, they are planned whole, whether the compression
+    is known from the extension or from the magic bytes (scanned_file.compression).
+    :param scanned_file: S3FileObject
+    :param size_in_bytes: Estimated uncompressed size of the file
+    :param job_size_in_bytes: Target size of a job
+    :return: List of PlannedFile
+    """
+    if (size_in_bytes <= job_size_in_bytes
+            or scanned_file.compression is not None
+            or compression.compression_from_key(scanned_file.file_path) is not None):
+        return [PlannedFile(scanned_file=scanned_file, size_in_bytes=size_in_bytes)]
+
+    number_of_ranges = math.ceil(size_in_bytes / job_size_in_bytes)
+    range_size = math.ceil(size_in_bytes / number_of_ranges)
+    return [PlannedFile(scanned_file=scanned_file,
+                        size_in_bytes=min(range_start + range_size, size_in_bytes) - range_start,
+                        range_start=range_start,
+                        range_end=min(range_start + range_size, size_in_bytes))
+            for range_start in range(0, size_in_bytes, range_size)]
+
+
+def _best_fit_decreasing(planned_files, job_size_in_bytes, max_files_per_job):
+    """
+    Function to pack the files with best fit decreasing, every file goes to the job it fills the most.
+    No job is bigger than job_size_in_bytes unless a single file is.
+    :param planned_files: List of PlannedFile
+    :param job_size_in_bytes: Maximum size of a job
+    :param max_files_per_job: Maximum number of files of a job
+    :return: List of jobs, every job is a list of PlannedFile
+    """
+    jobs = []
+    # Sorted (remaining bytes, job index) of the jobs which can take more files
+    remaining_sizes = []
+    for planned_file in sorted(planned_files, key=lambda planned: planned.size_in_bytes, reverse=True):
+        position = bisect.bisect_left(remaining_sizes, (planned_file.size_in_bytes, -1))
+        if position < len(remaining_sizes):
+            remaining_size, index = remaining_sizes.pop(position)
+            jobs[index].append(planned_file)
+        else:
+            remaining_size, index = job_size_in_bytes, len(jobs)
+            jobs.append([planned_file])
+
+        if len(jobs[index]) < max_files_per_job:
+            bisect.insort(remaining_sizes, (remaining_size - planned_file.size_in_bytes, index))
+    return jobs
+
+
+def _balance(planned_files, number_of_jobs, max_files_per_job):
+    """
+    Function to spread the files on a fixed number of jobs, every file goes to the smallest job
+    :param planned_files: List of PlannedFile
+    :param number_of_jobs: Number of jobs, enough to hold all the files within max_files_per_job
+    :param max_files_per_job: Maximum number of files of a job
+    :return: List of jobs, every job is a list of PlannedFile
+    """
+    jobs = [[] for _ in range(number_of_jobs)]
+    smallest_jobs = [(0, index) for index in range(number_of_jobs)]
+    for planned_file in sorted(planned_files, key=lambda planned: planned.size_in_bytes, reverse=True):
+        job_size, index = heapq.heappop(smallest_jobs)
+        jobs[index].append(planned_file)
+        if len(jobs[index]) < max_files_per_job:
+            heapq.heappush(smallest_jobs, (job_size + planned_file.size_in_bytes, index))
+    return jobs
+
+
+def pack_files(planned_files, job_size_in_bytes, max_files_per_job):
+    """
+    Function to pack the files into the fewest jobs within the limits, and then to balance the jobs.
+    The files of a job and the jobs are ordered by the last modified time.
+    :param planned_files: List of PlannedFile
+    :param job_size_in_bytes: Maximum size of a job
+    :param max_files_per_job: Maximum number of files of a job
+    :return: List of jobs, every job is a list of PlannedFile
+    """
+    if not planned_files:
+        return []
+
+    max_files_per_job = max(max_files_per_job, 1)
+    jobs = _best_fit_decreasing(planned_files, job_size_in_bytes, max_files_per_job)
+
+    # The balanced jobs are used only if they are all within the limit, else the jobs of the best fit are kept
+    balanced_jobs = _balance(planned_files, len(jobs), max_files_per_job)
+    if all(sum(planned.size_in_bytes for planned in job) <= job_size_in_bytes
+           for job in balanced_jobs if len(job) > 1):
+        jobs = balanced_jobs
+
+    jobs = [sorted(job) for job in jobs if job]
+    jobs.sort(key=lambda job: job[-1].scanned_file.last_modified_time)
+    return jobs
@@ -1,13 +1,19 @@
 """
 Module to handle the Scanner
 """
-from db_helper import ScannerTable, ScannerStatusEnum
+from db_helper import ScannerTable, ScannerJobFileTable, ScannerStatusEnum
 from s3_helper import S3FileObject
 from . import BaseTask
+from . import job_planner
+from .job_planner import PlannedFile
+import compression
+import metrics
 from config_data_classes import DatabaseConfig, S3Config, ETLConfig
 import constants
 from datetime import datetime as dt
 from datetime import timedelta as td
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
 from logging_setup import get_logger
 
 logging = get_logger()
@@ -78,41 +84,133 @@ class ScannerTask(BaseTask):
 
         return possible_prefixes
 
-    def _create_new_jobs(self, list_of_new_file_obj: [S3FileObject]):
+    def _list_prefix(self, prefix, last_modified_time, start_after):
+        """
+        Function to list one prefix ordered by last_modified_time
+        :param prefix: Prefix to scan
+        :param last_modified_time: to filter the files which are later then this date
+        :param start_after: Key after which the listing starts, None to list the whole prefix
+        :return: List of S3FileObject
+        """
+        return self.s3_helper.list_bucket(prefix=prefix,
+                                          last_modified_time=last_modified_time,
+                                          order_by_time=True,
+                                          start_after=start_after)
+
+    def _list_prefixes(self, prefixes, last_modified_time, prefix_cursors=None):
+        """
+        Function to list all the prefixes, LIST_CONCURRENCY prefixes at a time.
+        Every prefix is ordered by last_modified_time and the prefixes are merged in their hourly order,
+        so the result is exactly the same as listing the prefixes one after another.
+        :param prefixes: List of prefixes in increasing time
+        :param last_modified_time: to filter the files which are later then this date
+        :param prefix_cursors: Dictionary of prefix to the key after which the listing starts
+        :return: List of S3FileObject and the dictionary of prefix to its last listed key
+        """
+        prefix_cursors = prefix_cursors or {}
+
+        list_of_new_file_obj: [S3FileObject] = []
+        new_prefix_cursors = {}
+        with ThreadPoolExecutor(max_workers=max(self.etl_config.LIST_CONCURRENCY, 1),
+                                thread_name_prefix="s3-list") as executor:
+            # map keeps the order of the prefixes, whatever the order in which the listings finish
+            listings = executor.map(self._list_prefix,
+                                    prefixes,
+                                    repeat(last_modified_time),
+                                    [prefix_cursors.get(prefix) for prefix in prefixes])
+            for prefix, files_in_prefix in zip(prefixes, listings):
+                list_of_new_file_obj += files_in_prefix
+                if files_in_prefix:
+                    new_prefix_cursors[prefix] = max(file_obj.key for file_obj in files_in_prefix)
+
+        return list_of_new_file_obj, new_prefix_cursors
+
+    def _estimated_file_size(self, scanned_file: S3FileObject):
+        """
+        Function to estimate the uncompressed size of a file, so jobs of compressed files stay balanced
+        :param scanned_file: S3FileObject
+        :return: Size in bytes
+        """
+        if scanned_file.compression is not None:
+            return int(scanned_file.file_size_in_bytes * self.etl_config.COMPRESSION_RATIO_ESTIMATE)
+        return compression.estimate_uncompressed_size(scanned_file.file_path,
+                                                      scanned_file.file_size_in_bytes,
+                                                      self.etl_config.COMPRESSION_RATIO_ESTIMATE)
+
+    @staticmethod
+    def _new_job(planned_files: [PlannedFile]):
+        """
+        Function to create a job with its files in the ScannerJobFileTable
+        :param planned_files: List of PlannedFile of the job, ordered by last_modified_time
+        :return: ScannerTable job
+        """
+        # The file paths are in the ScannerJobFileTable only, the `files` column can't hold many files
+        return ScannerTable(files="",
+                            total_size_in_bytes=sum(planned.size_in_bytes for planned in planned_files),
+                            latest_file_modified_time=planned_files[-1].scanned_file.last_modified_time,
+                            status=ScannerStatusEnum.SENT_FOR_ETL,
+                            job_files=[ScannerJobFileTable(file_index=file_index,
+                                                           file_path=planned.scanned_file.file_path,
+                                                           size_in_bytes=planned.size_in_bytes,
+                                                           etag=planned.scanned_file.etag,
+                                                           range_start=planned.range_start,
+                                                           range_end=planned.range_end,
+                                                           status=ScannerStatusEnum.SENT_FOR_ETL)
+                                       for file_index, planned in enumerate(planned_files)])
+
+    def _job_size_in_bytes(self):
+        """
+        Function to get the size of the new jobs. With ADAPTIVE_JOB_SIZE, the size is the number of bytes
+        the ETL processes in TARGET_JOB_DURATION_IN_SECOND, measured on the last loaded jobs.
+        :return: Size in bytes
+        """
+        if not self.etl_config.ADAPTIVE_JOB_SIZE:
+            return self.etl_config.JOB_SIZE_IN_BYTES
+
+        job_metrics = self.etl_db.get_recent_job_metrics(number_of_jobs=self.etl_config.ADAPTIVE_JOB_SIZE_WINDOW)
+        processing_seconds = sum(job_metric.processing_seconds for job_metric in job_metrics)
+        if not processing_seconds:
+            return self.etl_config.JOB_SIZE_IN_BYTES
+
+        bytes_per_second = sum(job_metric.total_size_in_bytes for job_metric in job_metrics) / processing_seconds
+        rows_per_second = sum(job_metric.loaded_rows for job_metric in job_metrics) / processing_seconds
+        job_size_in_bytes = int(bytes_per_second * self.etl_config.TARGET_JOB_DURATION_IN_SECOND)
+        job_size_in_bytes = min(max(job_size_in_bytes, self.etl_config.MIN_JOB_SIZE_IN_BYTES),
+                                self.etl_config.MAX_JOB_SIZE_IN_BYTES)
+        logging.log(logging.INFO, f"ETL throughput of the last {len(job_metrics)} jobs: "
+                                  f"{bytes_per_second:.0f} bytes/s, {rows_per_second:.1f} rows/s. "
+                                  f"Job size: {job_size_in_bytes} bytes")
+        return job_size_in_bytes
+
+    def _create_new_jobs(self, list_of_new_file_obj: [S3FileObject], job_size_in_bytes=None):
         """
         Function to create new jobs to insert into Scanner Table
         This job will have following arguments
-            1. files: List of all file paths which are grouped into one task
-            2. job_size: Sum of all the file sizes in bytes
+            1. job_files: List of all the files which are grouped into one task
+            2. job_size: Sum of all the file sizes in bytes, uncompressed sizes are estimated for compressed files
             3. latest_last_modified_time: The latest last_modified_time in the group of files of a job
+        The files are packed into balanced jobs of at most job_size_in_bytes and MAX_FILES_PER_JOB files,
+        and the uncompressed files bigger than a job are split in byte ranges.
+        All the jobs of a scan are inserted together, so the latest last_modified_time of the Scanner Table
+        is still the latest scanned file, whatever the order of the files in the jobs.
         :param list_of_new_file_obj: List of S3FileObjects
+        :param job_size_in_bytes: Size of a job, JOB_SIZE_IN_BYTES if None
         :return: List of ScannerTable jobs
         """
-        new_jobs = []  # Final object to contain all the new Scanner Jobs
-        job_size = 0
-        files_in_job = []
-        latest_last_modified_time_in_s3 = constants.MINIMUM_TIME
-
-        for index, scanned_file in enumerate(list_of_new_file_obj):
-            if job_size < self.etl_config.JOB_SIZE_IN_BYTES:
-                job_size += scanned_file.file_size_in_bytes
-                files_in_job.append(scanned_file.file_path)
-                latest_last_modified_time_in_s3 = scanned_file.last_modified_time
-            else:
-                new_jobs.append(ScannerTable(files=constants.MULTI_FILE_PATH_SEPARATOR.join(files_in_job),
-                                             total_size_in_bytes=job_size,
-                                             latest_file_modified_time=latest_last_modified_time_in_s3,
-                                             status=ScannerStatusEnum.SENT_FOR_ETL,))
-                job_size = scanned_file.file_size_in_bytes
-                files_in_job = [scanned_file.file_path]
-                latest_last_modified_time_in_s3 = scanned_file.last_modified_time
-
-            if index == len(list_of_new_file_obj) - 1:
-                new_jobs.append(ScannerTable(files=constants.MULTI_FILE_PATH_SEPARATOR.join(files_in_job),
-                                             total_size_in_bytes=job_size,
-                                             latest_file_modified_time=latest_last_modified_time_in_s3,
-                                             status=ScannerStatusEnum.SENT_FOR_ETL, ))
-        return new_jobs
+        job_size_in_bytes = job_size_in_bytes or self.etl_config.JOB_SIZE_IN_BYTES
+        for scanned_file in list_of_new_file_obj:
+            # A file which would be split may be compressed without an extension, it must be planned whole
+            if (scanned_file.compression is None and self._estimated_file_size(scanned_file) > job_size_in_bytes
+                    and compression.compression_from_key(scanned_file.file_path) is None):
+                scanned_file.compression = self.s3_helper.detect_compression(scanned_file.file_path,
+                                                                             scanned_file.file_size_in_bytes)
+        planned_files = [planned_file
+                         for scanned_file in list_of_new_file_obj
+                         for planned_file in job_planner.split_file(scanned_file,
+                                                                    self._estimated_file_size(scanned_file),
+                                                                    job_size_in_bytes)]
+        planned_jobs = job_planner.pack_files(planned_files, job_size_in_bytes, self.etl_config.MAX_FILES_PER_JOB)
+        return [self._new_job(planned_job) for planned_job in planned_jobs]
 
     def run(self):
         """
@@ -120,28 +218,39 @@ class ScannerTask(BaseTask):
         :return: None
         """
         logging.log(logging.INFO, "Scanner started!")
+        recorder = self.s3_helper.recorder = metrics.MetricsRecorder()
         # 1. Fetch the latest modified time from the Scanner Task DB
         latest_last_modified_time_in_db = self.etl_db.get_scanner_latest_modified_time()
 
         # 2. Generate prefixes from last time to current time
         possible_prefixes = self._generate_prefixes(from_time=latest_last_modified_time_in_db)
 
-        # 3. Pass it to the S3 bucket and fetch the latest files in increasing last_modified_time
-        list_of_new_file_obj: [S3FileObject] = []
-        for prefix in possible_prefixes:
-            list_of_new_file_obj += self.s3_helper.list_bucket(prefix=prefix,
-                                                               last_modified_time=latest_last_modified_time_in_db,
-                                                               order_by_time=True)
+        # 3. Pass it to the S3 bucket and fetch the latest files in increasing last_modified_time.
+        #    With prefix cursors, S3 only lists the keys after the last key seen in every prefix.
+        prefix_cursors = {}
+        if self.etl_config.USE_PREFIX_CURSORS:
+            prefix_cursors = self.etl_db.get_prefix_cursors(possible_prefixes)
+        list_of_new_file_obj, new_prefix_cursors = self._list_prefixes(possible_prefixes,
+                                                                       latest_last_modified_time_in_db,
+                                                                       prefix_cursors=prefix_cursors)
 
         if list_of_new_file_obj:
             logging.log(logging.INFO, f"Total files from S3 scanned: {len(list_of_new_file_obj)}")
 
             # 4. Create new jobs
-            new_jobs = self._create_new_jobs(list_of_new_file_obj)
+            new_jobs = self._create_new_jobs(list_of_new_file_obj, job_size_in_bytes=self._job_size_in_bytes())
 
             # 5. Insert new jobs into the table for ETL task
-            self.etl_db.create_new_jobs(rows=new_jobs)
+            if self.etl_config.USE_PREFIX_CURSORS:
+                self.etl_db.create_new_jobs_with_cursors(new_jobs=new_jobs,
+                                                         prefix_cursors=new_prefix_cursors,
+                                                         oldest_prefix=possible_prefixes[0])
+            else:
+                self.etl_db.create_new_jobs(rows=new_jobs)
 
             logging.log(logging.INFO, f"Created {len(new_jobs)} new ETL jobs.")
         else:
             logging.log(logging.INFO, "No new files to scan!")
+
+        metrics.EXPORTER.record("scanner", recorder, "SCANNED")
+        logging.log(logging.INFO, f"Scanner stage metrics: {recorder}")
@@ -0,0 +1,173 @@
+"""
+Module defining a staged executor.
+Every stage runs in its own worker threads and the stages are joined by bounded queues,
+so a slow stage applies backpressure to the previous ones and the memory held between
+the stages stays within queue_size items per stage.
+"""
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Callable
+
+from logging_setup import get_logger
+
+logging = get_logger()
+
+# Seconds to wait on a full or empty queue before checking if the executor is stopped
+QUEUE_POLL_TIMEOUT_IN_SECOND = 0.1
+
+
+class StageFailedError(Exception):
+    """
+    Raised by StagedExecutor.run when a stage fails, the original exception is its cause
+    """
+    pass
+
+
+@dataclass
+class Stage:
+    """
+    Dataclass for a stage of the executor
+    function: Called with every input item, returns an iterable of output items for the next stage
+    workers: Number of threads running the stage
+    queue_size: Maximum number of items waiting for the stage
+    """
+    name: str
+    function: Callable
+    workers: int = 1
+    queue_size: int = 8
+
+
+class _EndOfStream:
+    """
+    Marker put in a queue once all the items of the previous stage are done
+    """
+    pass
+
+
+class StagedExecutor:
+    """
+    Class to run items through a sequence of stages
+    """
+    def __init__(self, stages: [Stage], on_stop: Callable = None):
+        """
+        :param stages: Stages in execution order, the output of the last stage is dropped
+        :param on_stop: Called once a stage fails, to wake up the stage functions waiting on something
+                        else than the queues, e.g. an InFlightBytesBudget
+        """
+        self.stages = stages
+        self.on_stop = on_stop
+        self.queues = [queue.Queue(maxsize=max(stage.queue_size, 1)) for stage in stages]
+        self.processed_items = {stage.name: 0 for stage in stages}
+        self._stop = threading.Event()
+        self._error = None
+        self._error_stage = None
+        self._lock = threading.Lock()
+        self._running_workers = [max(stage.workers, 1) for stage in stages]
+
+    def _put(self, stage_index, item):
+        """
+        Function to put an item in the queue of a stage, waiting while the queue is full
+        :param stage_index: Index of the stage
+        :param item: Item to put
+        :return: False if the executor is stopped, else True
+        """
+        while not self._stop.is_set():
+            try:
+                self.queues[stage_index].put(item, timeout=QUEUE_POLL_TIMEOUT_IN_SECOND)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, stage_index):
+        """
+        Function to get the next item of a stage, waiting while the queue is empty
+        :param stage_index: Index of the stage
+        :return: Item, or _EndOfStream if the executor is stopped
+        """
+        while not self._stop.is_set():
+            try:
+                return self.queues[stage_index].get(timeout=QUEUE_POLL_TIMEOUT_IN_SECOND)
+            except queue.Empty:
+                continue
+        return _EndOfStream
+
+    def _fail(self, stage, error):
+        """
+        Function to record the first error and stop all the stages
+        :param stage: Stage which failed
+        :param error: Exception raised by the stage
+        :return: None
+        """
+        with self._lock:
+            if self._error is None:
+                self._error = error
+                self._error_stage = stage
+        self._stop.set()
+        if self.on_stop is not None:
+            self.on_stop()
+
+    def _worker(self, stage_index):
+        """
+        Function running in the threads of a stage
+        :param stage_index: Index of the stage
+        :return: None
+        """
+        stage = self.stages[stage_index]
+        is_last_stage = stage_index == len(self.stages) - 1
+        try:
+            while True:
+                item = self._get(stage_index)
+                if item is _EndOfStream:
+                    break
+
+                for output_item in stage.function(item):
+                    if not is_last_stage and not self._put(stage_index + 1, output_item):
+                        return
+                with self._lock:
+                    self.processed_items[stage.name] += 1
+        except Exception as err:
+            logging.log(logging.ERROR, f"Stage {stage.name} failed: {err}")
+            self._fail(stage, err)
+        finally:
+            with self._lock:
+                self._running_workers[stage_index] -= 1
+                last_worker = self._running_workers[stage_index] == 0
+
+            # The last worker of a stage ends the next stage, one marker for every worker of it
+            if last_worker and not is_last_stage:
+                for _ in range(max(self.stages[stage_index + 1].workers, 1)):
+                    self._put(stage_index + 1, _EndOfStream)
+
+    def run(self, items):
+        """
+        Function to run the items through all the stages, it returns once every stage is done
+        :param items: Iterable of input items of the first stage
+        :return: Dictionary of stage name to number of items it processed
+        """
+        threads = []
+        for stage_index, stage in enumerate(self.stages):
+            for worker_index in range(max(stage.workers, 1)):
+                thread = threading.Thread(target=self._worker, args=(stage_index,),
+                                          name=f"{stage.name}-{worker_index}", daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        try:
+            for item in items:
+                if not self._put(0, item):
+                    break
+        except Exception as err:
+            self._fail(Stage(name="input", function=None), err)
+        finally:
+            for _ in range(max(self.stages[0].workers, 1)):
+                self._put(0, _EndOfStream)
+
+            for thread in threads:
+                thread.join()
+
+        if self._error is not None:
+            raise StageFailedError(f"Stage {self._error_stage.name} failed: {self._error}") from self._error
+
+        return dict(self.processed_items)
@@ -0,0 +1,180 @@
+"""
+Module to impute the cleaned rows in one pass, with the rules of eda_of_loan_applications.ipynb:
+1. age below MINIMUM_AGE, or missing, is replaced by the median age
+2. a missing MonthlyIncome is replaced by the median MonthlyIncome of the age band, working or senior
+3. a missing NumberOfDependents is replaced by the mode of NumberOfDependents
+4. the past due codes 96 and 98 are replaced by the median of their column
+The notebook computes the medians and the mode on the whole data in memory. Here every statistic is
+a sketch of bounded size, a count per value (or per income bucket), which is updated with every row.
+The sketches of all the loaded rows are persisted by the merge of the staging tables, which counts the values
+the same way, see ReportingDatabaseConnector.merge_staging_table_statements.
+The imputed values are written to the *_imputed columns, the raw values are kept as they are.
+"""
+import threading
+
+from db_helper import (CSV_HEADER_TO_COLUMN, IMPUTED_COLUMNS, MONTHLY_INCOME_BUCKET_WIDTH, MONTHLY_INCOME_BUCKETS,
+                       MINIMUM_AGE, WORKING_AGE_LIMIT, PAST_DUE_CODES, PAST_DUE_HEADERS, MAX_SKETCH_VALUE, AGE_SKETCH,
+                       WORKING_INCOME_SKETCH, SENIOR_INCOME_SKETCH, DEPENDENTS_SKETCH, median_from_histogram)
+
+# The estimates are computed again from the sketches every ESTIMATES_REFRESH_ROWS rows
+ESTIMATES_REFRESH_ROWS = 1000
+
+
+def discrete_median(value_counts):
+    """
+    Function to get the median of a sketch of integer values, the lower one for an even number of values
+    :param value_counts: Dictionary of value to number of rows
+    :return: Median value, None for an empty sketch
+    """
+    total_count = sum(value_counts.values())
+    if total_count <= 0:
+        return None
+
+    cumulative_count = 0
+    for value in sorted(value_counts):
+        cumulative_count += value_counts[value]
+        if cumulative_count >= total_count / 2:
+            return value
+    return None
+
+
+def mode(value_counts):
+    """
+    Function to get the mode of a sketch of integer values, the lowest one in case of a tie like pandas
+    :param value_counts: Dictionary of value to number of rows
+    :return: Mode value, None for an empty sketch
+    """
+    value_counts = {value: count for value, count in value_counts.items() if count > 0}
+    if not value_counts:
+        return None
+    return min(value_counts, key=lambda value: (-value_counts[value], value))
+
+
+class StreamingImputer:
+    """
+    Class to impute the cleaned rows of a job. The estimates come from the sketches of the previous jobs
+    and of the rows of the job seen so far, the sketches of the job are persisted by the merge of its rows.
+    """
+    def __init__(self, sketches=None):
+        """
+        :param sketches: Sketches of the previous jobs, dictionary of sketch name to dictionary of value to count,
+                         see ReportingDatabaseConnector.get_imputation_sketches
+        """
+        self.previous_sketches = sketches or {}
+        # Sketches of the rows of this job only
+        self.job_sketches = {}
+        # Estimate of every sketch, see _estimate
+        self.estimates = {}
+        self.rows_since_refresh = 0
+        # The clean workers of the pipelined execution share the imputer of the job
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _income_sketch(age):
+        """
+        Function to get the MonthlyIncome sketch of an age
+        :param age: Imputed age
+        :return: Name of the sketch
+        """
+        return SENIOR_INCOME_SKETCH if age is not None and age > WORKING_AGE_LIMIT else WORKING_INCOME_SKETCH
+
+    @staticmethod
+    def _income_bucket(monthly_income):
+        """
+        Function to get the histogram bucket of a MonthlyIncome, same as the buckets of the aggregates
+        :param monthly_income: MonthlyIncome
+        :return: Income bucket
+        """
+        return min(max(int(monthly_income // MONTHLY_INCOME_BUCKET_WIDTH), 0), MONTHLY_INCOME_BUCKETS)
+
+    def _count(self, sketch, value):
+        """
+        Function to add a value to a sketch of the job
+        :param sketch: Name of the sketch
+        :param value: Integer value or income bucket
+        :return: None
+        """
+        value_counts = self.job_sketches.setdefault(sketch, {})
+        value_counts[value] = value_counts.get(value, 0) + 1
+
+    def _merged_sketch(self, sketch):
+        """
+        Function to get a sketch of the previous jobs and of this job
+        :param sketch: Name of the sketch
+        :return: Dictionary of value to count
+        """
+        value_counts = dict(self.previous_sketches.get(sketch, {}))
+        for value, count in self.job_sketches.get(sketch, {}).items():
+            value_counts[value] = value_counts.get(value, 0) + count
+        return value_counts
+
+    def _compute_estimate(self, sketch):
+        """
+        Function to compute the estimate of a sketch, the mode for NumberOfDependents and the median for the others
+        :param sketch: Name of the sketch
+        :return: Estimate, None for an empty sketch
+        """
+        value_counts = self._merged_sketch(sketch)
+        if sketch == DEPENDENTS_SKETCH:
+            return mode(value_counts)
+        if sketch in (WORKING_INCOME_SKETCH, SENIOR_INCOME_SKETCH):
+            median_income = median_from_histogram(value_counts)
+            return round(median_income) if median_income is not None else None
+        return discrete_median(value_counts)
+
+    def _estimate(self, sketch):
+        """
+        Function to get the current estimate of a sketch. The estimates are computed again every
+        ESTIMATES_REFRESH_ROWS rows, and at every use while they are None, so the first job imputes
+        from its first rows.
+        :param sketch: Name of the sketch
+        :return: Estimate, None for an empty sketch
+        """
+        if self.estimates.get(sketch) is None:
+            self.estimates[sketch] = self._compute_estimate(sketch)
+        return self.estimates[sketch]
+
+    def impute(self, cleaned_row):
+        """
+        Function to add the imputed columns to a cleaned row and count its values in the sketches.
+        The values of the row are counted before its missing values are imputed.
+        The missing values stay None while their sketch is empty.
+        :param cleaned_row: cleaned row of data, see ETLTask.clean_data
+        :return: cleaned row with the IMPUTED_COLUMNS
+        """
+        with self.lock:
+            if self.rows_since_refresh >= ESTIMATES_REFRESH_ROWS:
+                self.estimates = {}
+                self.rows_since_refresh = 0
+            self.rows_since_refresh += 1
+
+            age = cleaned_row["age"]
+            if age is not None and age >= MINIMUM_AGE:
+                self._count(AGE_SKETCH, min(age, MAX_SKETCH_VALUE))
+            else:
+                age = self._estimate(AGE_SKETCH)
+            cleaned_row[IMPUTED_COLUMNS["age"]] = age
+
+            income_sketch = self._income_sketch(age)
+            monthly_income = cleaned_row["MonthlyIncome"]
+            if monthly_income is not None:
+                self._count(income_sketch, self._income_bucket(monthly_income))
+            else:
+                monthly_income = self._estimate(income_sketch)
+            cleaned_row[IMPUTED_COLUMNS["MonthlyIncome"]] = monthly_income
+
+            number_of_dependents = cleaned_row["NumberOfDependents"]
+            if number_of_dependents is not None:
+                self._count(DEPENDENTS_SKETCH, min(max(number_of_dependents, 0), MAX_SKETCH_VALUE))
+            else:
+                number_of_dependents = self._estimate(DEPENDENTS_SKETCH)
+            cleaned_row[IMPUTED_COLUMNS["NumberOfDependents"]] = number_of_dependents
+
+            for header in PAST_DUE_HEADERS:
+                past_due = cleaned_row[header]
+                if past_due in PAST_DUE_CODES:
+                    past_due = self._estimate(CSV_HEADER_TO_COLUMN[header])
+                elif past_due is not None:
+                    self._count(CSV_HEADER_TO_COLUMN[header], min(max(past_due, 0), MAX_SKETCH_VALUE))
+                cleaned_row[IMPUTED_COLUMNS[header]] = past_due
+        return cleaned_row
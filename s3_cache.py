@@ -0,0 +1,203 @@
+"""
+Module defining a local disk cache for the downloaded S3 objects.
+Objects are keyed by bucket, key and ETag, so a modified object is never served from the cache.
+The files are written to a temporary file and renamed, so ETL processes of the same host can share
+the cache directory. Cached files are read through memory maps. When the cache is bigger than its
+limit, the least recently used files are evicted. The size of the cache is kept as a running total,
+the directory is only scanned when the total goes over the limit.
+The hits, misses and evictions are exported with the stage metrics. The tasks of a process share
+one cache per directory, see shared_disk_cache.
+"""
+import hashlib
+import io
+import mmap
+import os
+import tempfile
+import threading
+
+import metrics
+from logging_setup import get_logger
+
+logging = get_logger()
+
+# Extension of the cached files, the temporary files don't have it until they are complete
+CACHE_FILE_EXTENSION = ".obj"
+
+# S3DiskCache of every cache directory of the process, see shared_disk_cache
+_SHARED_CACHES = {}
+_SHARED_CACHES_LOCK = threading.Lock()
+
+
+class S3DiskCache:
+    """
+    Class to cache S3 objects on the local disk with LRU eviction
+    """
+    def __init__(self, cache_dir, max_size_in_bytes):
+        """
+        :param cache_dir: Directory of the cache, it is created if it doesn't exist
+        :param max_size_in_bytes: Maximum size of all the cached files together
+        """
+        self.cache_dir = cache_dir
+        self.max_size_in_bytes = max_size_in_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Size of the cached files, as of the last scan plus the files written by this process since then.
+        # The files written by the other processes are counted at the next scan.
+        self.size_in_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # The directory may be left bigger than the limit by a previous run with a higher limit
+        self.evict()
+        metrics.EXPORTER.register_cache(self)
+
+    def _path(self, bucket, key, etag):
+        """
+        Function to get the path of the cached file of an object
+        :param bucket: Bucket of the object
+        :param key: Key of the object
+        :param etag: ETag of the object
+        :return: Path of the file
+        """
+        digest = hashlib.sha256(f"{bucket}/{key}/{etag}".encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}{CACHE_FILE_EXTENSION}")
+
+    @staticmethod
+    def _memory_map(path):
+        """
+        Function to open a cached file as a memory map
+        :param path: Path of the file
+        :return: Read only file like object and its size
+        """
+        with open(path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            if size == 0:
+                # Empty files can't be mapped
+                return io.BytesIO(b""), 0
+            # The map stays valid even if another process evicts the file
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ), size
+
+    def _count(self, counter):
+        """
+        Function to increment a counter, the cache is shared by the download threads
+        :param counter: Name of the counter attribute
+        :return: None
+        """
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, bucket, key, etag):
+        """
+        Function to read an object from the cache
+        :param bucket: Bucket of the object
+        :param key: Key of the object
+        :param etag: ETag of the object
+        :return: Read only file like object and its size, or None if the object is not cached
+        """
+        path = self._path(bucket, key, etag)
+        try:
+            cached_file = self._memory_map(path)
+        except FileNotFoundError:
+            self._count("misses")
+            return None
+
+        try:
+            # The modified time is the last access for the LRU eviction
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another process since it was mapped, the map stays valid
+            pass
+        self._count("hits")
+        return cached_file
+
+    def put(self, bucket, key, etag, stream, chunk_size=1024 * 1024):
+        """
+        Function to write an object to the cache and read it back from there
+        :param bucket: Bucket of the object
+        :param key: Key of the object
+        :param etag: ETag of the object
+        :param stream: File like object of the content of the object
+        :param chunk_size: Bytes copied at a time
+        :return: Read only file like object and its size
+        """
+        path = self._path(bucket, key, etag)
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp-")
+        try:
+            with os.fdopen(file_descriptor, "wb") as temp_file:
+                for chunk in iter(lambda: stream.read(chunk_size), b""):
+                    temp_file.write(chunk)
+            # A file of the same object written by another thread or process is replaced, not added
+            already_cached = os.path.exists(path)
+            # Atomic, a reader sees either no file or the complete file
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        cached_file = self._memory_map(path)
+        with self._lock:
+            if not already_cached:
+                self.size_in_bytes += cached_file[1]
+            over_limit = self.size_in_bytes > self.max_size_in_bytes
+        if over_limit:
+            self.evict()
+        return cached_file
+
+    def evict(self):
+        """
+        Function to scan the cache and delete the least recently used files until it is within its limit
+        :return: None
+        """
+        cached_files = []
+        total_size = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(CACHE_FILE_EXTENSION):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            cached_files.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+
+        for _, size, path in sorted(cached_files):
+            if total_size <= self.max_size_in_bytes:
+                break
+            try:
+                os.remove(path)
+                self._count("evictions")
+                logging.log(logging.DEBUG, f"Evicted {path} from the S3 cache")
+            except FileNotFoundError:
+                # Evicted by another process
+                pass
+            total_size -= size
+
+        with self._lock:
+            self.size_in_bytes = total_size
+
+    def stats(self):
+        """
+        Function to get the counters of the cache, they count the operations of this process only
+        :return: Dictionary of hits, misses, evictions and size_in_bytes
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "size_in_bytes": self.size_in_bytes}
+
+
+def shared_disk_cache(cache_dir, max_size_in_bytes):
+    """
+    Function to get the S3DiskCache of a directory, created once per process. The tasks built
+    on every cron tick share it, instead of adding a cache to the metrics and scanning the directory every time.
+    :param cache_dir: Directory of the cache
+    :param max_size_in_bytes: Maximum size of all the cached files together, the last one given is kept
+    :return: S3DiskCache
+    """
+    cache_dir = os.path.abspath(cache_dir)
+    with _SHARED_CACHES_LOCK:
+        cache = _SHARED_CACHES.get(cache_dir)
+        if cache is None:
+            cache = _SHARED_CACHES[cache_dir] = S3DiskCache(cache_dir, max_size_in_bytes)
+        else:
+            cache.max_size_in_bytes = max_size_in_bytes
+        return cache
@@ -0,0 +1,215 @@
+"""
+Module to read the object created events of the bucket from a queue, for the event driven Scanner.
+S3 sends an event notification for every new object to an SQS queue, directly or through SNS.
+LocalEventQueue is a local stand-in for SQS: every message is a JSON file of a local directory.
+The messages are deleted only once the jobs of their files are inserted, so a Scanner killed
+in between receives them again after the visibility timeout.
+"""
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+from urllib.parse import unquote_plus
+
+import boto3
+
+import constants
+from s3_helper import S3FileObject
+from logging_setup import get_logger
+
+logging = get_logger()
+
+# SQS returns at most 10 messages and waits at most 20 seconds in one receive_message call
+MAX_MESSAGES_PER_RECEIVE = 10
+MAX_WAIT_TIME_IN_SECOND = 20
+
+
+def object_created_event(bucket, key, size, etag="", event_time=None):
+    """
+    Function to create the body of an S3 object created event notification, as S3 sends it
+    :param bucket: Bucket name
+    :param key: Key of the new object
+    :param size: Size of the object in bytes
+    :param etag: ETag of the object, with or without the quotes
+    :param event_time: Timezone aware datetime of the event, now if None
+    :return: Dictionary of the message body
+    """
+    event_time = event_time or datetime.now(tz=constants.TZ)
+    return {"Records": [{"eventSource": "aws:s3",
+                         "eventName": "ObjectCreated:Put",
+                         "eventTime": event_time.astimezone(constants.TZ).strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+                         "s3": {"bucket": {"name": bucket},
+                                "object": {"key": key, "size": size, "eTag": etag.strip('"')}}}]}
+
+
+def parse_object_created_events(body, bucket):
+    """
+    Function to get the new files of a message body. The body is an S3 event notification,
+    or an SNS notification wrapping it. The other events, e.g. the s3:TestEvent sent when the
+    notification is set up, and the files of the other buckets are ignored.
+    :param body: Message body, JSON string or dictionary
+    :param bucket: Bucket name of the Scanner
+    :return: List of S3FileObject
+    """
+    if isinstance(body, str):
+        body = json.loads(body)
+    if "Records" not in body and "Message" in body:
+        body = json.loads(body["Message"])
+
+    new_files = []
+    for record in body.get("Records", []):
+        if not record.get("eventName", "").startswith("ObjectCreated:"):
+            continue
+        if record["s3"]["bucket"]["name"] != bucket:
+            continue
+
+        s3_object = record["s3"]["object"]
+        # The keys are URL encoded in the events
+        key = unquote_plus(s3_object["key"])
+        event_time = datetime.strptime(record["eventTime"].replace("Z", "+0000"), "%Y-%m-%dT%H:%M:%S.%f%z")
+        new_files.append(S3FileObject(file_path=f"s3://{bucket}/{key}",
+                                      last_modified_time=event_time.astimezone(constants.TZ),
+                                      file_size_in_bytes=int(s3_object.get("size", 0)),
+                                      key=key,
+                                      etag=f'"{s3_object["eTag"]}"' if s3_object.get("eTag") else ""))
+    return new_files
+
+
+class SQSEventQueue:
+    """
+    Class to read the event notifications of an SQS queue
+    """
+    def __init__(self, queue_url, access_key, secret_key, sqs_client=None):
+        """
+        :param queue_url: URL of the queue, e.g. https://sqs.eu-west-1.amazonaws.com/123456789012/credit-risk-data
+        :param access_key: AWS Access Key
+        :param secret_key: AWS Secret Key
+        :param sqs_client: Client to use instead of creating a boto3 client
+        """
+        self.queue_url = queue_url
+        if sqs_client is not None:
+            self.sqs_client = sqs_client
+        else:
+            # The region is the second part of the host of the queue URL
+            region_name = queue_url.split("//", maxsplit=1)[-1].split(".")[1]
+            self.sqs_client = boto3.client("sqs", region_name=region_name,
+                                           aws_access_key_id=access_key, aws_secret_access_key=secret_key)
+
+    def receive(self, max_messages=MAX_MESSAGES_PER_RECEIVE, wait_time_in_second=MAX_WAIT_TIME_IN_SECOND):
+        """
+        Function to receive the next messages, it waits until a message arrives or wait_time_in_second passed
+        :param max_messages: Maximum number of messages
+        :param wait_time_in_second: Maximum seconds to wait for a message
+        :return: List of (receipt handle, body) of the messages
+        """
+        resp = self.sqs_client.receive_message(QueueUrl=self.queue_url,
+                                               MaxNumberOfMessages=min(max_messages, MAX_MESSAGES_PER_RECEIVE),
+                                               WaitTimeSeconds=int(min(wait_time_in_second, MAX_WAIT_TIME_IN_SECOND)))
+        return [(message["ReceiptHandle"], message["Body"]) for message in resp.get("Messages", [])]
+
+    def delete(self, receipt_handles):
+        """
+        Function to delete the handled messages
+        :param receipt_handles: List of receipt handles returned by receive
+        :return: None
+        """
+        for start in range(0, len(receipt_handles), MAX_MESSAGES_PER_RECEIVE):
+            entries = [{"Id": str(index), "ReceiptHandle": receipt_handle}
+                       for index, receipt_handle in enumerate(receipt_handles[start:start + MAX_MESSAGES_PER_RECEIVE])]
+            resp = self.sqs_client.delete_message_batch(QueueUrl=self.queue_url, Entries=entries)
+            for failed in resp.get("Failed", []):
+                logging.log(logging.WARNING, f"Failed to delete the message {failed}, it will be received again")
+
+
+class LocalEventQueue:
+    """
+    Class to mimic an SQS queue on a local directory.
+    A message is a JSON file of the directory, a received message is moved to the "in_flight" sub directory
+    until it is deleted, or until the visibility timeout passed and it is moved back to the queue.
+    """
+    def __init__(self, queue_dir, visibility_timeout_in_second=300, poll_interval_in_second=0.2):
+        """
+        :param queue_dir: Directory of the messages
+        :param visibility_timeout_in_second: Seconds after which a received message not deleted is received again
+        :param poll_interval_in_second: Seconds between two looks at the directory while waiting for a message
+        """
+        self.queue_dir = queue_dir
+        self.in_flight_dir = os.path.join(queue_dir, "in_flight")
+        self.visibility_timeout_in_second = visibility_timeout_in_second
+        self.poll_interval_in_second = poll_interval_in_second
+        os.makedirs(self.in_flight_dir, exist_ok=True)
+
+    def send(self, body):
+        """
+        Function to add a message to the queue
+        :param body: Dictionary of the message body
+        :return: None
+        """
+        # The names start with the time, so the messages are received in about the order they were sent
+        file_name = f"{time.time_ns():020d}-{uuid.uuid4().hex}.json"
+        temp_path = os.path.join(self.queue_dir, f".{file_name}.tmp")
+        with open(temp_path, "w") as file:
+            json.dump(body, file)
+        # The rename is atomic, a receiver never reads a partial message
+        os.replace(temp_path, os.path.join(self.queue_dir, file_name))
+
+    def _release_expired_messages(self):
+        """
+        Function to move the received messages older than the visibility timeout back to the queue
+        :return: None
+        """
+        expiry_time = time.time() - self.visibility_timeout_in_second
+        for file_name in os.listdir(self.in_flight_dir):
+            path = os.path.join(self.in_flight_dir, file_name)
+            try:
+                if os.path.getmtime(path) < expiry_time:
+                    os.replace(path, os.path.join(self.queue_dir, file_name))
+            except FileNotFoundError:
+                # Deleted or released by another receiver
+                pass
+
+    def receive(self, max_messages=MAX_MESSAGES_PER_RECEIVE, wait_time_in_second=MAX_WAIT_TIME_IN_SECOND):
+        """
+        Function to receive the next messages, it waits until a message arrives or wait_time_in_second passed
+        :param max_messages: Maximum number of messages
+        :param wait_time_in_second: Maximum seconds to wait for a message
+        :return: List of (receipt handle, body) of the messages
+        """
+        deadline = time.monotonic() + wait_time_in_second
+        while True:
+            self._release_expired_messages()
+            messages = []
+            for file_name in sorted(os.listdir(self.queue_dir)):
+                if len(messages) >= max_messages:
+                    break
+                if not file_name.endswith(".json") or file_name.startswith("."):
+                    continue
+
+                receipt_handle = os.path.join(self.in_flight_dir, file_name)
+                try:
+                    # The move claims the message, only one receiver gets it
+                    os.replace(os.path.join(self.queue_dir, file_name), receipt_handle)
+                except FileNotFoundError:
+                    continue
+                # The visibility timeout starts when the message is received
+                os.utime(receipt_handle)
+                with open(receipt_handle, "r") as file:
+                    messages.append((receipt_handle, file.read()))
+
+            if messages or time.monotonic() >= deadline:
+                return messages
+            time.sleep(min(self.poll_interval_in_second, max(deadline - time.monotonic(), 0)))
+
+    def delete(self, receipt_handles):
+        """
+        Function to delete the handled messages
+        :param receipt_handles: List of receipt handles returned by receive
+        :return: None
+        """
+        for receipt_handle in receipt_handles:
+            try:
+                os.remove(receipt_handle)
+            except FileNotFoundError:
+                logging.log(logging.WARNING, f"The message {receipt_handle} was already deleted or released, "
+                                             f"it may be received again")
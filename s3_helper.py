@@ -2,19 +2,53 @@
 Module to handle S3 related tasks for the project.
 1. Listing files from a bucket
 2. Downloading the CSV files
+3. Downloading large CSV files in byte ranges, in parallel
+4. Decompressing gzip and zstd CSV files while they are downloaded
+5. Caching the downloaded files on the local disk
 """
 import codecs
 import csv
+import io
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 import boto3
 from botocore.exceptions import ClientError
 from datetime import datetime
 from dataclasses import dataclass
+import compression
 import constants
+import metrics
 from logging_setup import get_logger
 
 logging = get_logger()
 
+# Bytes fetched at a time while looking for the end of a line
+LINE_LOOKUP_SIZE_IN_BYTES = 65536
+
+# boto3 clients by process and credentials, a client is thread safe and creating one is slow
+_S3_CLIENTS = {}
+_S3_CLIENTS_LOCK = threading.Lock()
+# Buckets known to exist, by client, so a long running task checks its bucket only once
+_EXISTING_BUCKETS = weakref.WeakKeyDictionary()
+
+
+def _s3_client(access_key, secret_key):
+    """
+    Function to get the boto3 S3 client of the credentials, created once per process
+    :param access_key: AWS Access Key
+    :param secret_key: AWS Secret Key
+    :return: boto3 S3 client
+    """
+    client_key = (os.getpid(), access_key, secret_key)
+    with _S3_CLIENTS_LOCK:
+        if client_key not in _S3_CLIENTS:
+            _S3_CLIENTS[client_key] = boto3.client('s3', aws_access_key_id=access_key,
+                                                   aws_secret_access_key=secret_key)
+        return _S3_CLIENTS[client_key]
+
 
 @dataclass
 class S3FileObject:
@@ -24,6 +58,10 @@ class S3FileObject:
     file_path: str
     last_modified_time: datetime
     file_size_in_bytes: int
+    key: str = ""
+    etag: str = ""
+    # Compression detected from the magic bytes of a file without extension, see S3Helper.detect_compression
+    compression: str = None
 
     def __repr__(self):
         return self.file_path
@@ -39,58 +77,85 @@ class S3Helper:
     """
     Class to handle S3 operations
     """
-    def __init__(self, bucket_name, access_key, secret_key):
+    def __init__(self, bucket_name, access_key, secret_key, s3_client=None, cache=None):
         """
         It creates S3 client and if the bucket doesn't exists, throws an error
         :param bucket_name: Name of the bucket to look into
         :param access_key: AWS Access Key
         :param secret_key: AWS Secret Key
+        :param s3_client: Client to use instead of creating a boto3 client, e.g. local_s3.LocalS3Client
+        :param cache: s3_cache.S3DiskCache of the downloaded files, None to always download
         """
         self.bucket_name = bucket_name
-        self.s3_client = boto3.client('s3', aws_access_key_id=access_key, aws_secret_access_key=secret_key)
+        self.cache = cache
+        # Recorder of the stages, the tasks set a new one for every job
+        self.recorder = metrics.MetricsRecorder()
+        if s3_client is not None:
+            self.s3_client = s3_client
+        else:
+            self.s3_client = _s3_client(access_key, secret_key)
 
         if not self._bucket_exists():
             raise Exception(f"Bucket {self.bucket_name} does not exists.")
 
     def _bucket_exists(self):
         """
-        Function to check if a bucket exists or not
+        Function to check if a bucket exists or not, with one head_bucket call.
+        An existing bucket is cached for the client, so it is checked once per process.
         :return: True/False depends on the existence of the bucket
         """
-        resp = self.s3_client.list_buckets()
-        for bucket in resp["Buckets"]:
-            if self.bucket_name in bucket["Name"]:
-                return True
-        return False
+        existing_buckets = _EXISTING_BUCKETS.setdefault(self.s3_client, set())
+        if self.bucket_name in existing_buckets:
+            return True
 
-    def list_bucket(self, prefix="", last_modified_time=constants.MINIMUM_TIME, order_by_time=False):
+        try:
+            self.s3_client.head_bucket(Bucket=self.bucket_name)
+        except ClientError as err:
+            if err.response["Error"]["Code"] in ("404", "NoSuchBucket"):
+                return False
+            raise err
+        existing_buckets.add(self.bucket_name)
+        return True
+
+    def list_bucket(self, prefix="", last_modified_time=constants.MINIMUM_TIME, order_by_time=False,
+                    start_after=None):
         """
         Function to list bucket with given prefix and greater than last_modified_time
         :param prefix: Prefix to scan
         :param last_modified_time: to filter the files which are later then this date
         :param order_by_time: If true, the final list will be ordered according the last_modified_time,
                                 by default it is False
+        :param start_after: If set, only the keys after this key are listed by S3
         :return: List of S3FileObject
         """
         next_continuation_token = None
         new_files = []
         logging.info(f"Looking in {self._full_path(prefix)}")
         while True:
+            self.recorder.start(metrics.LIST_BUCKET)
             if next_continuation_token:
                 resp = self.s3_client.list_objects_v2(Bucket=self.bucket_name,
                                                       Prefix=prefix,
                                                       ContinuationToken=next_continuation_token,
                                                       )
+            elif start_after:
+                resp = self.s3_client.list_objects_v2(Bucket=self.bucket_name,
+                                                      Prefix=prefix,
+                                                      StartAfter=start_after,
+                                                      )
             else:
                 resp = self.s3_client.list_objects_v2(Bucket=self.bucket_name,
                                                       Prefix=prefix,
                                                       )
+            self.recorder.stop(row_count=len(resp.get("Contents", [])))
             try:
                 for obj in resp["Contents"]:
                     if obj["LastModified"] >= last_modified_time:
                         temp_file_object = S3FileObject(file_path=self._full_path(obj["Key"]),
                                                         last_modified_time=obj["LastModified"],
-                                                        file_size_in_bytes=obj["Size"])
+                                                        file_size_in_bytes=obj["Size"],
+                                                        key=obj["Key"],
+                                                        etag=obj.get("ETag", ""))
                         new_files.append(temp_file_object)
 
                 next_continuation_token = resp["NextContinuationToken"]
@@ -126,6 +191,61 @@ class S3Helper:
 
         return s3_url[5:].split("/", maxsplit=1)
 
+    def parse_csv(self, stream, s3_url=""):
+        """
+        Function to parse a CSV byte stream, gzip and zstd streams are decompressed while they are read
+        :param stream: File like object of bytes
+        :param s3_url: full S3 URl of the file, its extension tells the compression
+        :return: data row
+        """
+        reader = csv.DictReader(codecs.getreader("utf-8")(compression.open_decompressed(stream, key=s3_url)))
+        for row in self.recorder.timed_iter(metrics.PARSE, reader):
+            yield row
+
+    def open_object(self, s3_url):
+        """
+        Function to open an object for reading. With a cache, the object is read from the local disk
+        if its ETag is cached, else it is downloaded to the cache first.
+        :param s3_url: full S3 URl of the file
+        :return: File like object of bytes and the size of the object
+        """
+        bucket, key = self.get_bucket_and_key(s3_url=s3_url)
+        with self.recorder.stage(metrics.GET_OBJECT):
+            stream, size = self._open_object(bucket, key)
+        # The body is downloaded while it is read, the reads are measured as get_object too
+        return self.recorder.timed_stream(metrics.GET_OBJECT, stream), size
+
+    def _open_object(self, bucket, key):
+        """
+        Function to open an object, through the disk cache if there is one
+        :param bucket: Bucket of the object
+        :param key: Key of the object
+        :return: File like object of bytes and the size of the object
+        """
+        if self.cache is None:
+            obj = self.s3_client.get_object(Bucket=bucket, Key=key)
+            return obj["Body"], obj["ContentLength"]
+
+        cached_object = self.cache.get(bucket, key, self.s3_client.head_object(Bucket=bucket, Key=key)["ETag"])
+        if cached_object is not None:
+            return cached_object
+
+        # Cached with the ETag of the downloaded content, the object may have changed since head_object
+        obj = self.s3_client.get_object(Bucket=bucket, Key=key)
+        return self.cache.put(bucket, key, obj["ETag"], obj["Body"])
+
+    def read_object(self, s3_url):
+        """
+        Function to read a whole object in memory
+        :param s3_url: full S3 URl of the file
+        :return: Content of the object in bytes
+        """
+        stream, _ = self.open_object(s3_url)
+        try:
+            return stream.read()
+        finally:
+            stream.close()
+
     def read_csv(self, s3_url):
         """
         Function to read CSV file from the S3
@@ -133,15 +253,193 @@ class S3Helper:
         :return: data row
         """
         try:
-            bucket, key = self.get_bucket_and_key(s3_url=s3_url)
-
-            obj = self.s3_client.get_object(Bucket=bucket, Key=key)
-
-            for row in csv.DictReader(codecs.getreader("utf-8")(obj["Body"])):
-                yield row
+            stream, _ = self.open_object(s3_url)
+            try:
+                for row in self.parse_csv(stream, s3_url=s3_url):
+                    yield row
+            finally:
+                stream.close()
         except ValueError as vrr:
             raise vrr
         except ClientError as cerr:
             raise cerr
         except Exception as err:
             raise err
+
+    def _get_range(self, bucket, key, start, end):
+        """
+        Function to download a byte range of an object
+        :param bucket: Bucket of the object
+        :param key: Key of the object
+        :param start: First byte of the range
+        :param end: Last byte of the range, inclusive
+        :return: bytes
+        """
+        self.recorder.start(metrics.GET_OBJECT)
+        data = b""
+        try:
+            obj = self.s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}")
+            data = obj["Body"].read()
+            return data
+        finally:
+            self.recorder.stop(byte_count=len(data))
+
+    def _read_until_new_line(self, bucket, key, start, object_size):
+        """
+        Function to download from start until the end of the line
+        :param bucket: Bucket of the object
+        :param key: Key of the object
+        :param start: First byte to download
+        :param object_size: Size of the object
+        :return: bytes, including the new line
+        """
+        data = b""
+        while start < object_size:
+            chunk = self._get_range(bucket, key, start, min(start + LINE_LOOKUP_SIZE_IN_BYTES, object_size) - 1)
+            new_line_index = chunk.find(b"\n")
+            if new_line_index != -1:
+                return data + chunk[:new_line_index + 1]
+            data += chunk
+            start += len(chunk)
+        return data
+
+    def _object_size(self, bucket, key):
+        """
+        Function to get the size of an object
+        :param bucket: Bucket of the object
+        :param key: Key of the object
+        :return: Size in bytes
+        """
+        return self.s3_client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+
+    def detect_compression(self, s3_url, object_size):
+        """
+        Function to detect the compression of a file from its extension, or else from its magic bytes
+        :param s3_url: full S3 URl of the file
+        :param object_size: Size of the object, an object smaller than the magic bytes isn't read
+        :return: compression.GZIP, compression.ZSTD or None
+        """
+        bucket, key = self.get_bucket_and_key(s3_url=s3_url)
+        file_compression = compression.compression_from_key(key)
+        if file_compression is not None or object_size < compression.MAGIC_BYTES_LENGTH:
+            return file_compression
+        return compression.compression_from_magic_bytes(
+            self._get_range(bucket, key, 0, compression.MAGIC_BYTES_LENGTH - 1))
+
+    def get_csv_header(self, s3_url, object_size=None):
+        """
+        Function to read the header of a CSV file
+        :param s3_url: full S3 URl of the file
+        :param object_size: Size of the object, read from S3 if None
+        :return: List of field names, offset of the first data row and size of the object
+        """
+        bucket, key = self.get_bucket_and_key(s3_url=s3_url)
+        if object_size is None:
+            object_size = self._object_size(bucket, key)
+        header_line = self._read_until_new_line(bucket, key, 0, object_size)
+        fieldnames = next(csv.reader([header_line.decode("utf-8")]), [])
+        return fieldnames, len(header_line), object_size
+
+    def read_csv_range(self, s3_url, start, end, fieldnames, object_size):
+        """
+        Function to read the CSV rows whose line starts in the byte range [start, end).
+        The ranges of a file can be read independently and together they cover every row once.
+        Rows are split on new lines, so quoted fields must not contain new lines.
+        :param s3_url: full S3 URl of the file
+        :param start: First byte of the range, at or after the header
+        :param end: End of the range, exclusive
+        :param fieldnames: Field names from the header of the file
+        :param object_size: Size of the object
+        :return: List of data rows
+        """
+        bucket, key = self.get_bucket_and_key(s3_url=s3_url)
+        end = min(end, object_size)
+        if start >= end:
+            return []
+
+        # One byte before the range tells if a line starts at the range or the range starts mid line
+        data = self._get_range(bucket, key, start - 1, end - 1)
+        if data[:1] == b"\n":
+            data = data[1:]
+        else:
+            # The partial first line belongs to the previous range
+            new_line_index = data.find(b"\n")
+            if new_line_index == -1:
+                return []
+            data = data[new_line_index + 1:]
+
+        # The last line starts in this range, so it belongs to it even if it ends after the range
+        if data and not data.endswith(b"\n"):
+            data += self._read_until_new_line(bucket, key, end, object_size)
+
+        return list(self.recorder.timed_iter(
+            metrics.PARSE, csv.DictReader(io.StringIO(data.decode("utf-8"), newline=""), fieldnames=fieldnames)))
+
+    def read_csv_part(self, s3_url, start, end):
+        """
+        Function to read the CSV rows whose line starts in the byte range [start, end) of a file,
+        for the jobs of a file split by the Scanner
+        :param s3_url: full S3 URl of the file
+        :param start: First byte of the range, the header is skipped if the range starts at 0
+        :param end: End of the range, exclusive
+        :return: List of data rows
+        """
+        fieldnames, data_start, object_size = self.get_csv_header(s3_url)
+        return self.read_csv_range(s3_url, max(start, data_start), end, fieldnames, object_size)
+
+    def read_csv_ranged(self, s3_url, part_size_in_bytes=67108864, max_workers=4, preserve_order=True):
+        """
+        Function to read a CSV file from the S3 in byte ranges, max_workers ranges at a time.
+        Every range is aligned to the line boundaries and parsed with the header of the file.
+        Files smaller than part_size_in_bytes and compressed files are read with read_csv.
+        :param s3_url: full S3 URl of the file
+        :param part_size_in_bytes: Size of every byte range
+        :param max_workers: Number of ranges downloaded and parsed at the same time
+        :param preserve_order: If True, the rows are in the order of the file,
+                               else the rows of a range are yielded as soon as it is ready
+        :return: data row
+        """
+        bucket, key = self.get_bucket_and_key(s3_url=s3_url)
+        if compression.compression_from_key(key) is not None:
+            # Compressed files can't be split in byte ranges
+            yield from self.read_csv(s3_url)
+            return
+
+        # The size is checked before any range is read, S3 rejects the ranges of an empty object
+        object_size = self._object_size(bucket, key)
+        if (object_size <= max(part_size_in_bytes, compression.MAGIC_BYTES_LENGTH)
+                or compression.compression_from_magic_bytes(
+                    self._get_range(bucket, key, 0, compression.MAGIC_BYTES_LENGTH - 1)) is not None):
+            yield from self.read_csv(s3_url)
+            return
+
+        fieldnames, data_start, object_size = self.get_csv_header(s3_url, object_size=object_size)
+        if object_size - data_start <= part_size_in_bytes:
+            yield from self.read_csv(s3_url)
+            return
+
+        ranges = iter(range(data_start, object_size, part_size_in_bytes))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="s3-range") as executor:
+            def submit_next():
+                start = next(ranges, None)
+                if start is None:
+                    return None
+                return executor.submit(self.read_csv_range, s3_url, start, start + part_size_in_bytes,
+                                       fieldnames, object_size)
+
+            # At most two ranges per worker are in memory
+            pending = [future for future in (submit_next() for _ in range(2 * max_workers)) if future]
+            while pending:
+                if preserve_order:
+                    future = pending.pop(0)
+                else:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    future = done.pop()
+                    pending.remove(future)
+
+                next_future = submit_next()
+                if next_future is not None:
+                    pending.append(next_future)
+
+                for row in future.result():
+                    yield row
@@ -0,0 +1,165 @@
+"""
+Module to prefetch the files of an ETL job.
+While one file is parsed, the next K files are downloaded by a thread pool, so the ETL spends
+its time on the CPU instead of waiting for the first byte of every file.
+The downloaded files are held in memory, bounded by a budget of in flight bytes.
+"""
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from s3_helper import S3Helper
+
+
+class PrefetchClosedError(Exception):
+    """
+    Raised in the download threads once the prefetcher is closed
+    """
+    pass
+
+
+class InFlightBytesBudget:
+    """
+    Class to bound the bytes of the downloaded files held in memory.
+    The budget is granted in the order of the files, so a later file can never take
+    the budget needed by the file the ETL is waiting for.
+    """
+    def __init__(self, max_bytes):
+        """
+        :param max_bytes: Maximum bytes in flight. A file bigger than the budget is still
+                          allowed once nothing else is in flight.
+        """
+        self.max_bytes = max_bytes
+        self.in_flight_bytes = 0
+        self._next_index = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def acquire(self, index, size):
+        """
+        Function to wait until the file with the given index can be held in memory
+        :param index: Index of the file in the job
+        :param size: Size of the file in bytes
+        :return: None
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._closed or (
+                self._next_index == index
+                and (self.in_flight_bytes == 0 or self.in_flight_bytes + size <= self.max_bytes)
+            ))
+            if self._closed:
+                raise PrefetchClosedError("Prefetcher is closed")
+            self.in_flight_bytes += size
+            self._next_index += 1
+            self._condition.notify_all()
+
+    def release(self, size):
+        """
+        Function to release the budget of a processed file
+        :param size: Size of the file in bytes
+        :return: None
+        """
+        with self._condition:
+            self.in_flight_bytes -= size
+            self._condition.notify_all()
+
+    def close(self):
+        """
+        Function to wake up all the waiting downloads, they raise PrefetchClosedError
+        :return: None
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+class S3Prefetcher:
+    """
+    Class to iterate over the files of a job, downloading the next files in the background.
+    Usage:
+        with S3Prefetcher(s3_helper, s3_urls, max_prefetch_files=4) as prefetcher:
+            for s3_url, rows in prefetcher:
+                ...
+    """
+    def __init__(self, s3_helper: S3Helper, s3_urls, max_prefetch_files=4, max_in_flight_bytes=268435456):
+        """
+        :param s3_helper: S3Helper, its client is shared by the download threads
+        :param s3_urls: S3 URLs of the files of the job, in processing order
+        :param max_prefetch_files: Number of files downloaded ahead of the file being processed
+        :param max_in_flight_bytes: Maximum bytes of downloaded files held in memory
+        """
+        self.s3_helper = s3_helper
+        self.s3_urls = list(s3_urls)
+        self.max_prefetch_files = max(max_prefetch_files, 1)
+        self.budget = InFlightBytesBudget(max_in_flight_bytes)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_prefetch_files,
+                                            thread_name_prefix="s3-prefetch")
+        self._futures = {}
+        self._submitted_files = 0
+
+    def _download(self, index, s3_url):
+        """
+        Function to download a file in memory, it runs in the download threads
+        :param index: Index of the file in the job
+        :param s3_url: full S3 URl of the file
+        :return: Content of the file in bytes and the budget it holds
+        """
+        try:
+            stream, size = self.s3_helper.open_object(s3_url)
+        except Exception:
+            # The turn of this file must still pass, else the next files wait forever
+            self.budget.acquire(index, 0)
+            raise
+
+        try:
+            self.budget.acquire(index, size)
+        except Exception:
+            stream.close()
+            raise
+
+        try:
+            return stream.read(), size
+        except Exception:
+            self.budget.release(size)
+            raise
+        finally:
+            stream.close()
+
+    def _submit_until(self, last_index):
+        """
+        Function to start the downloads of all the files until last_index
+        :param last_index: Index of the last file to download
+        :return: None
+        """
+        for index in range(self._submitted_files, min(last_index + 1, len(self.s3_urls))):
+            self._futures[index] = self._executor.submit(self._download, index, self.s3_urls[index])
+            self._submitted_files += 1
+
+    def __iter__(self):
+        """
+        :return: Generator of S3 URL and its rows, the rows of a file must be consumed before the next file
+        """
+        for index, s3_url in enumerate(self.s3_urls):
+            self._submit_until(index + self.max_prefetch_files)
+            data, size = self._futures.pop(index).result()
+            try:
+                yield s3_url, self.s3_helper.parse_csv(io.BytesIO(data), s3_url=s3_url)
+            finally:
+                del data
+                self.budget.release(size)
+
+    def close(self):
+        """
+        Function to stop all the pending downloads
+        :return: None
+        """
+        self.budget.close()
+        for future in self._futures.values():
+            future.cancel()
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
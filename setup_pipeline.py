@@ -13,6 +13,7 @@ from db_helper.etl_metadata_database import ETLMetadataDatabaseConnector
 from db_helper.reporting_database import ReportingDatabaseConnector
 from config_data_classes import DatabaseConfig, S3Config
 from s3_helper import S3Helper
+from local_s3 import LocalS3Client
 
 
 def database_setup(database_cls, database_config):
@@ -40,7 +41,8 @@ def s3_check(s3_config):
     """
     S3Helper(bucket_name=s3_config.BUCKET,
              access_key=s3_config.AWS_ACCESS_KEY,
-             secret_key=s3_config.AWS_SECRET_KEY)
+             secret_key=s3_config.AWS_SECRET_KEY,
+             s3_client=LocalS3Client(s3_config.LOCAL_ROOT_DIR) if s3_config.LOCAL_ROOT_DIR else None)
 
 
 if __name__ == "__main__":
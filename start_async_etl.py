@@ -0,0 +1,51 @@
+"""
+Module to run the asyncio ETL Task.
+It works like start_etl.py, but one process handles ASYNC_ETL_CONCURRENCY jobs at once,
+so a single process can keep the network and the database busy.
+Once this script starts executing, it will run until the process is killed externally.
+The CRON and SLEEP time is setup in the config.yaml.
+"""
+import anyio
+import yaml
+from config_data_classes import DatabaseConfig, S3Config, ETLConfig, PipelineSettings
+from pipeline_tasks import AsyncETLTask
+from croniter import croniter
+from datetime import datetime as dt
+import constants
+from time import sleep
+from logging_setup import get_logger
+
+logging = get_logger()
+
+
+if __name__ == "__main__":
+    logging.info("Async ETL Deployed!")
+    try:
+        # Importing all the configurations
+        with open("config.yaml", "r") as conf_file:
+            config = yaml.safe_load(conf_file)
+
+            _pipeline_settings = PipelineSettings(**config["PIPELINE_SETTINGS"])
+            _etl_db_config = DatabaseConfig(**config["METADATA_DATABASE"])
+            _reporting_db_config = DatabaseConfig(**config["REPORTING_DATABASE"])
+            _s3_config = S3Config(**config["S3"])
+            _etl_config = ETLConfig(**config["ETL"])
+
+            while True:
+                now = dt.now(tz=constants.TZ).replace(second=0).replace(microsecond=0)
+                logging.info(f"Async ETL Now: {now}")
+
+                # Starting ETL tasks
+                if croniter.match(_pipeline_settings.ETL_CRON, now):
+                    logging.info(f"Async ETL Job started @{now}!")
+                    anyio.run(AsyncETLTask(etl_db_config=_etl_db_config,
+                                           reporting_db_config=_reporting_db_config,
+                                           s3_config=_s3_config,
+                                           etl_config=_etl_config).run)
+                else:
+                    logging.info("Async ETL Cron hasn't match yet.")
+
+                sleep(_pipeline_settings.CONSECUTIVE_EXECUTIONS_DELAY_IN_SECOND)
+
+    except KeyError as err:
+        raise err
@@ -4,6 +4,8 @@ Once this script starts executing, it will run until the process is killed exter
 The CRON and SLEEP time is setup in the config.yaml.
 It matches the CRON, and if the CRON matches, it executes the SCANNER task.
 Between two consecutive Scanner CRON check, the process will sleep for CONSECUTIVE_EXECUTIONS_DELAY_IN_SECOND seconds.
+With DAEMON_MODE, the ETL task is built once and polls for the jobs every JOB_POLL_INTERVAL_IN_SECOND instead,
+so a new job is picked up within seconds and the connections are reused by all the jobs.
 """
 import yaml
 from config_data_classes import DatabaseConfig, S3Config, ETLConfig, PipelineSettings
@@ -30,6 +32,16 @@ if __name__ == "__main__":
             _s3_config = S3Config(**config["S3"])
             _etl_config = ETLConfig(**config["ETL"])
 
+            if _pipeline_settings.DAEMON_MODE:
+                etl_task = ETLTask(etl_db_config=_etl_db_config,
+                                   reporting_db_config=_reporting_db_config,
+                                   s3_config=_s3_config,
+                                   etl_config=_etl_config)
+                while True:
+                    # The jobs are claimed again at once after a run which found some
+                    if not etl_task.run():
+                        sleep(_pipeline_settings.JOB_POLL_INTERVAL_IN_SECOND)
+
             while True:
                 now = dt.now(tz=constants.TZ).replace(second=0).replace(microsecond=0)
                 logging.info(f"ETL Now: {now}")
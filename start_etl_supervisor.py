@@ -0,0 +1,39 @@
+"""
+Module to run the ETL supervisor.
+It replaces running NUMBER_OF_ETLS start_etl.py processes: the configuration is loaded once,
+a pool of ETL_WORKERS worker processes is started and the supervisor dispatches the jobs to them.
+Crashed workers are restarted. The throughput of every worker is logged every
+THROUGHPUT_REPORT_INTERVAL_IN_SECOND seconds.
+Once this script starts executing, it will run until the process is killed externally.
+"""
+import yaml
+from config_data_classes import DatabaseConfig, S3Config, ETLConfig, PipelineSettings
+from pipeline_tasks import ETLSupervisor
+from logging_setup import get_logger
+
+logging = get_logger()
+
+
+if __name__ == "__main__":
+    logging.info("ETL Supervisor Deployed!")
+    try:
+        # Importing all the configurations
+        with open("config.yaml", "r") as conf_file:
+            config = yaml.safe_load(conf_file)
+
+        _pipeline_settings = PipelineSettings(**config["PIPELINE_SETTINGS"])
+        _etl_db_config = DatabaseConfig(**config["METADATA_DATABASE"])
+        _reporting_db_config = DatabaseConfig(**config["REPORTING_DATABASE"])
+        _s3_config = S3Config(**config["S3"])
+        _etl_config = ETLConfig(**config["ETL"])
+
+        ETLSupervisor(etl_db_config=_etl_db_config,
+                      reporting_db_config=_reporting_db_config,
+                      s3_config=_s3_config,
+                      etl_config=_etl_config,
+                      number_of_workers=_pipeline_settings.ETL_WORKERS,
+                      poll_interval_in_second=_pipeline_settings.JOB_POLL_INTERVAL_IN_SECOND,
+                      report_interval_in_second=_pipeline_settings.THROUGHPUT_REPORT_INTERVAL_IN_SECOND).run()
+
+    except KeyError as err:
+        raise err
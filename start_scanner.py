@@ -4,11 +4,14 @@ Once this script starts executing, it will run until the process is killed exter
 The CRON and SLEEP time is setup in the config.yaml.
 It matches the CRON, and if the CRON matches, it executes the SCANNER task.
 Between two consecutive Scanner CRON check, the process will sleep for CONSECUTIVE_EXECUTIONS_DELAY_IN_SECOND seconds.
+If an event queue is set in the S3 config, the event driven Scanner runs instead of the CRON,
+it creates the jobs as the files arrive and lists the prefixes every EVENT_RECONCILIATION_INTERVAL_IN_SECOND.
+With DAEMON_MODE, the Scanner task is built once and its connections are reused by all the CRON runs.
 """
 
 import yaml
 from config_data_classes import DatabaseConfig, S3Config, ETLConfig, PipelineSettings
-from pipeline_tasks import ScannerTask
+from pipeline_tasks import ScannerTask, EventScannerTask
 from croniter import croniter
 from datetime import datetime as dt
 import constants
@@ -30,6 +33,18 @@ if __name__ == "__main__":
             _s3_config = S3Config(**config["S3"])
             _etl_config = ETLConfig(**config["ETL"])
 
+            if _s3_config.EVENT_QUEUE_URL or _s3_config.EVENT_QUEUE_LOCAL_DIR:
+                # There should only be 1 Scanner, it runs until the process is killed
+                EventScannerTask(etl_db_config=_etl_db_config,
+                                 s3_config=_s3_config,
+                                 etl_config=_etl_config).run()
+
+            scanner_task = None
+            if _pipeline_settings.DAEMON_MODE:
+                scanner_task = ScannerTask(etl_db_config=_etl_db_config,
+                                           s3_config=_s3_config,
+                                           etl_config=_etl_config)
+
             while True:
                 now = dt.now(tz=constants.TZ).replace(second=0).replace(microsecond=0)
                 logging.info(f"Scanner Now: {now}")
@@ -38,9 +53,9 @@ if __name__ == "__main__":
                 if croniter.match(_pipeline_settings.SCANNER_CRON, now):
                     logging.info(f"Scanner Job started @{now}!")
                     # There should only be 1 Scanner
-                    ScannerTask(etl_db_config=_etl_db_config,
-                                s3_config=_s3_config,
-                                etl_config=_etl_config).run()
+                    (scanner_task or ScannerTask(etl_db_config=_etl_db_config,
+                                                 s3_config=_s3_config,
+                                                 etl_config=_etl_config)).run()
                 else:
                     logging.info("Scanner Cron hasn't match yet.")
 
@@ -0,0 +1,113 @@
+"""
+Fixtures of the tests, the databases are SQLite files and S3 is a local directory served by local_s3.LocalS3Client,
+like the end to end benchmark
+"""
+import csv
+import os
+import random
+from datetime import datetime as dt
+
+import pytest
+
+import constants
+import metrics
+from benchmarks.end_to_end_benchmark import BUCKET, connector_from_url, etl_config_from_args
+from benchmarks.synthetic_loan_data import generate_row
+from db_helper import (ETLMetadataDatabaseConnector, ReportingDatabaseConnector, ScannerTable, ScannerJobFileTable,
+                       ScannerStatusEnum, CSV_HEADER_TO_COLUMN)
+from local_s3 import LocalS3Client
+from pipeline_tasks import ETLTask
+from pipeline_tasks.columnar_cleaner import ColumnarCleaner
+from s3_helper import S3Helper
+
+
+@pytest.fixture
+def s3_root_dir(tmp_path):
+    """
+    Root directory of the local S3, with an empty bucket
+    """
+    root_dir = os.path.join(str(tmp_path), "s3")
+    os.makedirs(os.path.join(root_dir, BUCKET))
+    return root_dir
+
+
+@pytest.fixture
+def s3_client(s3_root_dir):
+    return LocalS3Client(s3_root_dir)
+
+
+@pytest.fixture
+def etl_db(tmp_path):
+    connector = connector_from_url(ETLMetadataDatabaseConnector, f"sqlite:///{tmp_path / 'metadata.db'}")
+    connector.setup_database()
+    return connector
+
+
+@pytest.fixture
+def reporting_db(tmp_path):
+    connector = connector_from_url(ReportingDatabaseConnector, f"sqlite:///{tmp_path / 'raw_data.db'}")
+    connector.setup_database()
+    return connector
+
+
+@pytest.fixture
+def write_loan_file(s3_root_dir):
+    """
+    Factory writing a loan applications CSV file of the given ids in the local S3
+    :return: Function of the key and the ids, returning the S3 URL of the file
+    """
+    def write(key, ids, seed=0):
+        rng = random.Random(seed)
+        path = os.path.join(s3_root_dir, BUCKET, *key.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=list(CSV_HEADER_TO_COLUMN))
+            writer.writeheader()
+            for row_id in ids:
+                row = generate_row(rng, row_id)
+                # generate_row breaks a few ids on purpose, the tests count on every row being loaded
+                row[""] = str(row_id)
+                writer.writerow(row)
+        return f"s3://{BUCKET}/{key}"
+    return write
+
+
+@pytest.fixture
+def create_job(etl_db):
+    """
+    Factory inserting a SENT_FOR_ETL job of the given files, like the Scanner
+    :return: Function of the S3 URLs of the files and the modified time of the job, returning the job id
+    """
+    def create(s3_urls, latest_file_modified_time=None):
+        latest_file_modified_time = latest_file_modified_time or dt.now(tz=constants.TZ)
+        with etl_db.Session.begin() as session:
+            job = ScannerTable(files=constants.MULTI_FILE_PATH_SEPARATOR.join(s3_urls),
+                               latest_file_modified_time=latest_file_modified_time,
+                               total_size_in_bytes=0,
+                               status=ScannerStatusEnum.SENT_FOR_ETL)
+            session.add(job)
+            session.flush()
+            session.add_all([ScannerJobFileTable(job_id=job.id, file_index=file_index, file_path=s3_url,
+                                                 size_in_bytes=0)
+                             for file_index, s3_url in enumerate(s3_urls)])
+            return job.id
+    return create
+
+
+@pytest.fixture
+def make_etl_task(etl_db, reporting_db, s3_client):
+    """
+    Factory creating an ETLTask without calling BaseTask.__init__, which connects to MySQL and S3 from the configs
+    :return: Function of the "NAME=VALUE" ETL settings, returning the ETLTask
+    """
+    def make(*overrides):
+        etl_task = ETLTask.__new__(ETLTask)
+        etl_task.etl_db = etl_db
+        etl_task.reporting_db = reporting_db
+        etl_task.s3_helper = S3Helper(BUCKET, None, None, s3_client=s3_client)
+        etl_task.etl_config = etl_config_from_args(list(overrides))
+        etl_task.columnar_cleaner = ColumnarCleaner()
+        etl_task.recorder = metrics.MetricsRecorder()
+        return etl_task
+    return make
+
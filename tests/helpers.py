@@ -0,0 +1,48 @@
+"""
+Queries of the tests on the SQLite databases
+"""
+import sqlalchemy as db
+
+from db_helper import ScannerTable, LoanApplicationsTable
+
+
+def job_status(etl_db, job_id):
+    """
+    Function to get the status of a job
+    :param etl_db: ETLMetadataDatabaseConnector
+    :param job_id: Job Id
+    :return: ScannerStatusEnum
+    """
+    with etl_db.Session.begin() as session:
+        return session.get(ScannerTable, job_id).status
+
+
+def loaded_ids(reporting_db):
+    """
+    Function to get the ids of loan_applications, with their duplicates
+    :param reporting_db: ReportingDatabaseConnector
+    :return: Sorted list of ids
+    """
+    with reporting_db.Session.begin() as session:
+        return sorted(row_id for row_id, in session.query(LoanApplicationsTable.id))
+
+
+def count_rows(connector, table_name):
+    """
+    Function to count the rows of a table
+    :param connector: ETLMetadataDatabaseConnector or ReportingDatabaseConnector
+    :param table_name: Name of the table
+    :return: Number of rows
+    """
+    with connector.engine.begin() as connection:
+        return connection.execute(db.text(f"SELECT COUNT(*) FROM {table_name}")).scalar()
+
+
+def process_next_job(etl_task):
+    """
+    Function to claim and process the next job
+    :param etl_task: ETLTask
+    :return: Number of rows loaded, None if the job failed
+    """
+    etl_job_row, = etl_task.etl_db.claim_etl_jobs()
+    return etl_task.process_job(etl_job_row)
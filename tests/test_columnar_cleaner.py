@@ -0,0 +1,97 @@
+"""
+Tests of the columnar cleaner, its cleaned rows must be exactly the rows of ETLTask.clean_data
+"""
+import math
+
+import pytest
+
+from benchmarks.clean_data_benchmark import generate_rows, clean_row_by_row, clean_in_batches
+from db_helper import CSV_HEADER_TO_COLUMN
+from pipeline_tasks import ETLTask
+from pipeline_tasks.columnar_cleaner import ColumnarCleaner
+
+
+def same_value(first, second):
+    """
+    Function to compare two cleaned values, NaN is equal to NaN
+    """
+    if isinstance(first, float) and isinstance(second, float) and math.isnan(first) and math.isnan(second):
+        return True
+    return type(first) is type(second) and first == second
+
+
+def loan_row(row_id, **values):
+    """
+    Function to get a CSV row of valid values, with some values replaced
+    :param row_id: Value of the id column
+    :param values: Values of the row by CSV header
+    :return: Row as read by csv.DictReader
+    """
+    row = {header: "1" for header in CSV_HEADER_TO_COLUMN}
+    row[""] = row_id
+    row.update(values)
+    return row
+
+
+@pytest.fixture
+def etl_task():
+    # Cleaning doesn't need any connection, so the task is created without calling BaseTask.__init__
+    etl_task = ETLTask.__new__(ETLTask)
+    etl_task.columnar_cleaner = ColumnarCleaner()
+    return etl_task
+
+
+def assert_same_cleaned_rows(etl_task, rows, batch_size=1000):
+    """
+    Function to check the columnar cleaner cleans the rows like ETLTask.clean_data, row by row
+    :param etl_task: ETLTask
+    :param rows: Rows as read by csv.DictReader
+    :param batch_size: Number of rows cleaned together
+    :return: Cleaned rows
+    """
+    row_result = clean_row_by_row(etl_task, rows)
+    batch_result = clean_in_batches(etl_task, rows, batch_size)
+    assert len(row_result) == len(batch_result)
+    for row_cleaned, batch_cleaned in zip(row_result, batch_result):
+        assert row_cleaned.keys() == batch_cleaned.keys()
+        assert all(same_value(row_cleaned[header], batch_cleaned[header]) for header in row_cleaned), \
+            f"{row_cleaned} != {batch_cleaned}"
+    return batch_result
+
+
+def test_generated_rows_are_cleaned_like_clean_data(etl_task):
+    assert_same_cleaned_rows(etl_task, generate_rows(20000), batch_size=3000)
+
+
+def test_na_strings_are_null(etl_task):
+    cleaned_row, = assert_same_cleaned_rows(etl_task, [loan_row("1", MonthlyIncome="NA", NumberOfDependents="",
+                                                                DebtRatio="NA")])
+    assert (cleaned_row["MonthlyIncome"], cleaned_row["NumberOfDependents"], cleaned_row["DebtRatio"]) == \
+           (None, None, None)
+
+
+def test_bad_ids_and_short_rows_are_invalid(etl_task):
+    short_row = loan_row("4")
+    short_row["age"] = None
+    rows = [loan_row("1"), loan_row("id_in_wrong_format"), loan_row("2.5"), loan_row("3"), short_row]
+
+    cleaned_columns, valid_mask = etl_task.clean_data_batch(rows)
+    assert valid_mask.tolist() == [True, False, False, True, False]
+    assert [cleaned_row[""] for cleaned_row in assert_same_cleaned_rows(etl_task, rows)] == [1, 3]
+
+
+def test_floats_in_int_columns_are_null(etl_task):
+    cleaned_row, = assert_same_cleaned_rows(etl_task, [loan_row("1", age="45.0", MonthlyIncome="1e3",
+                                                                NumberOfTimes90DaysLate="0.5")])
+    assert (cleaned_row["age"], cleaned_row["MonthlyIncome"], cleaned_row["NumberOfTimes90DaysLate"]) == \
+           (None, None, None)
+    # The ints in the float columns are casted
+    assert cleaned_row["DebtRatio"] == 1.0
+
+
+def test_overflowing_values_are_cast_like_clean_data(etl_task):
+    cleaned_row, = assert_same_cleaned_rows(etl_task, [loan_row("1", MonthlyIncome=str(2 ** 70), DebtRatio="1e400",
+                                                                RevolvingUtilizationOfUnsecuredLines="-1e400")])
+    assert cleaned_row["MonthlyIncome"] == 2 ** 70
+    assert cleaned_row["DebtRatio"] == math.inf
+    assert cleaned_row["RevolvingUtilizationOfUnsecuredLines"] == -math.inf
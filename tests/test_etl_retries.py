@@ -0,0 +1,235 @@
+"""
+Tests of the checkpoints and the retries of the streaming ETL jobs
+"""
+from datetime import timedelta as td
+
+import pytest
+from sqlalchemy import select
+
+from db_helper import (ScannerTable, ScannerStatusEnum, LoanApplicationsTable, CSV_HEADER_TO_COLUMN, MINIMUM_AGE,
+                       WORKING_AGE_LIMIT, PAST_DUE_CODES, PAST_DUE_HEADERS, MAX_SKETCH_VALUE, AGE_SKETCH,
+                       WORKING_INCOME_SKETCH, SENIOR_INCOME_SKETCH, DEPENDENTS_SKETCH, MONTHLY_INCOME_BUCKET_WIDTH,
+                       MONTHLY_INCOME_BUCKETS)
+from db_helper.database_connector import now_with_timezone
+from tests.helpers import job_status, loaded_ids, process_next_job
+
+# 2 files of 120 rows flushed every 50 rows, the 4th flush is in the middle of the second file
+STREAMING_SETTINGS = ("STREAMING_FLUSH_ROWS=50", "MAX_JOB_ATTEMPTS=3", "RETRY_BACKOFF_IN_SECOND=0")
+ROWS_PER_FILE = 120
+
+
+def fail_bulk_loads(monkeypatch, etl_task, failing_calls):
+    """
+    Function to make some calls of ETLTask._bulk_load of a task fail
+    :param monkeypatch: pytest monkeypatch fixture
+    :param etl_task: ETLTask
+    :param failing_calls: Numbers of the calls which fail, from 1
+    :return: List of the number of rows of every successful call
+    """
+    bulk_load = etl_task._bulk_load
+    loaded_batches = []
+
+    def failing_bulk_load(rows, **kwargs):
+        if len(loaded_batches) + 1 in failing_calls:
+            failing_calls.remove(len(loaded_batches) + 1)
+            raise ConnectionError("Lost connection to the database")
+        loaded_batches.append(len(rows))
+        return bulk_load(rows, **kwargs)
+
+    monkeypatch.setattr(etl_task, "_bulk_load", failing_bulk_load)
+    return loaded_batches
+
+
+@pytest.fixture
+def streaming_job(write_loan_file, create_job):
+    s3_urls = [write_loan_file("2021/10/08/06/file0.csv", range(1, ROWS_PER_FILE + 1)),
+               write_loan_file("2021/10/08/06/file1.csv", range(ROWS_PER_FILE + 1, 2 * ROWS_PER_FILE + 1), seed=1)]
+    return create_job(s3_urls)
+
+
+def test_failure_mid_file_resumes_from_the_checkpoint(monkeypatch, make_etl_task, streaming_job):
+    etl_task = make_etl_task(*STREAMING_SETTINGS)
+    fail_bulk_loads(monkeypatch, etl_task, failing_calls={4})
+    assert process_next_job(etl_task) is None
+    assert job_status(etl_task.etl_db, streaming_job) == ScannerStatusEnum.FAILED
+
+    checkpoint = etl_task.etl_db.get_job_checkpoint(streaming_job)
+    assert (checkpoint.file_index, checkpoint.row_offset, checkpoint.loaded_rows) == (1, 30, 150)
+    assert checkpoint.failed_attempts == 1
+    assert etl_task.reporting_db.count_staging_rows(streaming_job) == 150
+
+    etl_task = make_etl_task(*STREAMING_SETTINGS)
+    loaded_batches = fail_bulk_loads(monkeypatch, etl_task, failing_calls=set())
+    assert etl_task.schedule_retries() == [streaming_job]
+    assert process_next_job(etl_task) == 2 * ROWS_PER_FILE
+
+    # Only the rows after the checkpoint are read again
+    assert sum(loaded_batches) == 2 * ROWS_PER_FILE - 150
+    assert loaded_ids(etl_task.reporting_db) == list(range(1, 2 * ROWS_PER_FILE + 1))
+    assert job_status(etl_task.etl_db, streaming_job) == ScannerStatusEnum.LOADED
+    assert etl_task.etl_db.get_job_checkpoint(streaming_job) is None
+    assert etl_task.reporting_db.count_staging_rows(streaming_job) is None
+
+
+def expected_sketches(reporting_db):
+    """
+    Function to count the values of the rows of loan_applications like StreamingImputer.impute
+    :param reporting_db: ReportingDatabaseConnector
+    :return: Dictionary of sketch name to dictionary of value to count, like get_imputation_sketches
+    """
+    sketches = {}
+
+    def count(sketch, value):
+        value_counts = sketches.setdefault(sketch, {})
+        value_counts[value] = value_counts.get(value, 0) + 1
+
+    with reporting_db.engine.begin() as connection:
+        for row in connection.execute(select(LoanApplicationsTable.__table__)).mappings():
+            if row["age"] is not None and row["age"] >= MINIMUM_AGE:
+                count(AGE_SKETCH, min(row["age"], MAX_SKETCH_VALUE))
+            if row["monthly_income"] is not None:
+                age = row["age_imputed"]
+                income_sketch = SENIOR_INCOME_SKETCH if age is not None and age > WORKING_AGE_LIMIT \
+                    else WORKING_INCOME_SKETCH
+                count(income_sketch, min(max(int(row["monthly_income"] // MONTHLY_INCOME_BUCKET_WIDTH), 0),
+                                         MONTHLY_INCOME_BUCKETS))
+            if row["number_of_dependents"] is not None:
+                count(DEPENDENTS_SKETCH, min(max(row["number_of_dependents"], 0), MAX_SKETCH_VALUE))
+            for header in PAST_DUE_HEADERS:
+                past_due = row[CSV_HEADER_TO_COLUMN[header]]
+                if past_due is not None and past_due not in PAST_DUE_CODES:
+                    count(CSV_HEADER_TO_COLUMN[header], min(max(past_due, 0), MAX_SKETCH_VALUE))
+    return sketches
+
+
+def test_resumed_job_persists_the_sketches_of_all_its_rows(monkeypatch, make_etl_task, streaming_job):
+    settings = (*STREAMING_SETTINGS, "STREAMING_IMPUTATION=true")
+    etl_task = make_etl_task(*settings)
+    fail_bulk_loads(monkeypatch, etl_task, failing_calls={4})
+    assert process_next_job(etl_task) is None
+
+    etl_task = make_etl_task(*settings)
+    etl_task.schedule_retries()
+    assert process_next_job(etl_task) == 2 * ROWS_PER_FILE
+
+    # The imputer of the retry reads only the rows after the checkpoint
+    sketches = etl_task.reporting_db.get_imputation_sketches()
+    assert sum(sketches[AGE_SKETCH].values()) > 150
+    assert sketches == expected_sketches(etl_task.reporting_db)
+
+
+def test_staging_count_mismatch_reloads_the_job(monkeypatch, make_etl_task, streaming_job):
+    etl_task = make_etl_task(*STREAMING_SETTINGS)
+    fail_bulk_loads(monkeypatch, etl_task, failing_calls={4})
+    assert process_next_job(etl_task) is None
+
+    # e.g. the job failed between a flush and the save of its checkpoint
+    staging_table = etl_task.reporting_db.staging_table_name(streaming_job)
+    with etl_task.reporting_db.engine.begin() as connection:
+        connection.exec_driver_sql(f"DELETE FROM {staging_table} WHERE id = 1")
+    assert etl_task._resumable_checkpoint(streaming_job) is None
+
+    etl_task = make_etl_task(*STREAMING_SETTINGS)
+    loaded_batches = fail_bulk_loads(monkeypatch, etl_task, failing_calls=set())
+    etl_task.schedule_retries()
+    assert process_next_job(etl_task) == 2 * ROWS_PER_FILE
+    assert sum(loaded_batches) == 2 * ROWS_PER_FILE
+    assert loaded_ids(etl_task.reporting_db) == list(range(1, 2 * ROWS_PER_FILE + 1))
+
+
+def test_staging_table_is_dropped_once_the_attempts_are_exhausted(monkeypatch, make_etl_task, streaming_job):
+    settings = ("STREAMING_FLUSH_ROWS=50", "MAX_JOB_ATTEMPTS=2", "RETRY_BACKOFF_IN_SECOND=0")
+    etl_task = make_etl_task(*settings)
+    fail_bulk_loads(monkeypatch, etl_task, failing_calls={2, 3})
+    assert process_next_job(etl_task) is None
+    # Kept for the retry
+    assert etl_task.reporting_db.count_staging_rows(streaming_job) == 50
+
+    assert etl_task.schedule_retries() == [streaming_job]
+    assert process_next_job(etl_task) is None
+    assert etl_task.etl_db.get_job_checkpoint(streaming_job).failed_attempts == 2
+    assert etl_task.reporting_db.count_staging_rows(streaming_job) is None
+    assert etl_task.schedule_retries() == []
+    assert job_status(etl_task.etl_db, streaming_job) == ScannerStatusEnum.FAILED
+
+
+def fail_job(etl_db, job_id, seconds_ago):
+    """
+    Function to claim a job and mark it failed some time ago
+    :param etl_db: ETLMetadataDatabaseConnector
+    :param job_id: Job Id
+    :param seconds_ago: Age of the failure
+    :return: Number of failed attempts of the job
+    """
+    assert [job.id for job in etl_db.claim_etl_jobs()] == [job_id]
+    failed_attempts = etl_db.mark_downloading_from_s3_failed(job_id, err_msg="Lost connection to the database")
+    set_failure_time(etl_db, job_id, seconds_ago)
+    return failed_attempts
+
+
+def set_failure_time(etl_db, job_id, seconds_ago):
+    """
+    Function to move the last failure of a job in the past
+    :param etl_db: ETLMetadataDatabaseConnector
+    :param job_id: Job Id
+    :param seconds_ago: Age of the failure
+    :return: None
+    """
+    with etl_db.Session.begin() as session:
+        (
+            session
+            .query(ScannerTable)
+            .filter(ScannerTable.id == job_id)
+            .update({ScannerTable.modified_time: now_with_timezone() - td(seconds=seconds_ago)})
+        )
+
+
+def test_retries_wait_for_the_backoff_up_to_max_attempts(etl_db, create_job):
+    job_id = create_job(["s3://credit-risk-data/2021/10/08/06/file0.csv"])
+    retry_settings = dict(max_attempts=3, backoff_in_second=60, backoff_multiplier=2, max_backoff_in_second=100)
+
+    assert fail_job(etl_db, job_id, seconds_ago=30) == 1
+    assert etl_db.schedule_failed_job_retries(**retry_settings) == []
+    set_failure_time(etl_db, job_id, seconds_ago=61)
+    assert etl_db.schedule_failed_job_retries(**retry_settings) == [job_id]
+    assert job_status(etl_db, job_id) == ScannerStatusEnum.SENT_FOR_ETL
+
+    # The second backoff is 120 seconds, capped to 100
+    assert fail_job(etl_db, job_id, seconds_ago=90) == 2
+    assert etl_db.schedule_failed_job_retries(**retry_settings) == []
+    set_failure_time(etl_db, job_id, seconds_ago=101)
+    assert etl_db.schedule_failed_job_retries(**retry_settings) == [job_id]
+
+    # The third failure is the last attempt
+    assert fail_job(etl_db, job_id, seconds_ago=3600) == 3
+    assert etl_db.schedule_failed_job_retries(**retry_settings) == []
+    assert job_status(etl_db, job_id) == ScannerStatusEnum.FAILED
+
+
+def test_retries_are_disabled_with_one_attempt(etl_db, create_job):
+    job_id = create_job(["s3://credit-risk-data/2021/10/08/06/file0.csv"])
+    fail_job(etl_db, job_id, seconds_ago=3600)
+    assert etl_db.schedule_failed_job_retries(max_attempts=1, backoff_in_second=0, backoff_multiplier=1,
+                                              max_backoff_in_second=0) == []
+
+
+def test_stopped_worker_releases_the_rest_of_its_batch(monkeypatch, etl_db, make_etl_task, create_job):
+    job_ids = [create_job([f"s3://credit-risk-data/2021/10/08/06/file{file_index}.csv"]) for file_index in range(3)]
+    etl_task = make_etl_task("JOB_CLAIM_BATCH_SIZE=3")
+    processed_job_ids = []
+
+    def interrupted_process_job(etl_job_row):
+        if processed_job_ids:
+            raise KeyboardInterrupt
+        processed_job_ids.append(etl_job_row.id)
+        etl_db.mark_downloading_from_s3_success(job_id=etl_job_row.id)
+
+    monkeypatch.setattr(etl_task, "process_job", interrupted_process_job)
+    with pytest.raises(KeyboardInterrupt):
+        etl_task.run()
+
+    assert processed_job_ids == job_ids[:1]
+    # The job being processed is left to process_job, the jobs not started go back to the other workers
+    assert [job_status(etl_db, job_id) for job_id in job_ids] == [ScannerStatusEnum.LOADED,
+                                                                  ScannerStatusEnum.PROCESSING,
+                                                                  ScannerStatusEnum.SENT_FOR_ETL]
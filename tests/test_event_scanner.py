@@ -0,0 +1,215 @@
+"""
+Tests of the object created events and of the event driven Scanner
+"""
+import json
+import os
+import time
+from datetime import datetime as dt
+
+import pytest
+
+import constants
+from benchmarks.end_to_end_benchmark import BUCKET, etl_config_from_args
+from db_helper import ScannerJobFileTable
+from pipeline_tasks import EventScannerTask
+from s3_events import LocalEventQueue, object_created_event, parse_object_created_events
+from s3_helper import S3Helper
+from tests.helpers import count_rows
+
+EVENT_TIME = dt(2021, 10, 8, 6, 30, 15, 123000, tzinfo=constants.TZ)
+
+
+def test_parse_object_created_event():
+    body = json.dumps(object_created_event(BUCKET, "2021/10/08/06/file0.csv", 1024, etag='"abc"',
+                                           event_time=EVENT_TIME))
+    new_file, = parse_object_created_events(body, bucket=BUCKET)
+    assert new_file.file_path == f"s3://{BUCKET}/2021/10/08/06/file0.csv"
+    assert new_file.key == "2021/10/08/06/file0.csv"
+    assert new_file.file_size_in_bytes == 1024
+    assert new_file.etag == '"abc"'
+    assert new_file.last_modified_time == EVENT_TIME
+
+
+def test_parse_sns_wrapped_event():
+    event = object_created_event(BUCKET, "2021/10/08/06/file0.csv", 1024, event_time=EVENT_TIME)
+    body = {"Type": "Notification", "Message": json.dumps(event)}
+    new_file, = parse_object_created_events(body, bucket=BUCKET)
+    assert new_file.file_path == f"s3://{BUCKET}/2021/10/08/06/file0.csv"
+    assert new_file.etag == ""
+
+
+def test_parse_url_encoded_key():
+    event = object_created_event(BUCKET, "2021/10/08/06/loan+applications%3A1.csv", 1024, event_time=EVENT_TIME)
+    new_file, = parse_object_created_events(event, bucket=BUCKET)
+    assert new_file.key == "2021/10/08/06/loan applications:1.csv"
+    assert new_file.file_path == f"s3://{BUCKET}/2021/10/08/06/loan applications:1.csv"
+
+
+def test_parse_ignores_test_events_and_other_buckets():
+    test_event = {"Service": "Amazon S3", "Event": "s3:TestEvent", "Time": "2021-10-08T06:30:15.123Z",
+                  "Bucket": BUCKET}
+    assert parse_object_created_events(json.dumps(test_event), bucket=BUCKET) == []
+
+    other_bucket_event = object_created_event("other-bucket", "2021/10/08/06/file0.csv", 1024)
+    assert parse_object_created_events(other_bucket_event, bucket=BUCKET) == []
+
+    removed_event = object_created_event(BUCKET, "2021/10/08/06/file0.csv", 1024)
+    removed_event["Records"][0]["eventName"] = "ObjectRemoved:Delete"
+    assert parse_object_created_events(removed_event, bucket=BUCKET) == []
+
+
+def expire_in_flight_messages(event_queue):
+    """
+    Function to make the received messages older than the visibility timeout
+    :param event_queue: LocalEventQueue
+    :return: None
+    """
+    expired_time = time.time() - event_queue.visibility_timeout_in_second - 1
+    for file_name in os.listdir(event_queue.in_flight_dir):
+        os.utime(os.path.join(event_queue.in_flight_dir, file_name), (expired_time, expired_time))
+
+
+@pytest.fixture
+def event_queue(tmp_path):
+    return LocalEventQueue(str(tmp_path / "queue"), visibility_timeout_in_second=60, poll_interval_in_second=0.01)
+
+
+def test_local_queue_receives_a_message_once(event_queue):
+    event_queue.send({"message": 1})
+    event_queue.send({"message": 2})
+
+    messages = event_queue.receive(max_messages=1, wait_time_in_second=0)
+    assert [json.loads(body) for _, body in messages] == [{"message": 1}]
+    messages += event_queue.receive(wait_time_in_second=0)
+    assert [json.loads(body) for _, body in messages] == [{"message": 1}, {"message": 2}]
+    # In flight until the visibility timeout
+    assert event_queue.receive(wait_time_in_second=0) == []
+
+
+def test_local_queue_releases_the_messages_after_the_visibility_timeout(event_queue):
+    event_queue.send({"message": 1})
+    (receipt_handle, _), = event_queue.receive(wait_time_in_second=0)
+
+    expire_in_flight_messages(event_queue)
+    (new_receipt_handle, body), = event_queue.receive(wait_time_in_second=0)
+    assert json.loads(body) == {"message": 1}
+
+    event_queue.delete([new_receipt_handle])
+    expire_in_flight_messages(event_queue)
+    assert event_queue.receive(wait_time_in_second=0) == []
+    # Deleting a message twice only logs a warning
+    event_queue.delete([receipt_handle])
+
+
+@pytest.fixture
+def make_event_scanner_task(etl_db, s3_client, event_queue):
+    """
+    Factory creating an EventScannerTask without calling BaseTask.__init__, which connects to MySQL and S3
+    :return: Function of the "NAME=VALUE" ETL settings, returning the EventScannerTask
+    """
+    def make(*overrides):
+        scanner_task = EventScannerTask.__new__(EventScannerTask)
+        scanner_task.etl_db = etl_db
+        scanner_task.s3_helper = S3Helper(BUCKET, None, None, s3_client=s3_client)
+        # The batch becomes jobs as soon as its events are received
+        scanner_task.etl_config = etl_config_from_args(["EVENT_BATCH_MAX_LATENCY_IN_SECOND=0", *overrides])
+        scanner_task.event_queue = event_queue
+        scanner_task._init_batch()
+        scanner_task.last_reconciliation_time = time.monotonic()
+        return scanner_task
+    return make
+
+
+@pytest.fixture
+def current_hour_files(write_loan_file, s3_client):
+    """
+    Files of the current hour, the prefixes the reconciliation lists
+    :return: Dictionary of key to object created event of the file
+    """
+    events = {}
+    for file_index in range(2):
+        key = f"{dt.now(tz=constants.TZ):%Y/%m/%d/%H}/file{file_index}.csv"
+        write_loan_file(key, range(file_index * 10 + 1, file_index * 10 + 11))
+        head = s3_client.head_object(Bucket=BUCKET, Key=key)
+        events[key] = object_created_event(BUCKET, key, head["ContentLength"], etag=head["ETag"],
+                                           event_time=head["LastModified"])
+    return events
+
+
+def job_file_paths(etl_db):
+    """
+    Function to get the files of every job
+    :param etl_db: ETLMetadataDatabaseConnector
+    :return: List of the lists of file paths of the jobs
+    """
+    with etl_db.Session.begin() as session:
+        job_files = {}
+        for job_file in session.query(ScannerJobFileTable).order_by(ScannerJobFileTable.job_id,
+                                                                     ScannerJobFileTable.file_index):
+            job_files.setdefault(job_file.job_id, []).append(job_file.file_path)
+        return list(job_files.values())
+
+
+def test_duplicate_events_make_one_job_file(etl_db, make_event_scanner_task, event_queue, current_hour_files):
+    key, event = next(iter(current_hour_files.items()))
+    for _ in range(3):
+        event_queue.send(event)
+
+    scanner_task = make_event_scanner_task()
+    scanner_task.run_once()
+    assert job_file_paths(etl_db) == [[f"s3://{BUCKET}/{key}"]]
+
+    # The event is delivered again after the jobs were created
+    event_queue.send(event)
+    scanner_task.run_once()
+    assert job_file_paths(etl_db) == [[f"s3://{BUCKET}/{key}"]]
+
+    expire_in_flight_messages(event_queue)
+    assert event_queue.receive(wait_time_in_second=0) == []
+
+
+def test_reconcile_creates_jobs_of_the_files_without_an_event(etl_db, make_event_scanner_task, event_queue,
+                                                              current_hour_files):
+    (key_with_event, event), (key_without_event, _) = current_hour_files.items()
+    event_queue.send(event)
+
+    scanner_task = make_event_scanner_task()
+    scanner_task.run_once()
+    assert job_file_paths(etl_db) == [[f"s3://{BUCKET}/{key_with_event}"]]
+
+    assert scanner_task.reconcile() == 1
+    assert job_file_paths(etl_db) == [[f"s3://{BUCKET}/{key_with_event}"], [f"s3://{BUCKET}/{key_without_event}"]]
+    assert scanner_task.reconcile() == 0
+
+
+def test_messages_are_deleted_after_the_jobs_are_inserted(monkeypatch, etl_db, make_event_scanner_task, event_queue,
+                                                          current_hour_files):
+    key, event = next(iter(current_hour_files.items()))
+    event_queue.send(event)
+    scanner_task = make_event_scanner_task()
+
+    def failing_create_new_jobs(rows):
+        raise ConnectionError("Lost connection to the database")
+
+    monkeypatch.setattr(etl_db, "create_new_jobs", failing_create_new_jobs)
+    with pytest.raises(ConnectionError):
+        scanner_task.run_once()
+    assert count_rows(etl_db, "scanner_job_files") == 0
+    monkeypatch.undo()
+
+    # The message wasn't deleted, it is received again after the visibility timeout
+    create_new_jobs = etl_db.create_new_jobs
+    in_flight_messages_at_insert = []
+
+    def create_new_jobs_checking_the_queue(rows):
+        in_flight_messages_at_insert.append(len(os.listdir(event_queue.in_flight_dir)))
+        create_new_jobs(rows)
+
+    monkeypatch.setattr(etl_db, "create_new_jobs", create_new_jobs_checking_the_queue)
+    expire_in_flight_messages(event_queue)
+    scanner_task = make_event_scanner_task()
+    scanner_task.run_once()
+
+    assert in_flight_messages_at_insert == [1]
+    assert job_file_paths(etl_db) == [[f"s3://{BUCKET}/{key}"]]
+    assert os.listdir(event_queue.in_flight_dir) == []
@@ -0,0 +1,108 @@
+"""
+Tests of the planning of the ETL jobs of the scanned files
+"""
+import math
+import random
+from datetime import datetime as dt
+from datetime import timedelta as td
+
+import pytest
+
+import constants
+from pipeline_tasks.job_planner import PlannedFile, pack_files, split_file
+from s3_helper import S3FileObject
+
+JOB_SIZE = 1000
+SCAN_TIME = dt(2021, 10, 8, 6, tzinfo=constants.TZ)
+
+
+def scanned_file(index, size_in_bytes, key=None, compression=None):
+    """
+    Function to get a scanned file, the files are modified one second after the other
+    :param index: Index of the file
+    :param size_in_bytes: Size of the file
+    :param key: Key of the file, file<index>.csv if None
+    :param compression: Compression detected from the magic bytes
+    :return: S3FileObject
+    """
+    key = key or f"2021/10/08/06/file{index}.csv"
+    return S3FileObject(file_path=f"s3://credit-risk-data/{key}", last_modified_time=SCAN_TIME + td(seconds=index),
+                        file_size_in_bytes=size_in_bytes, key=key, compression=compression)
+
+
+def planned_files(sizes):
+    """
+    Function to get the planned files of the given sizes
+    :param sizes: Sizes of the files
+    :return: List of PlannedFile
+    """
+    return [PlannedFile(scanned_file=scanned_file(index, size), size_in_bytes=size)
+            for index, size in enumerate(sizes)]
+
+
+def job_sizes(jobs):
+    """
+    Function to get the size of every job
+    :param jobs: List of jobs, every job is a list of PlannedFile
+    :return: List of sizes
+    """
+    return [sum(planned.size_in_bytes for planned in job) for job in jobs]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_jobs_are_within_the_target_size_except_single_oversized_files(seed):
+    rng = random.Random(seed)
+    sizes = [rng.choice([rng.randint(1, 300), rng.randint(300, 900), rng.randint(1000, 3000)]) for _ in range(60)]
+    files = planned_files(sizes)
+    jobs = pack_files(files, JOB_SIZE, max_files_per_job=100)
+
+    assert sorted(planned for job in jobs for planned in job) == sorted(files)
+    for job, size in zip(jobs, job_sizes(jobs)):
+        assert size <= JOB_SIZE or len(job) == 1
+    # Every oversized file is a job of its own
+    assert sum(1 for job in jobs if job_sizes([job])[0] > JOB_SIZE) == sum(1 for size in sizes if size > JOB_SIZE)
+
+
+def test_jobs_are_ordered_by_the_last_modified_time():
+    jobs = pack_files(planned_files([600, 500, 400, 300, 200, 100]), JOB_SIZE, max_files_per_job=100)
+    for job in jobs:
+        assert job == sorted(job)
+    last_modified_times = [job[-1].scanned_file.last_modified_time for job in jobs]
+    assert last_modified_times == sorted(last_modified_times)
+
+
+@pytest.mark.parametrize("max_files_per_job", [1, 2, 3, 7])
+def test_jobs_have_at_most_max_files_per_job(max_files_per_job):
+    files = planned_files([10] * 20)
+    jobs = pack_files(files, JOB_SIZE, max_files_per_job=max_files_per_job)
+    assert max(len(job) for job in jobs) <= max_files_per_job
+    # The small files fill the jobs up to the cap
+    assert len(jobs) == math.ceil(20 / max_files_per_job)
+    assert sum(len(job) for job in jobs) == 20
+
+
+def test_no_files_make_no_jobs():
+    assert pack_files([], JOB_SIZE, max_files_per_job=10) == []
+
+
+@pytest.mark.parametrize("size_in_bytes", [1001, 1999, 2000, 2001, 3333, 10000, 12345])
+def test_split_ranges_cover_the_file_exactly(size_in_bytes):
+    ranges = split_file(scanned_file(0, size_in_bytes), size_in_bytes, JOB_SIZE)
+
+    assert len(ranges) > 1
+    assert ranges[0].range_start == 0
+    assert ranges[-1].range_end == size_in_bytes
+    for previous_range, next_range in zip(ranges, ranges[1:]):
+        # No gap and no overlap
+        assert previous_range.range_end == next_range.range_start
+    for planned_range in ranges:
+        assert 0 < planned_range.size_in_bytes == planned_range.range_end - planned_range.range_start <= JOB_SIZE
+
+
+@pytest.mark.parametrize("scanned", [scanned_file(0, 5000, key="2021/10/08/06/file0.csv.gz"),
+                                     scanned_file(0, 5000, key="2021/10/08/06/file0", compression="gzip"),
+                                     scanned_file(0, 800)])
+def test_compressed_and_small_files_are_planned_whole(scanned):
+    planned_file, = split_file(scanned, scanned.file_size_in_bytes, JOB_SIZE)
+    assert (planned_file.range_start, planned_file.range_end) == (None, None)
+    assert planned_file.size_in_bytes == scanned.file_size_in_bytes
@@ -0,0 +1,62 @@
+"""
+Tests of the pipelined execution of the ETL jobs
+"""
+import pytest
+
+from benchmarks.end_to_end_benchmark import BUCKET
+from db_helper import ScannerStatusEnum
+from s3_prefetcher import InFlightBytesBudget
+from tests.helpers import job_status, loaded_ids, process_next_job
+
+ROWS_PER_FILE = 100
+
+
+def record_in_flight_bytes(monkeypatch):
+    """
+    Function to record the bytes in flight of the InFlightBytesBudget after every acquire
+    :param monkeypatch: pytest monkeypatch fixture
+    :return: List of the bytes in flight, appended to while the job runs
+    """
+    acquire = InFlightBytesBudget.acquire
+    in_flight_bytes = []
+
+    def recording_acquire(budget, index, size):
+        acquire(budget, index, size)
+        in_flight_bytes.append(budget.in_flight_bytes)
+
+    monkeypatch.setattr(InFlightBytesBudget, "acquire", recording_acquire)
+    return in_flight_bytes
+
+
+@pytest.fixture
+def pipelined_job(write_loan_file, create_job):
+    return create_job([write_loan_file(f"2021/10/08/06/file{file_index}.csv",
+                                       range(file_index * ROWS_PER_FILE + 1, (file_index + 1) * ROWS_PER_FILE + 1),
+                                       seed=file_index)
+                       for file_index in range(6)])
+
+
+def test_downloaded_files_stay_within_the_budget(monkeypatch, s3_client, make_etl_task, pipelined_job):
+    file_size = s3_client.head_object(Bucket=BUCKET, Key="2021/10/08/06/file0.csv")["ContentLength"]
+    in_flight_bytes = record_in_flight_bytes(monkeypatch)
+    # Room for 2 files, the 4 download workers and the queues could hold all of them
+    max_in_flight_bytes = int(file_size * 2.5)
+    etl_task = make_etl_task("PIPELINED_EXECUTION=true", "PIPELINE_DOWNLOAD_WORKERS=4", "PIPELINE_QUEUE_SIZE=8",
+                             f"PREFETCH_MAX_IN_FLIGHT_BYTES={max_in_flight_bytes}")
+
+    assert process_next_job(etl_task) == 6 * ROWS_PER_FILE
+    assert loaded_ids(etl_task.reporting_db) == list(range(1, 6 * ROWS_PER_FILE + 1))
+    assert len(in_flight_bytes) == 6
+    assert max(in_flight_bytes) <= max_in_flight_bytes
+
+
+def test_failed_stage_wakes_up_the_downloads_waiting_for_the_budget(monkeypatch, make_etl_task, pipelined_job):
+    # One file at a time, the downloads wait for the parse of the previous file
+    etl_task = make_etl_task("PIPELINED_EXECUTION=true", "PREFETCH_MAX_IN_FLIGHT_BYTES=1")
+
+    def failing_load_batch(staging_table, reporting_rows):
+        raise ConnectionError("Lost connection to the database")
+
+    monkeypatch.setattr(etl_task, "_load_batch", failing_load_batch)
+    assert process_next_job(etl_task) is None
+    assert job_status(etl_task.etl_db, pipelined_job) == ScannerStatusEnum.FAILED
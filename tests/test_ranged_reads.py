@@ -0,0 +1,70 @@
+"""
+Tests of the reads of the CSV files in byte ranges aligned to the line boundaries
+"""
+import os
+
+import pytest
+
+from benchmarks.end_to_end_benchmark import BUCKET
+from s3_helper import S3Helper
+
+HEADER = ",SeriousDlqin2yrs,age,MonthlyIncome"
+LINES = [f"{row_id},{row_id % 2},{20 + row_id},{'NA' if row_id % 3 == 0 else row_id * 1000}"
+         for row_id in range(1, 13)]
+
+
+@pytest.fixture
+def s3_helper(s3_client):
+    return S3Helper(BUCKET, None, None, s3_client=s3_client)
+
+
+def write_file(s3_root_dir, key, line_terminator):
+    """
+    Function to write the CSV file of the LINES in the local S3
+    :param s3_root_dir: Root directory of the local S3
+    :param key: Key of the file
+    :param line_terminator: New line of the file, \n or \r\n
+    :return: S3 URL of the file and the positions of the first byte of every line after the header
+    """
+    content = line_terminator.join([HEADER, *LINES]) + line_terminator
+    with open(os.path.join(s3_root_dir, BUCKET, key), "wb") as file:
+        file.write(content.encode("utf-8"))
+    line_starts = [len(line_terminator.join([HEADER, *LINES[:index]])) + len(line_terminator)
+                   for index in range(len(LINES))]
+    return f"s3://{BUCKET}/{key}", line_starts
+
+
+@pytest.mark.parametrize("line_terminator", ["\n", "\r\n"])
+def test_ranged_rows_match_read_csv_at_every_boundary(s3_root_dir, s3_helper, line_terminator):
+    s3_url, line_starts = write_file(s3_root_dir, "file.csv", line_terminator)
+    expected_rows = list(s3_helper.read_csv(s3_url))
+    assert [row[""] for row in expected_rows] == [str(row_id) for row_id in range(1, len(LINES) + 1)]
+
+    data_size = os.path.getsize(os.path.join(s3_root_dir, BUCKET, "file.csv")) - line_starts[0]
+    boundaries = set()
+    # Every part size puts the boundaries of the ranges at other bytes: mid line, inside the \r\n,
+    # on the new line and at the first byte of a line
+    for part_size in range(1, data_size):
+        boundaries.update(range(line_starts[0] + part_size, line_starts[0] + data_size, part_size))
+        rows = list(s3_helper.read_csv_ranged(s3_url, part_size_in_bytes=part_size, max_workers=3,
+                                              preserve_order=True))
+        assert rows == expected_rows, f"part size {part_size}"
+
+        unordered_rows = list(s3_helper.read_csv_ranged(s3_url, part_size_in_bytes=part_size, max_workers=3,
+                                                        preserve_order=False))
+        assert sorted(unordered_rows, key=lambda row: int(row[""])) == expected_rows, f"part size {part_size}"
+
+    new_lines = {line_start - 1 for line_start in line_starts[1:]}
+    assert boundaries & set(line_starts[1:]) and boundaries & new_lines
+    if line_terminator == "\r\n":
+        assert boundaries & {new_line - 1 for new_line in new_lines}
+
+
+def test_part_of_a_split_file_reads_the_lines_starting_in_it(s3_root_dir, s3_helper):
+    s3_url, line_starts = write_file(s3_root_dir, "file.csv", "\r\n")
+    # From the middle of the first line to the new line of the third one
+    rows = s3_helper.read_csv_part(s3_url, line_starts[0] + 2, line_starts[3] - 1)
+    assert [row[""] for row in rows] == ["2", "3"]
+    # The first part starts at 0 and skips the header
+    rows = s3_helper.read_csv_part(s3_url, 0, line_starts[1])
+    assert [row[""] for row in rows] == ["1"]
@@ -0,0 +1,125 @@
+"""
+Tests of the job and hourly aggregates kept up to date by the merge of the staging tables
+"""
+from datetime import datetime as dt
+from datetime import timedelta as td
+
+import pytest
+from sqlalchemy import func, select
+
+import constants
+from db_helper import LoanApplicationsTable, LoanApplicationIdsTable, JobLoanAggregatesTable
+from tests.helpers import loaded_ids, process_next_job
+
+HOUR = dt(2021, 10, 8, 6)
+
+
+@pytest.fixture
+def load_job(make_etl_task, write_loan_file, create_job):
+    """
+    Factory writing a file of the given ids and loading it in a job of an ingest hour
+    :return: Function of the ids, the ingest hour and the seed of the values, returning the job id
+    """
+    def load(ids, ingest_hour=HOUR, seed=0):
+        s3_url = write_loan_file(f"{ingest_hour:%Y/%m/%d/%H}/file{seed}.csv", ids, seed=seed)
+        job_id = create_job([s3_url], latest_file_modified_time=ingest_hour.replace(minute=30, tzinfo=constants.TZ))
+        assert process_next_job(make_etl_task()) == len(ids)
+        return job_id
+    return load
+
+
+def expected_summary(reporting_db):
+    """
+    Function to compute the rows and the delinquent rows of loan_applications, to compare with the aggregates
+    :param reporting_db: ReportingDatabaseConnector
+    :return: Tuple of the number of rows and the number of delinquent rows
+    """
+    loan_table = LoanApplicationsTable.__table__
+    with reporting_db.engine.begin() as connection:
+        return tuple(connection.execute(
+            select(func.count(), func.sum(loan_table.c.serious_dlqin_2_yrs))
+        ).one())
+
+
+def job_rows(reporting_db):
+    """
+    Function to get the number of rows of the aggregates of every job
+    :param reporting_db: ReportingDatabaseConnector
+    :return: Dictionary of job id to number of rows
+    """
+    job_table = JobLoanAggregatesTable.__table__
+    with reporting_db.engine.begin() as connection:
+        return dict(connection.execute(
+            select(job_table.c.job_id, func.sum(job_table.c.row_count)).group_by(job_table.c.job_id)
+        ).all())
+
+
+def ingest_hours(reporting_db, table):
+    """
+    Function to get the ingest hour of every id of a table
+    :param reporting_db: ReportingDatabaseConnector
+    :param table: LoanApplicationsTable or LoanApplicationIdsTable
+    :return: Dictionary of id to ingest hour
+    """
+    with reporting_db.engine.begin() as connection:
+        return dict(connection.execute(select(table.__table__.c.id, table.__table__.c.ingest_hour)).all())
+
+
+def summary(aggregates):
+    """
+    Function to get the rows and the delinquent rows of all the bands of the aggregates
+    :param aggregates: Result of ReportingDatabaseConnector.get_aggregates
+    :return: Tuple of the number of rows and the number of delinquent rows
+    """
+    all_bands = aggregates["all"]
+    delinquent_rows = round(all_bands["delinquency_rate"] * (all_bands["rows"]
+                                                             * (1 - all_bands["na_rates"]["serious_dlqin_2_yrs"])))
+    return all_bands["rows"], delinquent_rows
+
+
+def test_ids_delivered_again_by_another_job_are_counted_once(reporting_db, load_job):
+    first_job = load_job(range(1, 101))
+    second_job = load_job(range(51, 151), seed=1)
+
+    assert loaded_ids(reporting_db) == list(range(1, 151))
+    assert summary(reporting_db.get_aggregates(HOUR, HOUR + td(hours=1))) == expected_summary(reporting_db)
+    # The rows 51 to 100 are counted in the job which loaded them last
+    assert job_rows(reporting_db) == {first_job: 50, second_job: 100}
+
+
+def test_retried_job_is_counted_once(reporting_db, make_etl_task, load_job):
+    job_id = load_job(range(1, 101))
+    # Loaded again, e.g. the job failed after its merge
+    make_etl_task().etl_db.mark_downloading_from_s3_failed(job_id, err_msg="Lost connection to the database")
+    assert make_etl_task("MAX_JOB_ATTEMPTS=2", "RETRY_BACKOFF_IN_SECOND=0").schedule_retries() == [job_id]
+    assert process_next_job(make_etl_task()) == 100
+
+    assert summary(reporting_db.get_aggregates(HOUR, HOUR + td(hours=1))) == expected_summary(reporting_db)
+    assert job_rows(reporting_db) == {job_id: 100}
+
+
+def test_ids_loaded_again_in_another_hour_move_to_that_hour(reporting_db, load_job):
+    first_job = load_job(range(1, 101))
+    second_job = load_job(range(51, 151), ingest_hour=HOUR + td(hours=1), seed=1)
+
+    assert loaded_ids(reporting_db) == list(range(1, 151))
+    assert reporting_db.get_aggregates(HOUR, HOUR + td(hours=1))["all"]["rows"] == 50
+    assert reporting_db.get_aggregates(HOUR + td(hours=1), HOUR + td(hours=2))["all"]["rows"] == 100
+    assert summary(reporting_db.get_aggregates(HOUR, HOUR + td(hours=2))) == expected_summary(reporting_db)
+    assert job_rows(reporting_db) == {first_job: 50, second_job: 100}
+    # The merges find the rows they replace by their ingest hour in the ids table
+    assert ingest_hours(reporting_db, LoanApplicationIdsTable) == ingest_hours(reporting_db, LoanApplicationsTable)
+
+
+def test_truncated_and_reloaded_hour_is_counted_once_in_the_sketches(reporting_db, load_job):
+    load_job(range(1, 101))
+    load_job(range(101, 151), ingest_hour=HOUR + td(hours=1), seed=1)
+    sketches = reporting_db.get_imputation_sketches()
+
+    reporting_db.truncate_ingest_hour(HOUR)
+    assert loaded_ids(reporting_db) == list(range(101, 151))
+    assert sum(reporting_db.get_imputation_sketches()["age"].values()) == 50
+    load_job(range(1, 101))
+
+    assert reporting_db.get_imputation_sketches() == sketches
+    assert ingest_hours(reporting_db, LoanApplicationIdsTable) == ingest_hours(reporting_db, LoanApplicationsTable)
@@ -0,0 +1,46 @@
+"""
+Tests of the S3 disk cache
+"""
+import io
+import os
+
+import metrics
+from s3_cache import S3DiskCache, shared_disk_cache
+
+BUCKET = "credit-risk-data"
+
+
+def test_tasks_of_a_process_share_the_cache_of_a_directory(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    cache = shared_disk_cache(cache_dir, max_size_in_bytes=1024)
+    # e.g. the task built again on the next cron tick
+    assert shared_disk_cache(cache_dir, max_size_in_bytes=2048) is cache
+    assert cache.max_size_in_bytes == 2048
+    assert [registered_cache for registered_cache in metrics.EXPORTER.caches.values()
+            if registered_cache.cache_dir == cache.cache_dir] == [cache]
+
+
+def test_a_new_cache_replaces_the_exported_cache_of_its_directory(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    S3DiskCache(cache_dir, max_size_in_bytes=1024)
+    cache = S3DiskCache(cache_dir, max_size_in_bytes=1024)
+    assert metrics.EXPORTER.caches[cache_dir] is cache
+
+
+def test_file_evicted_after_it_is_mapped_is_a_hit(monkeypatch, tmp_path):
+    cache = S3DiskCache(str(tmp_path / "cache"), max_size_in_bytes=1024)
+    cached_file, _ = cache.put(BUCKET, "2021/10/08/06/file0.csv", '"abc"', io.BytesIO(b"id,age\n1,45\n"))
+    cached_file.close()
+    memory_map = S3DiskCache._memory_map
+
+    def memory_map_then_evict(path):
+        mapped_file = memory_map(path)
+        # e.g. the eviction of another process
+        os.remove(path)
+        return mapped_file
+
+    monkeypatch.setattr(S3DiskCache, "_memory_map", staticmethod(memory_map_then_evict))
+    cached_file, size = cache.get(BUCKET, "2021/10/08/06/file0.csv", '"abc"')
+    assert cached_file.read() == b"id,age\n1,45\n"
+    assert size == len(b"id,age\n1,45\n")
+    assert (cache.hits, cache.misses) == (1, 0)
@@ -0,0 +1,53 @@
+"""
+Tests of the prefetcher of the files of a job, against the local S3
+"""
+from benchmarks.end_to_end_benchmark import BUCKET
+from s3_helper import S3Helper
+from s3_prefetcher import S3Prefetcher, InFlightBytesBudget
+
+ROWS_PER_FILE = 50
+
+
+def record_in_flight_bytes(monkeypatch):
+    """
+    Function to record the bytes in flight of the InFlightBytesBudget after every acquire
+    :param monkeypatch: pytest monkeypatch fixture
+    :return: List of the size of the acquired file and the bytes in flight, appended to while the files are read
+    """
+    acquire = InFlightBytesBudget.acquire
+    in_flight_bytes = []
+
+    def recording_acquire(budget, index, size):
+        acquire(budget, index, size)
+        in_flight_bytes.append((size, budget.in_flight_bytes))
+
+    monkeypatch.setattr(InFlightBytesBudget, "acquire", recording_acquire)
+    return in_flight_bytes
+
+
+def test_files_come_out_in_job_order_within_the_budget(monkeypatch, s3_client, write_loan_file):
+    # The third file is 4 times bigger than the others, and bigger than the budget
+    file_rows = [ROWS_PER_FILE, ROWS_PER_FILE, 4 * ROWS_PER_FILE, ROWS_PER_FILE, ROWS_PER_FILE, ROWS_PER_FILE]
+    s3_urls = []
+    first_id = 1
+    for file_index, rows in enumerate(file_rows):
+        s3_urls.append(write_loan_file(f"2021/10/08/06/file{file_index}.csv", range(first_id, first_id + rows),
+                                       seed=file_index))
+        first_id += rows
+    file_size = s3_client.head_object(Bucket=BUCKET, Key="2021/10/08/06/file0.csv")["ContentLength"]
+    max_in_flight_bytes = int(file_size * 2.5)
+    in_flight_bytes = record_in_flight_bytes(monkeypatch)
+
+    s3_helper = S3Helper(BUCKET, None, None, s3_client=s3_client)
+    with S3Prefetcher(s3_helper, s3_urls, max_prefetch_files=4,
+                      max_in_flight_bytes=max_in_flight_bytes) as prefetcher:
+        files = [(s3_url, [int(row[""]) for row in rows]) for s3_url, rows in prefetcher]
+
+    assert [s3_url for s3_url, _ in files] == s3_urls
+    assert [row_id for _, row_ids in files for row_id in row_ids] == list(range(1, sum(file_rows) + 1))
+    assert len(in_flight_bytes) == len(s3_urls)
+    for size, in_flight in in_flight_bytes:
+        # A file bigger than the budget is only read once nothing else is in flight
+        assert in_flight <= max_in_flight_bytes or in_flight == size
+    assert max(size for size, _ in in_flight_bytes) > max_in_flight_bytes
+    assert prefetcher.budget.in_flight_bytes == 0